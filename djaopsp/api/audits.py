@@ -205,8 +205,7 @@ class VerifiedStatsAPIView(CompletionRateMixin, generics.RetrieveAPIView):
         }
 
     def retrieve(self, request, *args, **kwargs):
-        resp = self.get_response_data(request, *args, **kwargs)
-        return http.Response(resp)
+        return http.Response(self.response_data)
 
 
 def completed_verified_by_week(grantee, campaign=None,
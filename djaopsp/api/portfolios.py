@@ -2,11 +2,13 @@
 # see LICENSE.
 #pylint:disable=too-many-lines
 
-import datetime, json, logging, re
+import datetime, hashlib, logging, re
 from collections import OrderedDict
 
 from dateutil.relativedelta import relativedelta
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.db import connection
 from django.db.models import F, JSONField, Q, Max, Min, TextField
 from django.db.models.functions import Cast
@@ -38,7 +40,9 @@ from .campaigns import CampaignDecorateMixin
 from .. import humanize
 from ..compat import gettext_lazy as _, reverse, six
 from ..helpers import as_percentage
-from ..queries import (get_latest_frozen_by_portfolio_by_period, get_engagement,
+from ..queries import (get_cohorts_members,
+    get_latest_frozen_by_portfolio_by_campaign,
+    get_latest_frozen_by_portfolio_by_period, get_engagement,
     get_engagement_by_reporting_status, get_requested_by_accounts_by_period,
     segments_as_sql)
 from ..mixins import (AccountMixin, AccountsDateRangeMixin,
@@ -46,8 +50,8 @@ from ..mixins import (AccountMixin, AccountsDateRangeMixin,
     DateRangeContextMixin)
 from ..models import ScorecardCache, VerifiedSample
 from ..pagination import AccessiblesPagination
-from ..utils import (TransparentCut, get_alliances, get_latest_reminders,
-    get_segments_candidates)
+from ..utils import (TransparentCut, get_alliances, get_campaign_extra,
+    get_latest_reminders, get_segments_candidates)
 from .rollups import GraphMixin, RollupMixin, ScoresMixin
 from .serializers import (AccessiblesSerializer, CompareNodeSerializer,
     EngagementSerializer, ReportingSerializer)
@@ -63,6 +67,9 @@ class DashboardAggregateMixin(AccountsAggregatedQuerysetMixin):
     scale = 1
     serializer_class = MetricsSerializer
     title = ""
+    # Views returning the exact same payload (ex: an API and its .pptx
+    # download) can share the cached payload by setting the same key.
+    dashboard_key = None
 
     def get_reporting_scorecards(self, account=None, start_at=None,
                                  ends_at=None, aggregate_set=False):
@@ -129,6 +136,47 @@ INNER JOIN survey_sample
             return None
         return [val[0] for val in aggregate]
 
+    def get_response_data_cache_key(self):
+        """
+        Returns the key under which the payload computed by
+        `get_response_data` is cached for the same view, account
+        and filters.
+        """
+        # Two views share a payload only when they explicitly set
+        # the same `dashboard_key`.
+        dashboard_key = self.dashboard_key
+        if not dashboard_key:
+            resolver_match = getattr(self.request, 'resolver_match', None)
+            dashboard_key = "%s.%s|%s" % (
+                self.__class__.__module__, self.__class__.__name__,
+                resolver_match.url_name if resolver_match
+                else self.request.path)
+        scorecards_version = ScorecardCache.objects.aggregate(
+            Max('pk'))['pk__max']
+        return 'dashboard:%s' % hashlib.sha256(("%s|%s|%s|%s|%s" % (
+            dashboard_key, self.account.pk,
+            sorted(self.kwargs.items()), sorted(self.request.GET.lists()),
+            scorecards_version)).encode('utf-8')).hexdigest()
+
+    @property
+    def response_data(self):
+        """
+        Payload returned by `get_response_data`, computed at most once
+        per request, and reused across requests for
+        `settings.DASHBOARD_CACHE_TIMEOUT` seconds.
+        """
+        if not hasattr(self, '_response_data'):
+            #pylint:disable=attribute-defined-outside-init
+            timeout = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 0)
+            cache_key = self.get_response_data_cache_key() if timeout else None
+            self._response_data = cache.get(cache_key) if cache_key else None
+            if self._response_data is None:
+                self._response_data = self.get_response_data(
+                    self.request, **self.kwargs)
+                if cache_key:
+                    cache.set(cache_key, self._response_data, timeout)
+        return self._response_data
+
     def get_response_data(self, request, *args, **kwargs):
         #pylint:disable=unused-argument
         account_aggregate = self.get_aggregate(
@@ -522,39 +570,61 @@ class TotalScoreBySubsectorAPIView(RollupMixin, GraphMixin, SupplierListMixin,
         return accounts
 
     def get_score_weight(self, path):
-        #pylint:disable=attribute-defined-outside-init
-        if not hasattr(self, '_weights'):
-            try:
-                self._weights = json.loads(self.campaign.extra)
-            except (TypeError, ValueError):
-                self._weights = {}
-        return self._weights.get(path, 1.0)
+        return get_campaign_extra(self.campaign).extra.get(path, 1.0)
 
 
+    @property
+    def editable_filters_slugs(self):
+        """
+        Slugs of all `EditableFilter`, loaded once such that finding
+        a likely metric for a cohort does not require a query per cohort.
+        """
+        #pylint:disable=attribute-defined-outside-init
+        if not hasattr(self, '_editable_filters_slugs'):
+            self._editable_filters_slugs = set(
+                EditableFilter.objects.values_list('slug', flat=True))
+        return self._editable_filters_slugs
+
     def aggregate_scores(self, metric, cohorts, cut=None, accounts=None):
-        #pylint:disable=unused-argument
+        #pylint:disable=unused-argument,too-many-locals
         if accounts is None:
             accounts = get_account_model().objects.all()
-        scores = {}
         rollup_tree = self.rollup_scores(self.get_queryset())
         rollup_scores = self.get_drilldown(rollup_tree, metric.slug)
+
+        # All cohorts membership is resolved in a single query, then
+        # the average score for each cohort is computed in a single pass
+        # over the (account_id, cohort_id) pairs.
+        cohorts_by_pks = {}
+        rollup_scores_by_cohorts = {}
         for cohort in cohorts:
-            score = 0
             if isinstance(cohort, EditableFilter):
+                cohorts_by_pks[cohort.pk] = cohort
                 if metric.slug == 'totals':
                     # Hard-coded: on the totals matrix we want to use
                     # a different metric for each cohort/column shown.
                     rollup_scores = self.get_drilldown(
                         rollup_tree, self.as_metric_candidate(cohort.slug))
-                includes, excludes = cohort.as_kwargs()
-                nb_accounts = 0
-                for account in accounts.filter(**includes).exclude(**excludes):
-                    account_score = rollup_scores.get(account.pk, None)
-                    if account_score is not None:
-                        score += account_score.get('normalized_score', 0)
-                        nb_accounts += 1
+                rollup_scores_by_cohorts[cohort.pk] = rollup_scores
+        aggregates = {cohort_pk: [0, 0] for cohort_pk in cohorts_by_pks}
+        for account_id, cohort_pk in get_cohorts_members(
+                list(six.itervalues(cohorts_by_pks)), accounts):
+            account_score = rollup_scores_by_cohorts[cohort_pk].get(
+                account_id, None)
+            if account_score is not None:
+                aggregate = aggregates[cohort_pk]
+                aggregate[0] += account_score.get('normalized_score', 0)
+                aggregate[1] += 1
+
+        scores = {}
+        rollup_scores = self.get_drilldown(rollup_tree, metric.slug)
+        for cohort in cohorts:
+            score = 0
+            if isinstance(cohort, EditableFilter):
+                rollup_scores = rollup_scores_by_cohorts[cohort.pk]
+                total_score, nb_accounts = aggregates[cohort.pk]
                 if nb_accounts > 0:
-                    score = score / nb_accounts
+                    score = total_score / nb_accounts
             else:
                 account = cohort
                 account_score = rollup_scores.get(account.pk, None)
@@ -569,13 +639,9 @@ class TotalScoreBySubsectorAPIView(RollupMixin, GraphMixin, SupplierListMixin,
             default = self.matrix.slug
         likely_metric = None
         look = re.match(r"(\S+)(-\d+)$", cohort_slug)
-        if look:
-            try:
-                likely_metric = reverse('matrix_chart', args=(self.account,
-                    self.campaign,
-                    EditableFilter.objects.get(slug=look.group(1)).slug,))
-            except EditableFilter.DoesNotExist:
-                pass
+        if look and look.group(1) in self.editable_filters_slugs:
+            likely_metric = reverse('matrix_chart', args=(self.account,
+                self.campaign, look.group(1),))
         if likely_metric is None:
             # XXX default is derived from `prefix` argument
             # to `decorate_with_scores`.
@@ -672,9 +738,11 @@ class TotalScoreBySubsectorAPIView(RollupMixin, GraphMixin, SupplierListMixin,
                 DB_PATH_SEP: (totals[0], natural_charts)}
             charts = self.get_charts(rollup_tree)
             self._report_queries("get_charts completed")
+            elements = {element.slug: element
+                for element in PageElement.objects.filter(
+                    slug__in=[chart['slug'] for chart in charts])}
             for chart in charts:
-                element = PageElement.objects.filter(
-                    slug=chart['slug']).first()
+                element = elements.get(chart['slug'])
                 chart.update({
                     'breadcrumbs': [chart['title']],
                     'picture': element.picture if element is not None else None,
@@ -1602,6 +1670,9 @@ class PortfolioEngagementAPIView(PortfolioEngagementMixin,
 
 class CompletionRateMixin(DashboardAggregateMixin):
 
+    # Shared by the API and the .pptx download.
+    dashboard_key = 'completion-rate'
+
     def get_aggregate(self, account=None, labels=None,
                       aggregate_set=False, years=0):
         #pylint:disable=unused-argument,too-many-locals
@@ -1764,12 +1835,14 @@ class CompletionRateAPIView(CompletionRateMixin, generics.RetrieveAPIView):
         }
     """
     def retrieve(self, request, *args, **kwargs):
-        return http.Response(self.get_response_data(request, *args, **kwargs))
+        return http.Response(self.response_data)
 
 
 class EngagementStatsMixin(DashboardAggregateMixin):
 
     title = "Engagement"
+    # Shared by the API and the .pptx download.
+    dashboard_key = 'engagement-stats'
 
     def get_aggregate(self, account=None, labels=None,
                       aggregate_set=False):
@@ -1895,8 +1968,7 @@ class EngagementStatsAPIView(EngagementStatsMixin, generics.RetrieveAPIView):
         }
     """
     def retrieve(self, request, *args, **kwargs):
-        resp = self.get_response_data(request, *args, **kwargs)
-        return http.Response(resp)
+        return http.Response(self.response_data)
 
 
 class LastByCampaignAccessiblesMixin(TimersMixin, DateRangeContextMixin,
@@ -1958,10 +2030,10 @@ class LastByCampaignAccessiblesMixin(TimersMixin, DateRangeContextMixin,
         filtered_in = Q(extra__contains='searchable')
         for visible in set(['public']):
             filtered_in &= Q(extra__contains=visible)
-        dashboards_available = Campaign.objects.filter(
+        dashboards_available = list(Campaign.objects.filter(
             Q(portfolios__grantee=self.account) |
             Q(account__slug=self.account) |
-            filtered_in).exclude(slug__endswith='-verified').distinct()
+            filtered_in).exclude(slug__endswith='-verified').distinct())
         self.labels = [{
             'slug': campaign.slug,
             'title': campaign.title,
@@ -1969,39 +2041,41 @@ class LastByCampaignAccessiblesMixin(TimersMixin, DateRangeContextMixin,
                 self.account, campaign))}
             for campaign in dashboards_available]
 
-        for campaign in dashboards_available:
-            samples_by_account_ids = {}
-            samples = Sample.objects.get_latest_frozen_by_portfolios(
-                campaign=campaign, start_at=self.start_at, ends_at=self.ends_at,
-                accounts=page, grantees=[self.account],
-                tags=[]).prefetch_related('scorecard_cache')
-            verified = {val.sample_id: val for val in
-                VerifiedSample.objects.filter(sample__in=samples)}
+        # We resolve the latest sample for every (account, campaign) pair
+        # in a single query instead of one query per campaign.
+        samples_by_campaign_account_ids = {}
+        requested_by_campaign_accounts = {}
+        if page:
+            samples = get_latest_frozen_by_portfolio_by_campaign(
+                dashboards_available, [self.account], accounts=page,
+                start_at=self.start_at, ends_at=self.ends_at
+            ).prefetch_related('scorecard_cache')
             for sample in samples:
-                if (sample.state == humanize.REPORTING_COMPLETED and
-                    sample.id in verified):
-                    sample.state = humanize.REPORTING_VERIFIED
-                if sample.account_id not in samples_by_account_ids:
-                    samples_by_account_ids[sample.account_id] = []
-                samples_by_account_ids[sample.account_id] += [sample]
-
-            requested_by_accounts = {}
+                key = (sample.campaign_id, sample.account_id)
+                if key not in samples_by_campaign_account_ids:
+                    samples_by_campaign_account_ids[key] = []
+                samples_by_campaign_account_ids[key] += [sample]
+
             for optin in get_requested_by_accounts_by_period(
-                    campaign, page, self.account,
+                    dashboards_available, page, self.account,
                     start_at=self.start_at, ends_at=self.ends_at):
-                if optin.account_id not in requested_by_accounts:
-                    requested_by_accounts[optin.account_id] = set([])
-                requested_by_accounts[optin.account_id] |= set([
+                key = (optin.campaign_id, optin.account_id)
+                if key not in requested_by_campaign_accounts:
+                    requested_by_campaign_accounts[key] = set([])
+                requested_by_campaign_accounts[key] |= set([
                     optin.created_at])
 
+        for campaign in dashboards_available:
             for account in page:
                 if not hasattr(account, 'values'):
                     account.values = []
-                if account.pk in samples_by_account_ids:
-                    account.values += samples_by_account_ids[account.pk]
+                key = (campaign.pk, account.pk)
+                if key in samples_by_campaign_account_ids:
+                    account.values += samples_by_campaign_account_ids[key]
                 else:
                     account.values += [self.as_sample(
-                        self.ends_at, requested_by_accounts.get(account.pk, []),
+                        self.ends_at,
+                        requested_by_campaign_accounts.get(key, []),
                         account.created_at)]
 
         # Merge portfolio extra field into account extra field.
@@ -34,9 +34,12 @@ from ..pagination import BenchmarksPagination
 from ..queries import get_scored_assessments
 from ..reminders import send_reminders
 from ..scores import (freeze_scores, get_score_calculator,
-    get_top_normalized_score, populate_scorecard_cache)
+    get_top_normalized_score, populate_scorecard_cache,
+    update_population_stats)
 from ..signals import sample_frozen
-from ..utils import get_practice_serializer, get_scores_tree, get_score_weight
+from ..utils import (get_practice_serializer, get_scores_tree,
+    get_score_weight, populate_highlights_cache,
+    populate_segments_answered_cache, populate_summary_performance)
 from .campaigns import CampaignDecorateMixin
 from .rollups import GraphMixin, RollupMixin
 from .serializers import (AssessmentContentSerializer,
@@ -193,6 +196,12 @@ class AssessmentCompleteAPIView(SectionReportMixin, TimersMixin,
             self._report_queries("freezing assessment: %s completed" %
                 str(frozen_assessment_sample))
 
+            # Statistics on peers for questions outside the scored
+            # segments are updated once all segments were frozen.
+            update_population_stats(frozen_assessment_sample,
+                [seg.get('path') for seg in self.segments_available
+                 if seg.get('path')])
+
             # Populate the scorecard caches
             for segment in self.segments_available:
                 segment_path = segment.get('path')
@@ -203,6 +212,10 @@ class AssessmentCompleteAPIView(SectionReportMixin, TimersMixin,
                         populate_scorecard_cache(
                             frozen_assessment_sample, calculator,
                             segment_path, segment_title)
+            populate_highlights_cache(frozen_assessment_sample)
+            populate_segments_answered_cache(frozen_assessment_sample)
+            if frozen_improvement_sample:
+                populate_summary_performance(frozen_improvement_sample)
             self._report_queries("freezing assessment: scorecard cache created")
 
         # After a sample is frozen, send the signal.
@@ -11,6 +11,7 @@ from survey.models import Campaign, EnumeratedQuestions, Unit
 from survey.utils import get_content_model, get_question_model
 
 from .compat import StringIO
+from .utils import rebuild_segments_index
 
 
 LOGGER = logging.getLogger(__name__)
@@ -56,6 +57,7 @@ def import_campaign(campaign, file_d):
         # follow on rows could be heading or practice
         _import_campaign_section(campaign, rows, [segments],
             content_model=content_model)
+        rebuild_segments_index(campaign)
 
 
 def _import_campaign_segments(campaign, cols, content_model=None):
@@ -2,11 +2,15 @@
 # see LICENSE.
 from __future__ import unicode_literals
 
-import csv, io, math
+import csv, io, math, tempfile
+from collections import OrderedDict
 
 # importing `survey.mixins.TimersMixin` results in an import loop:
 #   cannot import name 'get_object_or_404' from 'rest_framework.generics'??
 from deployutils.apps.django_deployutils.mixins.timers import TimersMixin
+from django.conf import settings
+from django.db import connection
+from django.http import FileResponse
 from rest_framework.renderers import BaseRenderer
 from openpyxl import Workbook
 from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
@@ -14,11 +18,123 @@ from openpyxl.styles.borders import BORDER_THIN
 from openpyxl.styles.fills import FILL_SOLID
 from openpyxl.utils import get_column_letter
 from pages.helpers import get_extra
+from survey.models import Choice, Unit
 
 from ..compat import force_str, six
 from ..helpers import as_valid_sheet_title
 
 
+def get_chunked_cursor():
+    """
+    Returns a cursor that fetches rows from the database in chunks
+    (i.e. a server-side cursor) unless server-side cursors are disabled
+    for the database (ex: behind pgbouncer in transaction pooling mode),
+    the same way `QuerySet.iterator()` does.
+    """
+    if connection.settings_dict.get('DISABLE_SERVER_SIDE_CURSORS'):
+        return connection.cursor()
+    return connection.chunked_cursor()
+
+
+def get_spooled_file():
+    """
+    Returns a temporary file to write a download into. The content is kept
+    in memory until it grows over `settings.DOWNLOAD_SPOOL_MAX_SIZE` bytes,
+    then it is rolled over to disk.
+    """
+    return tempfile.SpooledTemporaryFile(max_size=getattr(
+        settings, 'DOWNLOAD_SPOOL_MAX_SIZE', 8 * 1024 * 1024))
+
+
+def as_attachment_response(content, filename, content_type):
+    """
+    Returns a response that streams `content`, a file returned
+    by `get_spooled_file`, as an attachment named `filename`.
+
+    The Content-Length is set from the size of `content`. The file is
+    closed, hence deleted, when the response is closed, including when
+    the client disconnects before the end of the download.
+    """
+    content.seek(0)
+    return FileResponse(content, as_attachment=True, filename=filename,
+        content_type=content_type)
+
+
+class ChoicesDecoder(object):
+    """
+    Decodes the `measured` field of answers into the text of the `Choice`
+    it refers to, for answers whose unit is not numerical.
+
+    Choices of enumerated units are loaded once per unit. Choices of other
+    units (ex: freetext) are unique to an answer, so they are preloaded
+    in bulk from a queryset of answers through `preload`. Choices
+    that were not preloaded are fetched one at a time and kept in
+    a bounded LRU cache.
+    """
+    max_size = 1024
+
+    def __init__(self, max_size=None):
+        if max_size is not None:
+            self.max_size = max_size
+        self._choices_by_units = {}
+        self._texts = {}
+        self._lru = OrderedDict()
+
+    def preload(self, answers):
+        """
+        Loads all choices necessary to decode `answers` in two queries,
+        regardless of the number of answers.
+        """
+        enum_units = answers.filter(
+            unit__system=Unit.SYSTEM_ENUMERATED).values('unit_id')
+        for unit_id, choice_id, text in Choice.objects.filter(
+                unit_id__in=enum_units).values_list('unit_id', 'pk', 'text'):
+            self._choices_by_units.setdefault(unit_id, {}).update({
+                choice_id: text})
+        measured = answers.exclude(
+            unit__system__in=Unit.NUMERICAL_SYSTEMS + [
+                Unit.SYSTEM_ENUMERATED]).values('measured')
+        self._texts.update(dict(Choice.objects.filter(
+            pk__in=measured).values_list('pk', 'text')))
+
+    def get_choices(self, unit):
+        choices = self._choices_by_units.get(unit.pk)
+        if choices is None:
+            choices = dict(Choice.objects.filter(
+                unit=unit).values_list('pk', 'text'))
+            self._choices_by_units.update({unit.pk: choices})
+        return choices
+
+    def get_text(self, choice_id):
+        text = self._texts.get(choice_id)
+        if text is not None:
+            return text
+        try:
+            text = self._lru.pop(choice_id)
+        except KeyError:
+            text = Choice.objects.filter(pk=choice_id).values_list(
+                'text', flat=True).first()
+            if len(self._lru) >= self.max_size:
+                self._lru.popitem(last=False)
+        self._lru[choice_id] = text
+        return text
+
+    def decode(self, unit, measured, text=None):
+        """
+        Returns the value of an answer as written in an export.
+
+        When the text of the choice was already resolved (ex: through
+        a join in SQL), `text` is returned as-is.
+        """
+        if text:
+            return text
+        if unit is None or unit.system in Unit.NUMERICAL_SYSTEMS:
+            return measured
+        if unit.system == Unit.SYSTEM_ENUMERATED:
+            return self.get_choices(unit).get(measured)
+        return self.get_text(measured)
+
+
 class CSVDownloadRenderer(BaseRenderer):
     """
     As CVS file
@@ -68,6 +184,26 @@ class CSVDownloadRenderer(BaseRenderer):
         content.seek(0)
         return content
 
+    def stream(self, results, renderer_context=None):
+        """
+        Yields the CSV file for `results` one line at a time, such that
+        it can be sent through a `StreamingHttpResponse` while `results`
+        are still being generated.
+        """
+        if six.PY2:
+            content = io.BytesIO()
+        else:
+            content = io.StringIO(newline='')
+        csv_writer = csv.writer(content)
+        headings = self.get_headings(renderer_context=renderer_context)
+        csv_writer.writerow([self.encode(head) for head in headings])
+        for entry in results:
+            yield content.getvalue()
+            content.seek(0)
+            content.truncate(0)
+            csv_writer.writerow(self.format_row(entry))
+        yield content.getvalue()
+
 
 class XLSXRenderer(TimersMixin, BaseRenderer):
 
@@ -138,6 +274,67 @@ class XLSXRenderer(TimersMixin, BaseRenderer):
         return self.flush_writer(wbook)
 
 
+class CellSizesEstimator(object):
+    """
+    Estimates the height of rows in a worksheet as the rows are written,
+    such that sizes can be set at the end without reading back every cell
+    of the worksheet.
+
+    Rows and columns are indexed from 1, as in `openpyxl`.
+    """
+    default_height = 12.5
+    default_font_size = 11
+    minimum_width = 10.0
+
+    def __init__(self):
+        self.nb_columns = 0
+        # For each row, the (column, line lengths) of cells with a value.
+        self.rows = []
+        self.font_sizes = {}
+
+    def add_row(self, row):
+        cells = []
+        for col_idx, value in enumerate(row, start=1):
+            if value is not None:
+                cells += [(col_idx,
+                    [len(val) for val in str(value).split('\n')])]
+        self.rows += [cells]
+        self.nb_columns = max(self.nb_columns, len(row))
+
+    def set_font_size(self, row_idx, col_idx, size):
+        self.font_sizes.update({(row_idx, col_idx): size})
+
+    def set_cell_sizes(self, wsheet):
+        """
+        Widens columns of `wsheet` to `minimum_width` and increases
+        the height of rows such that their text fits.
+        """
+        col_widths = {}
+        for col_idx in range(1, self.nb_columns + 1):
+            dimension = wsheet.column_dimensions[get_column_letter(col_idx)]
+            if not dimension.width or dimension.width < self.minimum_width:
+                dimension.width = self.minimum_width
+            col_widths.update({col_idx: dimension.width})
+
+        max_height = self.default_height * 10
+        for row_idx, cells in enumerate(self.rows, start=1):
+            new_height = self.default_height
+            for col_idx, line_lengths in cells:
+                col_width = col_widths[col_idx]
+                font_size = self.font_sizes.get(
+                    (row_idx, col_idx), self.default_font_size)
+                mul = 0
+                for line_length in line_lengths:
+                    mul += math.ceil(line_length / col_width) * font_size
+                new_height = max(new_height, mul)
+            original_height = wsheet.row_dimensions[row_idx].height
+            if original_height is None:
+                original_height = self.default_height
+            if original_height < new_height:
+                wsheet.row_dimensions[row_idx].height = min(
+                    new_height, max_height)
+
+
 class PracticesXLSXRenderer(TimersMixin, BaseRenderer):
 
     add_style = True
@@ -226,6 +423,11 @@ class PracticesXLSXRenderer(TimersMixin, BaseRenderer):
         else:
             self.wsheet = self.wbook.create_sheet(
                 as_valid_sheet_title(title))
+        self.cell_sizes = CellSizesEstimator()
+
+    def writerow(self, row):
+        self.wsheet.append(row)
+        self.cell_sizes.add_row(row)
 
     def flush_writer(self, wbook):
         self.optimal_cell_sizes()
@@ -242,7 +444,7 @@ class PracticesXLSXRenderer(TimersMixin, BaseRenderer):
         view = renderer_context.get('view')
         intrinsic_value_headers = view.intrinsic_value_headers
 
-        self.wsheet.append(self.get_title())
+        self.writerow(self.get_title())
         super_headers = []
         nb_peer_value_headers = 0
         nb_intrinsic_value_headers = 0
@@ -263,7 +465,7 @@ class PracticesXLSXRenderer(TimersMixin, BaseRenderer):
             super_headers = ([
                 "" for unused in range(0, len(self.base_headers))] +
                 super_headers)
-            self.wsheet.append(super_headers)
+            self.writerow(super_headers)
             if nb_peer_value_headers:
                 first_col = chr(ord('A') + len(self.base_headers))
                 last_col = chr(ord('A') + len(self.base_headers) +
@@ -275,7 +477,7 @@ class PracticesXLSXRenderer(TimersMixin, BaseRenderer):
                 last_col = chr(ord('A') + len(self.base_headers) +
                     nb_peer_value_headers + nb_intrinsic_value_headers - 1)
                 self.wsheet.merge_cells('%s1:%s1' % (first_col, last_col))
-        self.wsheet.append(headers)
+        self.writerow(headers)
 
     def write_sheet(self, queryset=None, title="", key=None,
                     renderer_context=None):
@@ -289,7 +491,7 @@ class PracticesXLSXRenderer(TimersMixin, BaseRenderer):
             "headers written in sheet '%s'" % title)
         start_row = self.wsheet.max_row
         for entry in queryset:
-            self.wsheet.append(self.format_row(entry, key=key))
+            self.writerow(self.format_row(entry, key=key))
         self._report_queries("rows written in sheet '%s'" % title)
 
         if self.add_style:
@@ -355,8 +557,10 @@ class PracticesXLSXRenderer(TimersMixin, BaseRenderer):
                 first_cell.alignment = first_col_alignments[indent]
                 if self.is_practice(entry):
                     first_cell.font = practice_font
+                    self.cell_sizes.set_font_size(idx, 1, practice_font.size)
                 else:
                     first_cell.font = heading_font
+                    self.cell_sizes.set_font_size(idx, 1, heading_font.size)
                     if not indent:
                         for row_cells in self.wsheet.iter_rows(
                                 min_row=idx, max_row=idx):
@@ -399,44 +603,4 @@ class PracticesXLSXRenderer(TimersMixin, BaseRenderer):
         return self.flush_writer(self.wbook)
 
     def optimal_cell_sizes(self):
-        #pylint:disable=too-many-locals
-        iter_rows = self.wsheet.iter_rows()
-        if iter_rows != tuple():
-            col_width = []
-
-            for i in range(len(next(iter_rows))):
-                col_letter = get_column_letter(i + 1)
-
-                minimum_width = 10.0
-                current_width = self.wsheet.column_dimensions[col_letter].width
-                if not current_width or current_width < minimum_width:
-                    self.wsheet.column_dimensions[col_letter].width = \
-                        minimum_width
-                col_width.append(
-                    self.wsheet.column_dimensions[col_letter].width)
-
-            for i, row in enumerate(self.wsheet):
-                default_height = 12.5
-
-                multiples_of_font_size = [default_height]
-                for j, cell in enumerate(row):
-                    if cell.value is not None:
-                        mul = 0
-                        for val in str(cell.value).split('\n'):
-                            mul += math.ceil(
-                                len(val) / col_width[j]) * cell.font.size
-
-                        if mul > 0:
-                            multiples_of_font_size.append(mul)
-
-                original_height = self.wsheet.row_dimensions[i+1].height
-                if original_height is None:
-                    original_height = default_height
-
-                new_height = max(multiples_of_font_size)
-                max_height = default_height * 10
-                if original_height < new_height:
-                    if new_height < max_height:
-                        self.wsheet.row_dimensions[i + 1].height = new_height
-                    else:
-                        self.wsheet.row_dimensions[i + 1].height = max_height
+        self.cell_sizes.set_cell_sizes(self.wsheet)
@@ -0,0 +1,264 @@
+# Copyright (c) 2026, DjaoDjin inc.
+# see LICENSE.
+
+"""
+Columnar (Parquet) downloads of answers, scorecards and engagement
+
+Parquet files are written through `pyarrow` when it is installed. Rows
+are read from a server-side cursor and written in row groups of
+`batch_size` rows such that the whole dataset is never held in memory.
+"""
+import logging
+
+from django.http import Http404
+from rest_framework.generics import ListAPIView
+from survey.api.matrix import AccessiblesAccountsMixin, EngagedAccountsMixin
+from survey.helpers import datetime_or_now
+
+from ..compat import gettext_lazy as _
+from ..models import ScorecardCache
+from ..queries import get_engagement, sql_answers_by_accounts
+from .base import (as_attachment_response, get_chunked_cursor,
+    get_spooled_file)
+from .reporting import AnswersDownloadMixin
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 10000
+
+# Columns are defined as (name, type) where type is one of 'int', 'float',
+# 'string', 'datetime', 'bool' or 'dictionary' (i.e. dictionary-encoded
+# strings, used for paths and units which repeat across rows).
+ANSWERS_COLUMNS = (
+    ('path', 'dictionary'),
+    ('account_id', 'int'),
+    ('measured', 'int'),
+    ('unit_id', 'int'),
+    ('default_unit_id', 'int'),
+    ('unit', 'dictionary'),
+    ('text', 'string'),
+)
+
+SCORECARDS_COLUMNS = (
+    ('path', 'dictionary'),
+    ('account_id', 'int'),
+    ('sample_id', 'int'),
+    ('normalized_score', 'int'),
+    ('nb_na_answers', 'int'),
+    ('nb_planned_improvements', 'int'),
+    ('reporting_publicly', 'bool'),
+    ('reporting_fines', 'bool'),
+    ('reporting_environmental_fines', 'bool'),
+    ('reporting_energy_consumption', 'bool'),
+    ('reporting_water_consumption', 'bool'),
+    ('reporting_ghg_generated', 'bool'),
+    ('reporting_waste_generated', 'bool'),
+    ('reporting_energy_target', 'bool'),
+    ('reporting_water_target', 'bool'),
+    ('reporting_ghg_target', 'bool'),
+    ('reporting_waste_target', 'bool'),
+)
+
+ENGAGEMENT_COLUMNS = (
+    ('account_id', 'int'),
+    ('slug', 'string'),
+    ('printable_name', 'string'),
+    ('grantee_id', 'int'),
+    ('reporting_status', 'int'),
+    ('requested_at', 'datetime'),
+    ('last_activity_at', 'datetime'),
+    ('sample_id', 'int'),
+)
+
+
+def is_parquet_available():
+    return pyarrow is not None
+
+
+def _as_arrow_type(column_type):
+    if column_type == 'int':
+        return pyarrow.int64()
+    if column_type == 'float':
+        return pyarrow.float64()
+    if column_type == 'bool':
+        return pyarrow.bool_()
+    if column_type == 'datetime':
+        return pyarrow.timestamp('us', tz='UTC')
+    if column_type == 'dictionary':
+        return pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+    return pyarrow.string()
+
+
+def _as_record_batch(schema, columns, rows):
+    arrays = []
+    for idx, (unused_name, column_type) in enumerate(columns):
+        values = [row[idx] for row in rows]
+        if column_type == 'datetime':
+            # sqlite3 returns datetimes as strings.
+            values = [datetime_or_now(val) if val else None for val in values]
+        if column_type == 'dictionary':
+            arrays += [pyarrow.array(
+                values, type=pyarrow.string()).dictionary_encode()]
+        else:
+            arrays += [pyarrow.array(
+                values, type=schema.field(idx).type)]
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_parquet(sink, columns, batches):
+    """
+    Writes `batches`, an iterable of lists of row tuples matching `columns`,
+    as a Parquet file into `sink`. Each batch becomes a row group.
+
+    Returns the number of rows written.
+    """
+    schema = pyarrow.schema([(name, _as_arrow_type(column_type))
+        for name, column_type in columns])
+    nb_rows = 0
+    with pyarrow.parquet.ParquetWriter(sink, schema,
+        use_dictionary=[name for name, column_type in columns
+            if column_type == 'dictionary']) as writer:
+        for rows in batches:
+            if rows:
+                writer.write_batch(_as_record_batch(schema, columns, rows))
+                nb_rows += len(rows)
+    return nb_rows
+
+
+def iter_sql_batches(sql_query, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Yields rows returned by `sql_query` in lists of at most `batch_size`
+    rows, fetched through a server-side cursor when the database supports it.
+    """
+    with get_chunked_cursor() as cursor:
+        cursor.execute(sql_query, params=None)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+
+
+def iter_queryset_batches(queryset, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Yields the tuples returned by a `values_list` queryset in lists
+    of at most `batch_size` rows.
+    """
+    rows = []
+    for row in queryset.iterator(chunk_size=batch_size):
+        rows += [row]
+        if len(rows) >= batch_size:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+def get_answers_batches(latest_samples, prefix=None, verified=False,
+                        batch_size=DEFAULT_BATCH_SIZE):
+    try:
+        # We might have a `RawQuerySet` so we can't blindly use `.exists()`
+        unused_first_sample = latest_samples[0]
+    except IndexError:
+        return iter([])
+    return iter_sql_batches(sql_answers_by_accounts(
+        latest_samples.query.sql, prefix=prefix, verified=verified),
+        batch_size=batch_size)
+
+
+def get_scorecards_batches(latest_samples, batch_size=DEFAULT_BATCH_SIZE):
+    return iter_queryset_batches(ScorecardCache.objects.filter(
+        sample__in=[sample.pk for sample in latest_samples]).order_by(
+        'path', 'sample__account_id').values_list(
+        *[name if name != 'account_id' else 'sample__account_id'
+          for name, unused_type in SCORECARDS_COLUMNS]),
+        batch_size=batch_size)
+
+
+def get_engagement_batches(campaign, accounts, grantees,
+                           start_at=None, ends_at=None,
+                           batch_size=DEFAULT_BATCH_SIZE):
+    if not accounts:
+        return iter([])
+    return iter_sql_batches("SELECT %(columns)s FROM (%(engagement_sql)s)"\
+        " AS engagement ORDER BY account_id" % {
+        'columns': ', '.join([name for name, unused_type
+            in ENGAGEMENT_COLUMNS]),
+        'engagement_sql': get_engagement(campaign, accounts,
+            start_at=start_at, ends_at=ends_at, grantees=grantees).query.sql},
+        batch_size=batch_size)
+
+
+class AnswersParquetView(AnswersDownloadMixin, ListAPIView):
+    """
+    Download answers, scorecards or engagement as a Parquet file.
+
+    The table written is selected through the `table` query parameter
+    (i.e. 'answers', 'scorecards' or 'engagement'). It defaults to 'answers'.
+    """
+    basename = 'answers'
+    content_type = 'application/vnd.apache.parquet'
+    batch_size = DEFAULT_BATCH_SIZE
+
+    def get_filename(self, table):
+        return datetime_or_now().strftime(
+            '%s-%s-%%Y%%m%%d.parquet' % (self.basename, table))
+
+    def get(self, request, *args, **kwargs):
+        #pylint:disable=unused-argument
+        if not is_parquet_available():
+            raise Http404(_("Parquet downloads require pyarrow."))
+        self._start_time()
+        table = self.get_query_param('table', 'answers')
+        if table == 'scorecards':
+            columns = SCORECARDS_COLUMNS
+            batches = get_scorecards_batches(self.latest_assessments,
+                batch_size=self.batch_size)
+        elif table == 'engagement':
+            columns = ENGAGEMENT_COLUMNS
+            batches = get_engagement_batches(self.campaign,
+                [account.pk for account in self.engaged_accounts],
+                [self.account], start_at=self.start_at, ends_at=self.ends_at,
+                batch_size=self.batch_size)
+        else:
+            table = 'answers'
+            columns = ANSWERS_COLUMNS
+            batches = get_answers_batches(self.latest_improvements
+                if self.show_planned else self.latest_assessments,
+                verified=self.show_verified, batch_size=self.batch_size)
+
+        content = get_spooled_file()
+        nb_rows = write_parquet(content, columns, batches)
+        self._report_queries("wrote %d rows of %s" % (nb_rows, table))
+        return as_attachment_response(content, self.get_filename(table),
+            self.content_type)
+
+
+class AccessiblesAnswersParquetView(AccessiblesAccountsMixin,
+                                    AnswersParquetView):
+    """
+    Download answers, scorecards or engagement of accessible accounts
+    as a Parquet file.
+
+    GET /app/<slug:profile>/reporting/<slug:campaign>/accessibles/download/raw/parquet/
+    """
+    basename = 'track-answers'
+
+    search_fields = (
+        'full_name',
+    )
+
+
+class EngagedAnswersParquetView(EngagedAccountsMixin, AnswersParquetView):
+    """
+    Download answers, scorecards or engagement of engaged accounts
+    as a Parquet file.
+    """
+    basename = 'engage-answers'
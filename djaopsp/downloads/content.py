@@ -1,20 +1,18 @@
 # Copyright (c) 2026, DjaoDjin inc.
 # see LICENSE.
-import io, math
 
-from django.http import HttpResponse
 from openpyxl import Workbook
 from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
 from openpyxl.styles.borders import BORDER_THIN
 from openpyxl.styles.fills import FILL_SOLID
-from openpyxl.utils import get_column_letter
 from pages.api.elements import PageElementAPIView
 from survey.api.base import QuestionListAPIView
 from survey.helpers import datetime_or_now
 from survey.mixins import TimersMixin
 from survey.models import Unit
 
-from .base import PracticesXLSXRenderer
+from .base import (CellSizesEstimator, PracticesXLSXRenderer,
+    as_attachment_response, get_spooled_file)
 from ..compat import gettext_lazy as _
 from ..helpers import as_valid_sheet_title
 
@@ -63,6 +61,7 @@ class PracticesSpreadsheetView(TimersMixin, QuestionListAPIView):
         super(PracticesSpreadsheetView, self).__init__(*args)
         self.wbook = None
         self.wsheet = None
+        self.cell_sizes = None
 
     # Methods to be redefined in subclasses
     def get_title(self):
@@ -147,23 +146,24 @@ class PracticesSpreadsheetView(TimersMixin, QuestionListAPIView):
         else:
             self.wsheet = self.wbook.create_sheet(
                 as_valid_sheet_title(title))
+        self.cell_sizes = CellSizesEstimator()
 
     def flush_writer(self):
-        # XXX Running `optimal_cell_sizes` takes about a minute
-        # on large datasets. disabled for now.
-        # self.optimal_cell_sizes()
+        # Row heights are estimated while rows are written so it is not
+        # necessary to read back every cell of the worksheet.
+        self.optimal_cell_sizes()
         self._report_queries("optimal cell sizes computed")
         # Write out the Excel file. That still takes an inordinate
         # amount of time for some reason, but we have no choice.
-        content = io.BytesIO()
+        content = get_spooled_file()
         self.wbook.save(content)
         self._report_queries("workbook content saved")
-        content.seek(0)
         return content
 
     def writerow(self, row, leaf=False):
         #pylint:disable=protected-access,unused-argument
         self.wsheet.append(row)
+        self.cell_sizes.add_row(row)
 
     def write_headers(self):
         """
@@ -281,8 +281,10 @@ class PracticesSpreadsheetView(TimersMixin, QuestionListAPIView):
                 first_cell.alignment = first_col_alignments[indent]
                 if self.is_practice(entry):
                     first_cell.font = practice_font
+                    self.cell_sizes.set_font_size(idx, 1, practice_font.size)
                 else:
                     first_cell.font = heading_font
+                    self.cell_sizes.set_font_size(idx, 1, heading_font.size)
                     if not indent:
                         for row_cells in self.wsheet.iter_rows(
                                 min_row=idx, max_row=idx):
@@ -323,53 +325,11 @@ class PracticesSpreadsheetView(TimersMixin, QuestionListAPIView):
         # how many columns to display for implementation rate.
         self.write_sheet(title="Practices", queryset=self.get_queryset())
 
-        resp = HttpResponse(self.flush_writer(), content_type=self.content_type)
-        resp['Content-Disposition'] = \
-            'attachment; filename="{}"'.format(self.get_filename())
-        return resp
+        return as_attachment_response(self.flush_writer(),
+            self.get_filename(), self.content_type)
 
     def optimal_cell_sizes(self):
-        #pylint:disable=too-many-locals
-        iter_rows = self.wsheet.iter_rows()
-        if iter_rows != tuple():
-            col_width = []
-
-            for i in range(len(next(iter_rows))):
-                col_letter = get_column_letter(i + 1)
-
-                minimum_width = 10.0
-                current_width = self.wsheet.column_dimensions[col_letter].width
-                if not current_width or current_width < minimum_width:
-                    self.wsheet.column_dimensions[col_letter].width = \
-                        minimum_width
-                col_width.append(
-                    self.wsheet.column_dimensions[col_letter].width)
-
-            for i, row in enumerate(self.wsheet):
-                default_height = 12.5
-
-                multiples_of_font_size = [default_height]
-                for j, cell in enumerate(row):
-                    if cell.value is not None:
-                        mul = 0
-                        for val in str(cell.value).split('\n'):
-                            mul += math.ceil(
-                                len(val) / col_width[j]) * cell.font.size
-
-                        if mul > 0:
-                            multiples_of_font_size.append(mul)
-
-                original_height = self.wsheet.row_dimensions[i+1].height
-                if original_height is None:
-                    original_height = default_height
-
-                new_height = max(multiples_of_font_size)
-                max_height = default_height * 10
-                if original_height < new_height:
-                    if new_height < max_height:
-                        self.wsheet.row_dimensions[i + 1].height = new_height
-                    else:
-                        self.wsheet.row_dimensions[i + 1].height = max_height
+        self.cell_sizes.set_cell_sizes(self.wsheet)
 
     def get_filename(self):
         basename = self.basename
@@ -1,12 +1,11 @@
 # Copyright (c) 2026, DjaoDjin inc.
 # see LICENSE.
 
-import csv, datetime, io, logging, os
+import csv, datetime, io, logging, os, re
 
 from django.conf import settings
-from django.db import connection
 from django.db.models import Q, F
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.views.generic import ListView, TemplateView
 from openpyxl import Workbook
@@ -22,12 +21,13 @@ from survey.compat import force_str, six
 from survey.filters import DateRangeFilter, SearchFilter
 from survey.helpers import datetime_or_now, get_extra, extra_as_internal
 from survey.mixins import TimersMixin
-from survey.models import (Answer, Campaign, Choice, Portfolio, Sample, Unit,
+from survey.models import (Answer, Campaign, Portfolio, Sample, Unit,
     UnitEquivalences)
 from survey.settings import DB_PATH_SEP
 from survey.utils import get_question_model
 
-from .base import CSVDownloadRenderer
+from .base import (ChoicesDecoder, CSVDownloadRenderer,
+    as_attachment_response, get_chunked_cursor, get_spooled_file)
 from .content import PracticesSpreadsheetView
 from .. import humanize
 from ..api.campaigns import CampaignContentMixin
@@ -41,8 +41,9 @@ from ..helpers import as_valid_sheet_title
 from ..mixins import (AccountMixin, CampaignMixin,
     AccountsNominativeQuerysetMixin)
 from ..models import ScorecardCache
+from ..queries import sql_answers_by_accounts
 from ..scores.base import get_top_normalized_score
-from ..utils import get_alliances, get_practice_serializer
+from ..utils import get_alliances, get_practice_serializer, get_unit
 
 LOGGER = logging.getLogger(__name__)
 
@@ -134,6 +135,71 @@ class CSVDownloadView(AccountMixin, ListView):
                 self.csv_writer.writerow(table)
 
 
+class PPTXTemplate(object):
+    """
+    A .pptx template and the placeholders found in it.
+
+    `bindings` is a dictionnary of placeholders by slide index, then shape id,
+    formatted as (kind, value) where kind is `TEXT`, and value the set of
+    context keys found in the shape text, or kind is `CHART`, and value
+    the text of the chart title (or `None` when the chart has no title).
+    """
+    TEXT = 'text'
+    CHART = 'chart'
+
+    def __init__(self, blob, bindings):
+        self.blob = blob
+        self.bindings = bindings
+
+
+# Compiled templates by path, formatted as {path: (mtime, PPTXTemplate)}.
+_PPTX_TEMPLATES = {}
+
+
+def compile_pptx_template(path):
+    """
+    Returns the `PPTXTemplate` for the .pptx file at `path`.
+
+    The template is parsed once per process and compiled again only when
+    the file was modified since.
+    """
+    mtime = os.path.getmtime(path)
+    cached = _PPTX_TEMPLATES.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, 'rb') as reporting_file:
+        blob = reporting_file.read()
+    bindings = {}
+    prs = Presentation(io.BytesIO(blob))
+    for slide_idx, slide in enumerate(prs.slides):
+        LOGGER.debug("slide=%s", slide)
+        for shape in slide.shapes:
+            LOGGER.debug("\tshape=%s", shape)
+            binding = None
+            if isinstance(shape, Shape):
+                LOGGER.debug("\t- text=%s", shape.text)
+                keys = set(re.findall(r'{{(\w+)}}', shape.text))
+                if keys:
+                    binding = (PPTXTemplate.TEXT, keys)
+            elif isinstance(shape, GraphicFrame):
+                try:
+                    chart = shape.chart
+                    title = None
+                    if chart.has_title and chart.chart_title.has_text_frame:
+                        title = chart.chart_title.text_frame.text
+                    binding = (PPTXTemplate.CHART, title)
+                except ValueError:
+                    # The graphic frame does not contain a chart.
+                    pass
+            if binding:
+                bindings.setdefault(slide_idx, {}).update({
+                    shape.shape_id: binding})
+    template = PPTXTemplate(blob, bindings)
+    _PPTX_TEMPLATES.update({path: (mtime, template)})
+    return template
+
+
 class FullReportPPTXView(CampaignMixin, AccountMixin, TemplateView):
     """
     Download full report as a .pptx presentation
@@ -162,8 +228,39 @@ class FullReportPPTXView(CampaignMixin, AccountMixin, TemplateView):
             os.path.join('app', 'reporting', '%s.pptx' % self.basename)]
         return candidates + super(FullReportPPTXView, self).get_template_names()
 
+    def get_chart_data(self, data):
+        chart_data = CategoryChartData()
+        # Series might not have exactly the same labels.
+        # Thus we need to gather all defined labels first.
+        labels = set([])
+        for serie in data:
+            for point in serie.get('values'):
+                label = point[0]
+                if isinstance(label, datetime.datetime):
+                    label = label.date()
+                labels |= {label}
+        labels = sorted(labels)
+        LOGGER.debug("\tlabels=%s", labels)
+        for label in labels:
+            chart_data.add_category(label)
+        # Make sure we have a value for each label before
+        # adding serie.
+        LOGGER.debug("\tseries=%s", list(data))
+        for serie in data:
+            dataset = {point[0]:point[1]
+                for point in serie.get('values')}
+            values = []
+            for label in labels:
+                val = dataset.get(label)
+                values += [val if val else 0]
+            LOGGER.debug("\tadd serie '%s' with values %s",
+                serie.get('title'), values)
+            chart_data.add_series(
+                serie.get('title'), values)
+        return chart_data
+
     def get(self, request, *args, **kwargs):
-        #pylint: disable=unused-argument,too-many-locals,too-many-nested-blocks
+        #pylint: disable=unused-argument,too-many-locals
         context = {
             'title': self.title,
             'accounts': ', '.join([self.account.printable_name] + [
@@ -173,7 +270,7 @@ class FullReportPPTXView(CampaignMixin, AccountMixin, TemplateView):
         }
 
         # Prepares the result file
-        content = io.BytesIO()
+        content = get_spooled_file()
         candidate = None
         for candidate_template in self.get_template_names():
             for template_dir in settings.TEMPLATES_DIRS:
@@ -185,70 +282,46 @@ class FullReportPPTXView(CampaignMixin, AccountMixin, TemplateView):
                 break
         LOGGER.debug("use template '%s'", candidate)
         if candidate:
-            with open(candidate, 'rb') as reporting_file:
-                prs = Presentation(reporting_file)
-            for slide in prs.slides:
-                LOGGER.debug("slide=%s", slide)
+            template = compile_pptx_template(candidate)
+            prs = Presentation(io.BytesIO(template.blob))
+            # Charts sharing a title are filled with the same data.
+            data_by_titles = {}
+            for slide_idx, slide in enumerate(prs.slides):
+                bindings = template.bindings.get(slide_idx)
+                if not bindings:
+                    continue
                 for shape in slide.shapes:
-                    LOGGER.debug("\tshape=%s", shape)
-                    if isinstance(shape, Shape):
-                        LOGGER.debug("\t- text=%s", shape.text)
-                        for key, val in context.items():
+                    binding = bindings.get(shape.shape_id)
+                    if not binding:
+                        continue
+                    kind, value = binding
+                    if kind == PPTXTemplate.TEXT:
+                        for key in value:
+                            if key not in context:
+                                continue
                             key_text = '{{%s}}' % key
-                            if key_text in shape.text:
-                                for para in shape.text_frame.paragraphs:
-                                    LOGGER.debug("\t- replace %s in %s",
-                                        key_text, para)
-                                    para.text = para.text.replace(key_text, val)
-                    elif isinstance(shape, GraphicFrame):
+                            for para in shape.text_frame.paragraphs:
+                                LOGGER.debug("\t- replace %s in %s",
+                                    key_text, para)
+                                para.text = para.text.replace(
+                                    key_text, context[key])
+                    else:
                         # We found the chart's container
+                        if value not in data_by_titles:
+                            data_by_titles[value] = (list(
+                                self.get_data(value)) if value is not None
+                                else list(self.get_data()))
+                        data = data_by_titles[value]
+                        LOGGER.debug("use data %s", data)
                         try:
-                            chart = shape.chart
-                            if chart.has_title:
-                                data = list(self.get_data(chart.chart_title))
-                            else:
-                                data = list(self.get_data())
-                            LOGGER.debug("use data %s", data)
-                            chart_data = CategoryChartData()
-                            # Series might not have exactly the same labels.
-                            # Thus we need to gather all defined labels first.
-                            labels = set([])
-                            for serie in data:
-                                for point in serie.get('values'):
-                                    label = point[0]
-                                    if isinstance(label, datetime.datetime):
-                                        label = label.date()
-                                    labels |= {label}
-                            labels = sorted(labels)
-                            LOGGER.debug("\tlabels=%s", labels)
-                            for label in labels:
-                                chart_data.add_category(label)
-                            # Make sure we have a value for each label before
-                            # adding serie.
-                            LOGGER.debug("\tseries=%s", list(data))
-                            for serie in data:
-                                dataset = {point[0]:point[1]
-                                    for point in serie.get('values')}
-                                values = []
-                                for label in labels:
-                                    val = dataset.get(label)
-                                    values += [val if val else 0]
-                                LOGGER.debug("\tadd serie '%s' with values %s",
-                                    serie.get('title'), values)
-                                chart_data.add_series(
-                                    serie.get('title'), values)
-
-                            chart.replace_data(chart_data)
+                            shape.chart.replace_data(
+                                self.get_chart_data(data))
                         except ValueError:
                             pass
             prs.save(content)
-        content.seek(0)
-
-        resp = HttpResponse(content, content_type=self.content_type)
-        resp['Content-Disposition'] = 'attachment; filename="{}"'.format(
-            self.get_filename())
 
-        return resp
+        return as_attachment_response(content, self.get_filename(),
+            self.content_type)
 
 
 class BenchmarkPPTXView(BenchmarkPSPMixin, FullReportPPTXView):
@@ -318,15 +391,13 @@ class ReportingDashboardPPTXView(DashboardAggregateMixin, FullReportPPTXView):
             self.account.slug + '-' + self.basename + '-%Y%m%d.pptx')
 
     def get_data(self, title=None):
-        data = self.get_response_data(self.request, **self.kwargs)
-        return data['results']
+        return self.response_data['results']
 
     @property
     def title(self):
         #pylint:disable=attribute-defined-outside-init
         if not hasattr(self, '_title'):
-            data = self.get_response_data(self.request, **self.kwargs)
-            self._title = data['title']
+            self._title = self.response_data['title']
         return self._title
 
 
@@ -342,13 +413,12 @@ class EngagementStatsPPTXView(EngagementStatsMixin, ReportingDashboardPPTXView):
     Download engagement statistics as a .pptx presentation
     """
 
-    def get_response_data(self, request, *args, **kwargs):
-        resp = super(EngagementStatsPPTXView, self).get_response_data(
-            request, *args, **kwargs)
+    def get_data(self, title=None):
         # We have to reverse the results to keep charts consistent with
-        # HTML version.
-        resp.update({'results': reversed(resp.get('results'))})
-        return resp
+        # HTML version. The payload itself is left untouched since it is
+        # shared with `EngagementStatsAPIView`.
+        return list(reversed(
+            super(EngagementStatsPPTXView, self).get_data(title=title)))
 
 
 class TemplateXLSXView(TimersMixin, AccountMixin, ListView):
@@ -412,13 +482,11 @@ class TemplateXLSXView(TimersMixin, AccountMixin, ListView):
         self.write_queryset(queryset)
 
         # Prepares the result file
-        content = io.BytesIO()
+        content = get_spooled_file()
         wbook.save(content)
-        content.seek(0)
 
-        resp = HttpResponse(content, content_type=self.content_type)
-        resp['Content-Disposition'] = 'attachment; filename="{}"'.format(
-            self.get_filename())
+        resp = as_attachment_response(content, self.get_filename(),
+            self.content_type)
         self._report_queries("http response created")
         return resp
 
@@ -625,7 +693,7 @@ class LongFormatCSVView(AccountsNominativeQuerysetMixin, CSVDownloadView):
 
     def __init__(self, **kwargs):
         super(LongFormatCSVView, self).__init__(**kwargs)
-        self._choices = {}
+        self.choices_decoder = ChoicesDecoder()
 
     def get_supplier_key(self, account):
         #pylint:disable=attribute-defined-outside-init
@@ -654,21 +722,16 @@ class LongFormatCSVView(AccountsNominativeQuerysetMixin, CSVDownloadView):
             )).distinct().select_related('sample__account', 'question', 'unit')
         return queryset
 
+    def decorate_queryset(self, queryset):
+        # Loads the text of all choices in bulk instead of one query
+        # per answer.
+        self.choices_decoder.preload(queryset)
+        return queryset
+
     def queryrow_to_columns(self, record):
-        measured = record.measured
-        if record.unit.system == Unit.SYSTEM_ENUMERATED:
-            if not hasattr(self, '_choices'):
-                self._choices = {}
-            choices = self._choices.get(record.unit.slug)
-            if not choices:
-                choices = {choice.pk: choice.text
-                    for choice in Choice.objects.filter(
-                        unit=record.unit)}
-                self._choices.update({record.unit.slug: choices})
-            measured = choices.get(record.measured)
-        elif record.unit.system not in Unit.NUMERICAL_SYSTEMS:
-            measured = self.encode(
-                Choice.objects.get(pk=measured).text)
+        measured = self.choices_decoder.decode(record.unit, record.measured)
+        if record.unit.system in (Unit.SYSTEM_FREETEXT, Unit.SYSTEM_DATETIME):
+            measured = self.encode(measured)
         supplier_key = self.get_supplier_key(record.sample.account)
         row = [
             record.created_at.date(),
@@ -704,11 +767,14 @@ class AnswersDownloadMixin(BenchmarkMixin, CampaignContentMixin):
     unit_title_idx = 5
     measured_text_idx = 6
 
+    # Number of rows fetched at a time from the database
+    batch_size = 10000
+
     def __init__(self, *args):
         super(AnswersDownloadMixin, self).__init__( *args)
-        self.comments_unit = Unit.objects.get(slug='freetext')
-        self.points_unit = Unit.objects.get(slug='points')
-        self.target_by_unit = Unit.objects.get(slug='ends-at')
+        self.comments_unit = get_unit('freetext')
+        self.points_unit = get_unit('points')
+        self.target_by_unit = get_unit('ends-at')
         self.errors = []
 
     @property
@@ -934,6 +1000,54 @@ class AnswersDownloadMixin(BenchmarkMixin, CampaignContentMixin):
         return results
 
 
+    def iter_sql_rows(self, sql_query):
+        """
+        Iterates over the rows returned by `sql_query`, fetched
+        `batch_size` rows at a time through a server-side cursor
+        when the database supports it.
+        """
+        with get_chunked_cursor() as cursor:
+            cursor.execute(sql_query, params=None)
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+
+
+    def iter_answers_by_accounts(self, latest_samples, prefix=None):
+        """
+        Yields (account_id, answers) pairs, one per account in
+        `latest_samples`, where answers is a list of answers tuple
+        (path, account_id, measured, unit_id, default_unit_id, title, text)
+        ordered by path.
+
+        Rows are streamed from the database ordered by account, so only
+        the answers of a single sample are held in memory at any time.
+        """
+        try:
+            # We might have a `RawQuerySet` so we can't blindly use `.exists()`
+            unused_first_sample = latest_samples[0]
+        except IndexError:
+            return
+
+        reporting_answers_sql = sql_answers_by_accounts(
+            latest_samples.query.sql, prefix=prefix,
+            verified=self.show_verified, order_by_accounts=True)
+        prev_account_id = None
+        chunk = []
+        for row in self.iter_sql_rows(reporting_answers_sql):
+            account_id = row[self.account_id_idx]
+            if chunk and account_id != prev_account_id:
+                yield prev_account_id, chunk
+                chunk = []
+            chunk += [row]
+            prev_account_id = account_id
+        if chunk:
+            yield prev_account_id, chunk
+
+
     def get_answers_by_paths(self, latest_samples, prefix=None):
         """
         Returns a dictionnary of lists of answers tuple (path, account_id,
@@ -954,134 +1068,21 @@ class AnswersDownloadMixin(BenchmarkMixin, CampaignContentMixin):
         except IndexError:
             return answers_by_paths
 
-        question_clause = ""
-        if prefix:
-            question_clause = ("WHERE survey_question.path LIKE '%s%%'"
-                % prefix)
-        reporting_answers_sql = """
-WITH samples AS (
-    %(latest_assessments)s
-),
-answers AS (
-SELECT
-    survey_question.path,
-    samples.account_id,
-    survey_answer.measured,
-    survey_answer.unit_id,
-    survey_question.default_unit_id,
-    survey_unit.title
-FROM survey_answer
-INNER JOIN survey_question
-  ON survey_answer.question_id = survey_question.id
-INNER JOIN samples
-  ON survey_answer.sample_id = samples.id
-INNER JOIN survey_unit
-  ON survey_answer.unit_id = survey_unit.id
-%(question_clause)s
-)
-SELECT
-  answers.path,
-  answers.account_id,
-  answers.measured,
-  answers.unit_id,
-  answers.default_unit_id,
-  answers.title,
-  survey_choice.text
-FROM answers
-LEFT OUTER JOIN survey_choice
-  ON survey_choice.unit_id = answers.unit_id AND
-     survey_choice.id = answers.measured
-ORDER BY answers.path, answers.account_id
-""" % {
-            'latest_assessments': latest_samples.query.sql,
-            'question_clause': question_clause
-        }
-        if self.show_verified:
-            # When we are downloading the answers for a verification
-            # campaign, we run the same query as previously, except we
-            # add an indirection through `djaopsp_verifiedsample` to find
-            # the account the verification answers apply to (otherwise
-            # we would set the verifier account as a column label).
-            reporting_answers_sql = """
-WITH latest_samples AS (
-    %(latest_assessments)s
-),
-samples AS (
-SELECT survey_sample.id,
- survey_sample.slug,
- survey_sample.created_at,
- survey_sample.campaign_id,
- latest_samples.account_id AS account_id,
- survey_sample.is_frozen,
- survey_sample.extra,
- survey_sample.updated_at
-FROM survey_sample
-INNER JOIN djaopsp_verifiedsample
-ON djaopsp_verifiedsample.verifier_notes_id = survey_sample.id
-INNER JOIN latest_samples
-ON djaopsp_verifiedsample.sample_id = latest_samples.id
-WHERE djaopsp_verifiedsample.verified_status >= 2
-),
-answers AS (
-SELECT
-    survey_question.path,
-    samples.account_id,
-    survey_answer.measured,
-    survey_answer.unit_id,
-    survey_question.default_unit_id,
-    survey_unit.title
-FROM survey_answer
-INNER JOIN survey_question
-  ON survey_answer.question_id = survey_question.id
-INNER JOIN samples
-  ON survey_answer.sample_id = samples.id
-INNER JOIN survey_unit
-  ON survey_answer.unit_id = survey_unit.id
-%(question_clause)s
-)
-SELECT
-  answers.path,
-  answers.account_id,
-  answers.measured,
-  answers.unit_id,
-  answers.default_unit_id,
-  answers.title,
-  survey_choice.text
-FROM answers
-LEFT OUTER JOIN survey_choice
-  ON survey_choice.unit_id = answers.unit_id AND
-     survey_choice.id = answers.measured
-ORDER BY answers.path, answers.account_id
-""" % {
-            'latest_assessments': latest_samples.query.sql,
-            'question_clause': question_clause
-        }
-        with connection.cursor() as cursor:
-            cursor.execute(reporting_answers_sql, params=None)
-            prev_path = None
-            chunk = []
-            for row in cursor:
-                # The SQL quesry is ordered by `path` so we can build
-                # the final result by chunks, path by path.
-                # Without questions for multiple years (ex: current and base
-                # year GHG emissions), the query would be sorted by slug
-                # i.e. `REGEXP_REPLACE(answers.path, '^/(\S+/)*', '')`
-                # but this function is not supported easily on sqlite3.
-                path = row[0]
-                if prev_path and path != prev_path:
-                    # flush
-                    prev_key = prev_path # prev_path.split(DB_PATH_SEP)[-1]
-                    if prev_key in answers_by_paths:
-                        answers_by_paths.update({
-                            prev_key: self.merge_records(
-                                answers_by_paths[prev_key], chunk)})
-                    else:
-                        answers_by_paths.update({prev_key: chunk})
-                    chunk = []
-                chunk += [row]
-                prev_path = path
-            if chunk:
-                # flush last remaining chunk
+        reporting_answers_sql = sql_answers_by_accounts(
+            latest_samples.query.sql, prefix=prefix,
+            verified=self.show_verified)
+        prev_path = None
+        chunk = []
+        for row in self.iter_sql_rows(reporting_answers_sql):
+            # The SQL quesry is ordered by `path` so we can build
+            # the final result by chunks, path by path.
+            # Without questions for multiple years (ex: current and base
+            # year GHG emissions), the query would be sorted by slug
+            # i.e. `REGEXP_REPLACE(answers.path, '^/(\S+/)*', '')`
+            # but this function is not supported easily on sqlite3.
+            path = row[0]
+            if prev_path and path != prev_path:
+                # flush
                 prev_key = prev_path # prev_path.split(DB_PATH_SEP)[-1]
                 if prev_key in answers_by_paths:
                     answers_by_paths.update({
@@ -1089,10 +1090,52 @@ ORDER BY answers.path, answers.account_id
                             answers_by_paths[prev_key], chunk)})
                 else:
                     answers_by_paths.update({prev_key: chunk})
+                chunk = []
+            chunk += [row]
+            prev_path = path
+        if chunk:
+            # flush last remaining chunk
+            prev_key = prev_path # prev_path.split(DB_PATH_SEP)[-1]
+            if prev_key in answers_by_paths:
+                answers_by_paths.update({
+                    prev_key: self.merge_records(
+                        answers_by_paths[prev_key], chunk)})
+            else:
+                answers_by_paths.update({prev_key: chunk})
 
         return answers_by_paths
 
 
+    def get_scorecards_by_paths(self, latest_samples, paths):
+        """
+        Returns a dictionnary of lists of scores tuple formatted as answers
+        (see `get_answers_by_paths`) by heading path.
+
+        All scores for `paths` are loaded in a single query, then grouped
+        by path. Within a path, scores are ordered by 'account_id'.
+        """
+        scores_by_paths = {}
+        if not paths:
+            return scores_by_paths
+        scores = ScorecardCache.objects.filter(
+            sample__in=latest_samples, path__in=paths).order_by(
+            'sample__account_id', 'pk').values_list(
+            'path', 'pk', 'sample__account_id', 'normalized_score')
+        for path, pk, account_id, normalized_score in scores:
+            # by using `self.points_unit.pk` for both 'unit_id' and
+            # 'default_unit_id', `add_datapoint` will set the 'measured'
+            # field.
+            scores_by_paths.setdefault(path, []).append((
+                pk,                        # path_idx = 0
+                account_id,                # account_id_idx = 1
+                normalized_score,          # measured_idx = 2
+                self.points_unit.pk,       # unit_idx = 3
+                self.points_unit.pk,       # default_unit_idx = 4
+                self.points_unit.title,    # unit_title_idx = 5
+                ""))                       # measured_text_idx = 6
+        return scores_by_paths
+
+
     def get_queryset(self):
         """
         Returns a set of practices and headings decorated
@@ -1142,6 +1185,7 @@ ORDER BY answers.path, answers.account_id
             by_paths = self.get_answers_by_paths(self.latest_assessments)
             self._report_queries(descr="collected answers")
 
+        scorecard_entries = []
         for entry in questions:
             path = entry.get('path')
             key = path
@@ -1162,23 +1206,15 @@ ORDER BY answers.path, answers.account_id
                 if extra:
                     tags = extra.get('tags')
                 if tags and 'scorecard' in tags:
-                    scores = ScorecardCache.objects.filter(
-                        sample__in=self.latest_assessments,
-                        path=path).order_by(
-                        'sample__account_id').values_list(
-                        'pk', 'sample__account_id', 'normalized_score')
-                    # by using `self.points_unit.pk` for both 'unit_id' and
-                    # 'default_unit_id', `add_datapoint` will set the 'measured'
-                    # field.
-                    entry.update({'accounts': [(
-                        val[0],                    # path_idx = 0
-                        val[1],                    # account_id_idx = 1
-                        val[2],                    # measured_idx = 2
-                        self.points_unit.pk,       # unit_idx = 3
-                        self.points_unit.pk,       # default_unit_idx = 4
-                        self.points_unit.title,    # unit_title_idx = 5
-                        "")                        # measured_text_idx = 6
-                        for val in scores]})
+                    scorecard_entries += [entry]
+
+        if scorecard_entries:
+            scores_by_paths = self.get_scorecards_by_paths(
+                self.latest_assessments,
+                [entry.get('path') for entry in scorecard_entries])
+            for entry in scorecard_entries:
+                entry.update({'accounts': scores_by_paths.get(
+                    entry.get('path'), [])})
         self._report_queries(descr="collected section scores")
 
         return questions
@@ -1194,10 +1230,37 @@ class AnswersPivotableView(AnswersDownloadMixin, ListAPIView):
         return datetime_or_now().strftime(self.basename + '-%Y%m%d' + ext)
 
     def get_queryset(self):
+        """
+        Yields one record per answer, account by account, such that
+        only the answers of a single account are held in memory
+        at any time.
+        """
         #pylint:disable=too-many-locals
-        queryset = super(AnswersPivotableView, self).get_queryset()
+        # We bypass `AnswersDownloadMixin.get_queryset`, which loads
+        # the answers of all accounts before returning.
+        questions = super(AnswersDownloadMixin, self).get_queryset()
+
+        rank_by_paths = {}
+        scorecard_paths = []
+        for rank, entry in enumerate(questions):
+            path = entry.get('path')
+            rank_by_paths.update({path: (rank, entry)})
+            if self.show_scores:
+                tags = []
+                extra = entry.get('extra')
+                if extra:
+                    tags = extra.get('tags')
+                if tags and 'scorecard' in tags:
+                    scorecard_paths += [path]
+
+        scores_by_accounts = {}
+        for path, scores in six.iteritems(self.get_scorecards_by_paths(
+                self.latest_assessments, scorecard_paths)):
+            for row in scores:
+                scores_by_accounts.setdefault(
+                    row[self.account_id_idx], []).append((path, row))
+        self._report_queries(descr="collected section scores")
 
-        results = []
         last_activity_at_by_accounts = {}
         for sample in self.latest_assessments:
             last_activity_at_by_accounts.update({
@@ -1206,37 +1269,75 @@ class AnswersPivotableView(AnswersDownloadMixin, ListAPIView):
         by_account_ids = {account.pk: account
             for account in self.accounts_with_completed_assessment}
 
-        for entry in queryset:
-            question_title = entry.get('title')
-            ref_num = entry.get('ref_num')
-            by_accounts = entry.get('accounts', [])
-            if by_accounts:
-                for col in by_accounts:
-                    account_id = col[self.account_id_idx]
-                    account = by_account_ids[account_id]
-                    supplier_key = get_extra(account, 'supplier_key')
-                    last_activity_at = last_activity_at_by_accounts.get(
-                        account_id)
-                    measured = (col[self.measured_text_idx]
-                        if col[self.measured_text_idx]
-                        else col[self.measured_idx])
-                    unit_title = col[self.unit_title_idx]
-                    results += [{
-                        'created_at': last_activity_at,
-                        'supplier_key': supplier_key,
-                        'printable_name': account.printable_name,
-                        'measured': measured,
-                        'unit': unit_title,
-                        'title': question_title,
-                        'ref_num': ref_num
-                    }]
-
+        if self.show_planned:
+            latest_samples = self.latest_improvements
+        else:
+            latest_samples = self.latest_assessments
+        for account_id, answers in self.iter_answers_by_accounts(
+                latest_samples):
+            by_paths = [(row[self.path_idx], row) for row in answers
+                if row[self.path_idx] in rank_by_paths]
+            answered = set([path for path, _ in by_paths])
+            by_paths += [(path, row)
+                for path, row in scores_by_accounts.pop(account_id, [])
+                if path not in answered]
+            for record in self.as_records(account_id, by_paths,
+                    rank_by_paths, by_account_ids,
+                    last_activity_at_by_accounts):
+                yield record
+        # Accounts with scores but no answers.
+        for account_id, by_paths in sorted(six.iteritems(scores_by_accounts)):
+            for record in self.as_records(account_id, by_paths,
+                    rank_by_paths, by_account_ids,
+                    last_activity_at_by_accounts):
+                yield record
+
+
+    def as_records(self, account_id, by_paths, rank_by_paths,
+                   by_account_ids, last_activity_at_by_accounts):
+        """
+        Returns the records for `account_id`, (path, row) pairs in
+        `by_paths` ordered as the questions of the campaign.
+        """
+        #pylint:disable=too-many-arguments
+        results = []
+        account = by_account_ids[account_id]
+        supplier_key = get_extra(account, 'supplier_key')
+        last_activity_at = last_activity_at_by_accounts.get(account_id)
+        for path, col in sorted(by_paths,
+                key=lambda path_row: rank_by_paths[path_row[0]][0]):
+            entry = rank_by_paths[path][1]
+            results += [{
+                'created_at': last_activity_at,
+                'supplier_key': supplier_key,
+                'printable_name': account.printable_name,
+                'measured': (col[self.measured_text_idx]
+                    if col[self.measured_text_idx]
+                    else col[self.measured_idx]),
+                'unit': col[self.unit_title_idx],
+                'title': entry.get('title'),
+                'ref_num': entry.get('ref_num')
+            }]
         return results
 
 
     def get(self, request, *args, **kwargs):
         self._start_time()
-        return super(AnswersPivotableView, self).get(request, *args, **kwargs)
+        renderer = request.accepted_renderer
+        if not isinstance(renderer, CSVDownloadRenderer):
+            return super(AnswersPivotableView, self).get(
+                request, *args, **kwargs)
+        # Rows are written out as they are generated instead of
+        # serializing the whole export in a `Response` first.
+        results = (self.get_serializer(record).data
+            for record in self.get_queryset())
+        resp = StreamingHttpResponse(
+            renderer.stream(results, renderer_context={'view': self}),
+            content_type="%s; charset=%s" % (
+                renderer.media_type, renderer.charset))
+        resp['Content-Disposition'] = \
+            'attachment; filename="{}"'.format(self.get_filename())
+        return resp
 
 
 class AccessiblesAnswersPivotableCSVView(AccessiblesAccountsMixin,
@@ -1528,10 +1629,8 @@ class TabularizedAnswersXLSXView(AnswersDownloadMixin,
         if self.errors:
             LOGGER.info('\n'.join(self.errors))
 
-        resp = HttpResponse(self.flush_writer(), content_type=self.content_type)
-        resp['Content-Disposition'] = \
-            'attachment; filename="{}"'.format(self.get_filename())
-        return resp
+        return as_attachment_response(self.flush_writer(),
+            self.get_filename(), self.content_type)
 
 
     def write_headers(self):
@@ -7,19 +7,24 @@ Command for data validation
 Checks that for each (grantee, account, campaign) triplets,
 `portfolio.ends_at` is greater than the last time the `account`
 shared `campaign` responses with the `grantee`.
+
+Anomalies are detected with set-based SQL queries so the checks can run
+against a production-size database. Unexpected answers in active samples
+and duplicate answers can be deleted in batches with `--fix`.
 """
-import datetime, logging
+import datetime, json, logging
+from collections import OrderedDict
 
 from dateutil.relativedelta import relativedelta
-from django.core.management.base import BaseCommand
-from django.db import connection
-from django.db.models import Count, Max
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 from pages.models import PageElement
-from survey.models import Answer, Campaign, PortfolioDoubleOptIn, Sample, Unit
-from survey.queries import sql_frozen_answers
+from survey.helpers import datetime_or_now
+from survey.models import Answer, Campaign, PortfolioDoubleOptIn, Unit
 from survey.settings import DB_PATH_SEP
-from survey.utils import get_account_model, get_question_model
+from survey.utils import get_question_model
 
+from ...compat import six
 from ...queries import get_engagement
 from ...utils import get_account_model
 
@@ -70,71 +75,225 @@ class Command(BaseCommand):
         parser.add_argument('--dry-run', action='store_true',
             dest='dry_run', default=False,
             help='Do not commit database updates')
+        parser.add_argument('--fix', action='store_true',
+            dest='fix', default=False,
+            help='Delete unexpected and duplicate answers')
+        parser.add_argument('--batch-size', action='store',
+            dest='batch_size', default=1000,
+            help='Number of rows updated in a single transaction with --fix')
+        parser.add_argument('--json', action='store', nargs='?',
+            dest='json', const='-', default=None, metavar='FILE',
+            help='Write a summary of anomalies and timings per check'\
+                ' as JSON in FILE (default: stdout)')
 
     def handle(self, *args, **options):
         #pylint:disable=too-many-locals,too-many-statements
+        json_output = options['json']
+        if json_output == '-' and any([val for key, val
+                in six.iteritems(options) if key.startswith('show_')]):
+            # The JSON summary would be mixed with the CSV listings.
+            raise CommandError("--show-* listings are written on stdout,"\
+                " use --json FILE to write the summary in a file instead.")
         start_time = datetime.datetime.utcnow()
-        self.check_portfolios(
+        self.fix = options['fix']
+        self.dry_run = options['dry_run']
+        self.batch_size = int(options['batch_size'])
+        self.results = []
+        self._timed('portfolios', self.check_portfolios,
             show=options['show_portfolios'],
             show_fix=options['show_portfolios_fix'])
-        self.check_completed_notshared(
+        self._timed('completed_notshared', self.check_completed_notshared,
             show=options['show_completed_notshared'])
-        self.check_active_samples(show=options['show_active'])
-        self.check_updated_not_frozen(
+        self._timed('active_samples', self.check_active_samples,
+            show=options['show_active'])
+        self._timed('updated_not_frozen', self.check_updated_not_frozen,
             show=options['show_updated_not_frozen'])
-        if options['show_questions'] or options['show_answers']:
-            self.check_questions(
+        # Questions and answers are also checked with --fix and --json
+        # such that duplicate answers are deleted and reported.
+        if (options['show_questions'] or options['show_answers'] or
+            self.fix or json_output):
+            self._timed('questions', self.check_questions,
                 show=options['show_questions'],
                 show_fix=options['show_questions_fix'])
-            self.check_answers(
+            self._timed('answers', self.check_answers,
                 show=options['show_answers'],
                 show_fix=options['show_answers_fix'])
-        for campaign in Campaign.objects.all():
-            self.check_duplicate_samples(campaign=campaign,
-                exclude_units=options['exclude_units'],
-                show=options['show_duplicate_samples'])
+        self._timed('duplicate_samples', self.check_duplicate_samples,
+            exclude_units=options['exclude_units'],
+            show=options['show_duplicate_samples'])
         end_time = datetime.datetime.utcnow()
         delta = relativedelta(end_time, start_time)
         LOGGER.info("completed in %d hours, %d minutes, %d.%d seconds",
             delta.hours, delta.minutes, delta.seconds, delta.microseconds)
         self.stderr.write("completed in %d hours, %d minutes, %d.%d seconds\n"
             % (delta.hours, delta.minutes, delta.seconds, delta.microseconds))
+        if json_output:
+            summary = json.dumps({
+                'checks': self.results,
+                'elapsed': (end_time - start_time).total_seconds()
+            }, indent=2)
+            if json_output == '-':
+                self.stdout.write(summary)
+            else:
+                with open(json_output, 'w') as summary_file:
+                    summary_file.write(summary)
+
+
+    def _timed(self, check, func, **kwargs):
+        """
+        Runs `func` and records the number of anomalies it found,
+        the number of rows it fixed and the time it took.
+        """
+        start_time = datetime.datetime.utcnow()
+        count = func(**kwargs)
+        fixed = 0
+        if isinstance(count, tuple):
+            count, fixed = count
+        elapsed = (datetime.datetime.utcnow() - start_time).total_seconds()
+        LOGGER.info("check %s found %s anomalies in %.3f seconds",
+            check, count, elapsed)
+        self.results += [{
+            'check': check,
+            'count': count,
+            'fixed': fixed,
+            'elapsed': elapsed
+        }]
+
+
+    def _delete_answers_in_batches(self, answer_ids):
+        """
+        Deletes answers whose primary key is in `answer_ids`, `batch_size`
+        rows at a time, and returns the number of rows deleted.
+        """
+        nb_deleted = 0
+        if not self.fix or self.dry_run:
+            return nb_deleted
+        for idx in range(0, len(answer_ids), self.batch_size):
+            with transaction.atomic():
+                nb_deleted += Answer.objects.filter(
+                    pk__in=answer_ids[idx:idx + self.batch_size]).delete()[0]
+        return nb_deleted
 
 
     def check_active_samples(self, show=False):
-        count = 0
-        for sample in Sample.objects.filter(is_frozen=False).select_related(
-                'campaign'):
-            unexpected_answers = Answer.objects.filter(
-                sample=sample).exclude(
-                question__in=sample.campaign.questions.all()).select_related(
-                'question', 'unit')
-            if unexpected_answers.exists():
-                count += 1
+        """
+        Shows answers in active samples to questions that are not part
+        of the sample campaign.
+        """
+        unexpected_answers_query = """
+SELECT
+  survey_answer.sample_id,
+  survey_answer.id,
+  survey_answer.created_at,
+  survey_unit.slug,
+  survey_question.path
+FROM survey_answer
+INNER JOIN survey_sample
+  ON survey_answer.sample_id = survey_sample.id
+INNER JOIN survey_unit
+  ON survey_answer.unit_id = survey_unit.id
+INNER JOIN survey_question
+  ON survey_answer.question_id = survey_question.id
+LEFT OUTER JOIN survey_enumeratedquestions
+  ON (survey_enumeratedquestions.campaign_id = survey_sample.campaign_id AND
+      survey_enumeratedquestions.question_id = survey_answer.question_id)
+WHERE NOT survey_sample.is_frozen
+  AND survey_enumeratedquestions.id IS NULL
+ORDER BY survey_answer.sample_id, survey_answer.id
+"""
+        samples = set([])
+        answer_ids = []
+        with connection.cursor() as cursor:
+            cursor.execute(unexpected_answers_query, params=None)
+            for row in cursor.fetchall():
+                sample_id, answer_id, created_at, unit_slug, path = row
+                samples |= {sample_id}
+                answer_ids += [answer_id]
                 if show:
-                    for answer in unexpected_answers:
-                        self.stdout.write('%d,%s,"%s","%s"' % (
-                            sample.pk, answer.created_at.date(),
-                            answer.unit, answer.question.path))
+                    self.stdout.write('%d,%s,"%s","%s"' % (
+                        sample_id, datetime_or_now(created_at).date(),
+                        unit_slug, path))
+        count = len(samples)
         self.stderr.write("%d active samples with unexpected answers" % count)
+        nb_fixed = self._delete_answers_in_batches(answer_ids)
+        if nb_fixed:
+            self.stderr.write("%d unexpected answers deleted" % nb_fixed)
+        return count, nb_fixed
+
 
     def check_updated_not_frozen(self, show=False):
+        """
+        Shows active samples that were updated after they were created,
+        have no required questions left unanswered, yet are not frozen.
+        """
+        updated_not_frozen_query = """
+WITH updated_samples AS (
+SELECT
+  survey_sample.id AS id,
+  survey_sample.slug AS slug,
+  survey_sample.account_id AS account_id,
+  survey_sample.campaign_id AS campaign_id,
+  survey_sample.created_at AS created_at
+FROM survey_sample
+INNER JOIN survey_answer
+  ON survey_answer.sample_id = survey_sample.id
+WHERE NOT survey_sample.is_frozen
+GROUP BY survey_sample.id, survey_sample.slug, survey_sample.account_id,
+  survey_sample.campaign_id, survey_sample.created_at
+HAVING survey_sample.created_at < MAX(survey_answer.created_at)
+), answered_questions AS (
+SELECT DISTINCT
+  survey_answer.sample_id AS sample_id,
+  survey_answer.question_id AS question_id
+FROM survey_answer
+INNER JOIN updated_samples
+  ON survey_answer.sample_id = updated_samples.id
+INNER JOIN survey_question
+  ON survey_answer.question_id = survey_question.id
+LEFT OUTER JOIN survey_unitequivalences
+  ON survey_question.default_unit_id = survey_unitequivalences.source_id
+WHERE survey_answer.unit_id = survey_question.default_unit_id
+  OR survey_answer.unit_id = survey_unitequivalences.target_id
+), required_unanswered AS (
+SELECT DISTINCT updated_samples.id AS sample_id
+FROM updated_samples
+INNER JOIN survey_enumeratedquestions
+  ON survey_enumeratedquestions.campaign_id = updated_samples.campaign_id
+LEFT OUTER JOIN answered_questions
+  ON (answered_questions.sample_id = updated_samples.id AND
+      answered_questions.question_id = survey_enumeratedquestions.question_id)
+WHERE survey_enumeratedquestions.required
+  AND answered_questions.question_id IS NULL
+)
+SELECT
+  updated_samples.created_at,
+  %(account_table)s.slug,
+  updated_samples.slug
+FROM updated_samples
+INNER JOIN %(account_table)s
+  ON updated_samples.account_id = %(account_table)s.id
+LEFT OUTER JOIN required_unanswered
+  ON updated_samples.id = required_unanswered.sample_id
+WHERE required_unanswered.sample_id IS NULL
+ORDER BY updated_samples.created_at
+""" % {
+    'account_table': self.account_model._meta.db_table
+}
         count = 0
-        for sample in Sample.objects.filter(is_frozen=False,
-                created_at__lt=Max('answers__created_at')).annotate(
-                answers_count=Count('answers')).order_by(
-                'created_at').select_related('campaign'):
-            if not sample.get_required_unanswered_questions().exists():
+        with connection.cursor() as cursor:
+            cursor.execute(updated_not_frozen_query, params=None)
+            for row in cursor.fetchall():
                 count += 1
                 if show:
-                    self.stdout.write('%s,%s,%s' % (
-                        sample.created_at, sample.account, sample))
+                    self.stdout.write('%s,%s,%s' % row)
         self.stderr.write("%d active samples that have been updated,"\
             " answer all required questions, but are not marked complete" %
             count)
+        return count
 
 
     def check_completed_notshared(self, show=False):
+        total = 0
         for campaign in Campaign.objects.all():
             count = 0
             queryset = get_engagement(campaign, accounts=None)
@@ -150,6 +309,8 @@ class Command(BaseCommand):
                             val.grantee_id, reporting_status))
             self.stderr.write("%d completed-notshared in campaign '%s'" % (
                 count, campaign))
+            total += count
+        return total
 
 
     def check_portfolios(self, show=False, show_fix=False):
@@ -157,18 +318,21 @@ class Command(BaseCommand):
         if show_fix:
             show = True
 
+        total = 0
         count = PortfolioDoubleOptIn.objects.filter(state__in=[
             PortfolioDoubleOptIn.OPTIN_REQUEST_INITIATED,
             PortfolioDoubleOptIn.OPTIN_GRANT_INITIATED
         ], verification_key__isnull=True).count()
         self.stderr.write(
             "%d initiated portfolio optins with no verification_key" % count)
+        total += count
         count = PortfolioDoubleOptIn.objects.exclude(state__in=[
             PortfolioDoubleOptIn.OPTIN_REQUEST_INITIATED,
             PortfolioDoubleOptIn.OPTIN_GRANT_INITIATED
         ]).exclude(verification_key__isnull=True).count()
         self.stderr.write(
           "%d completed portfolio optins still with a verification_key" % count)
+        total += count
 
         duplicates_query = """
 WITH duplicates AS (
@@ -210,6 +374,7 @@ ON grants.id = duplicates.grantee_id
         if sep and show_fix:
             self.stdout.write("COMMIT;")
         self.stderr.write("%d duplicate portfolios" % count)
+        total += count
 
         # portfolio and optins
         optins_query = """
@@ -351,6 +516,7 @@ ORDER BY grantee_slug
         if sep and show_fix:
             self.stdout.write("COMMIT;")
         self.stderr.write("%d inaccurate portfolios" % count)
+        total += count
 
         # requests for which there are no portfolio yet
         request_no_portfolios_query = """
@@ -414,165 +580,231 @@ ORDER BY grantee_slug""" % {
         if sep and show_fix:
             self.stdout.write("COMMIT;")
         self.stderr.write("%d requests without an existing portfolio" % count)
+        total += count
+        return total
 
 
     def check_questions(self, show=False, show_fix=False):
+        """
+        Shows questions whose content does not match the element
+        identified by the last part of the question path.
+        """
         count = 0
-        for question in get_question_model().objects.all():
-            slug = question.path.split(DB_PATH_SEP)[-1]
-            element = PageElement.objects.get(slug=slug)
-            if question.content.pk != element.pk:
+        elements = {slug: (pk, title)
+            for pk, slug, title in PageElement.objects.values_list(
+                'pk', 'slug', 'title')}
+        contents = dict(PageElement.objects.filter(
+            question__isnull=False).values_list('pk', 'slug').distinct())
+        for path, content_id in get_question_model().objects.values_list(
+                'path', 'content_id').order_by('path'):
+            slug = path.split(DB_PATH_SEP)[-1]
+            element_pk, element_title = elements.get(slug, (None, None))
+            if content_id != element_pk:
                 if show:
                     self.stderr.write(
                         "warning: question %s points to content %s"
-                        % (question.path, question.content.slug))
-                    self.stderr.write("\t    \"%s\"" % question.content.title)
-                    self.stderr.write("\tvs. \"%s\"" % element.title)
+                        % (path, contents.get(content_id)))
+                    self.stderr.write("\tvs. \"%s\"" % element_title)
                 if count == 0 and show_fix:
                     self.stdout.write("BEGIN;")
                 if show_fix:
                     self.stdout.write("UPDATE survey_question SET"\
 " content_id=(SELECT id FROM pages_pageelement WHERE slug='%s')"\
-" WHERE path='%s';" % (slug, question.path))
+" WHERE path='%s';" % (slug, path))
                 count += 1
         if count and show_fix:
             self.stdout.write("COMMIT;")
         self.stderr.write("%d questions/element discrepencies" % count)
+        return count
 
 
     def check_answers(self, show=False, show_fix=False):
         """
         Shows all answers which have a duplicate measurement for a triplet
         (unit, sample, question).
+
+        The first answer (lowest primary key) in a triplet is kept. All
+        others are candidates for deletion.
         """
-        queryset = Answer.objects.order_by('sample__account',
-            'sample', 'question', 'unit').values(
-            'sample', 'question', 'unit').annotate(Count('id')).filter(
-            id__count__gt=1)
-        count = queryset.count()
-        if show:
-            deletes = []
-            if count > 0:
-                self.stdout.write("count,unit,frozen,sample,account,question")
-            for answer in queryset:
-                duplicates = Answer.objects.filter(
-                    unit=answer['unit'],
-                    sample=answer['sample'],
-                    question=answer['question']).select_related(
-                    'unit', 'question', 'sample__account')
-                first = True
-                for duplicate in duplicates:
-                    self.stdout.write("%s,%s,%s,%s,%s,%s" % (
-                        duplicate.pk,
-                        duplicate.unit.slug,
-                        duplicate.sample.is_frozen,
-                        duplicate.sample.id,
-                        duplicate.sample.account.slug,
-                        duplicate.question.path))
-                    if first:
-                        first = False
-                        continue
-                    deletes += [duplicate.pk]
-                self.stdout.write("\n")
-            if show_fix and deletes:
-                self.stdout.write("DELETE FROM survey_answer WHERE id IN (%s);"
-                    % ','.join(deletes))
+        duplicates_query = """
+WITH ranked_answers AS (
+SELECT
+  survey_answer.id AS id,
+  survey_answer.sample_id AS sample_id,
+  survey_answer.question_id AS question_id,
+  survey_answer.unit_id AS unit_id,
+  ROW_NUMBER() OVER (
+    PARTITION BY survey_answer.sample_id, survey_answer.question_id,
+      survey_answer.unit_id
+    ORDER BY survey_answer.id) AS row_num,
+  COUNT(*) OVER (
+    PARTITION BY survey_answer.sample_id, survey_answer.question_id,
+      survey_answer.unit_id) AS nb_duplicates
+FROM survey_answer
+)
+SELECT
+  ranked_answers.id,
+  survey_unit.slug,
+  survey_sample.is_frozen,
+  ranked_answers.sample_id,
+  %(account_table)s.slug,
+  survey_question.path,
+  ranked_answers.row_num
+FROM ranked_answers
+INNER JOIN survey_unit
+  ON ranked_answers.unit_id = survey_unit.id
+INNER JOIN survey_question
+  ON ranked_answers.question_id = survey_question.id
+INNER JOIN survey_sample
+  ON ranked_answers.sample_id = survey_sample.id
+INNER JOIN %(account_table)s
+  ON survey_sample.account_id = %(account_table)s.id
+WHERE ranked_answers.nb_duplicates > 1
+ORDER BY %(account_table)s.slug, ranked_answers.sample_id,
+  ranked_answers.question_id, ranked_answers.unit_id, ranked_answers.row_num
+""" % {
+    'account_table': self.account_model._meta.db_table
+}
+        count = 0
+        deletes = []
+        with connection.cursor() as cursor:
+            cursor.execute(duplicates_query, params=None)
+            for row in cursor.fetchall():
+                answer_id = row[0]
+                row_num = row[6]
+                if row_num == 1:
+                    if show:
+                        if count == 0:
+                            self.stdout.write(
+                                "count,unit,frozen,sample,account,question")
+                        else:
+                            self.stdout.write("\n")
+                    count += 1
+                else:
+                    deletes += [answer_id]
+                if show:
+                    self.stdout.write("%s,%s,%s,%s,%s,%s" % row[:6])
+        if show_fix and deletes:
+            self.stdout.write("DELETE FROM survey_answer WHERE id IN (%s);"
+                % ','.join([str(answer_id) for answer_id in deletes]))
         self.stderr.write(
             "%d answers with same unit in (sample, question) pair" % count)
+        nb_fixed = self._delete_answers_in_batches(deletes)
+        if nb_fixed:
+            self.stderr.write("%d duplicate answers deleted" % nb_fixed)
+        return count, nb_fixed
 
 
-    def check_duplicate_samples(self, campaign, exclude_units=None,
+    def check_duplicate_samples(self, campaign=None, exclude_units=None,
                                 show=False):
         """
-        Shows all frozen samples that have the same answers per account
+        Shows all frozen samples that have the same answers as the frozen
+        sample that precedes them for the same account and campaign.
+
+        Answers in `exclude_units` are left out of the comparaison.
         """
-        #pylint:disable=too-many-locals
+        filters = ""
+        if campaign:
+            if not isinstance(campaign, Campaign):
+                campaign = Campaign.objects.get(slug=str(campaign))
+            filters = "AND survey_sample.campaign_id = %d" % campaign.pk
+        answers_filters = ""
         if exclude_units:
-            exclude_units = Unit.objects.filter(
-                slug__in=exclude_units).values_list('pk', flat=True)
-        if not isinstance(campaign, Campaign):
-            campaign = Campaign.objects.get(slug=str(campaign))
+            exclude_units = list(Unit.objects.filter(
+                slug__in=exclude_units).values_list('pk', flat=True))
+            if exclude_units:
+                answers_filters = "AND survey_answer.unit_id NOT IN (%s)" % (
+                    ','.join([str(unit_id) for unit_id in exclude_units]))
+        duplicates_query = """
+WITH frozen_samples AS (
+SELECT
+  survey_sample.id AS id,
+  survey_sample.slug AS slug,
+  survey_sample.account_id AS account_id,
+  survey_sample.campaign_id AS campaign_id,
+  LAG(survey_sample.id) OVER (
+    PARTITION BY survey_sample.account_id, survey_sample.campaign_id
+    ORDER BY survey_sample.created_at) AS prev_id,
+  LAG(survey_sample.slug) OVER (
+    PARTITION BY survey_sample.account_id, survey_sample.campaign_id
+    ORDER BY survey_sample.created_at) AS prev_slug
+FROM survey_sample
+WHERE survey_sample.is_frozen
+  AND survey_sample.extra IS NULL
+  %(filters)s
+), campaign_answers AS (
+SELECT
+  survey_answer.sample_id AS sample_id,
+  survey_answer.question_id AS question_id,
+  survey_answer.unit_id AS unit_id,
+  survey_answer.measured AS measured
+FROM survey_answer
+INNER JOIN frozen_samples
+  ON survey_answer.sample_id = frozen_samples.id
+INNER JOIN survey_enumeratedquestions
+  ON (survey_enumeratedquestions.campaign_id = frozen_samples.campaign_id AND
+      survey_enumeratedquestions.question_id = survey_answer.question_id)
+WHERE survey_answer.measured IS NOT NULL
+  %(answers_filters)s
+), nb_answers AS (
+SELECT sample_id, COUNT(*) AS nb_answers
+FROM campaign_answers
+GROUP BY sample_id
+), nb_matches AS (
+SELECT
+  frozen_samples.id AS sample_id,
+  COUNT(*) AS nb_matches
+FROM frozen_samples
+INNER JOIN campaign_answers AS answers
+  ON answers.sample_id = frozen_samples.id
+INNER JOIN campaign_answers AS prev_answers
+  ON (prev_answers.sample_id = frozen_samples.prev_id AND
+      prev_answers.question_id = answers.question_id AND
+      prev_answers.unit_id = answers.unit_id AND
+      prev_answers.measured = answers.measured)
+GROUP BY frozen_samples.id
+)
+SELECT
+  survey_campaign.slug,
+  frozen_samples.prev_slug,
+  frozen_samples.slug,
+  %(account_table)s.slug
+FROM frozen_samples
+INNER JOIN nb_answers
+  ON nb_answers.sample_id = frozen_samples.id
+INNER JOIN nb_answers AS prev_nb_answers
+  ON prev_nb_answers.sample_id = frozen_samples.prev_id
+INNER JOIN nb_matches
+  ON nb_matches.sample_id = frozen_samples.id
+INNER JOIN survey_campaign
+  ON frozen_samples.campaign_id = survey_campaign.id
+INNER JOIN %(account_table)s
+  ON frozen_samples.account_id = %(account_table)s.id
+WHERE nb_answers.nb_answers = prev_nb_answers.nb_answers
+  AND nb_matches.nb_matches = nb_answers.nb_answers
+ORDER BY survey_campaign.slug, %(account_table)s.slug
+""" % {
+    'account_table': self.account_model._meta.db_table,
+    'filters': filters,
+    'answers_filters': answers_filters
+}
         count = 0
-        for account in get_account_model().objects.all().order_by('slug'):
-            samples = Sample.objects.filter(
-                account=account, campaign=campaign,
-                is_frozen=True, extra__isnull=True).order_by(
-                'created_at')
-            samples_iter = iter(samples)
-            try:
-                first_sample = next(samples_iter)
-            except StopIteration:
-                first_sample = None
-            try:
-                second_sample = next(samples_iter)
-            except StopIteration:
-                second_sample = None
-
-            while first_sample and second_sample:
-                first_answers = Answer.objects.raw(sql_frozen_answers(
-                    [first_sample.pk], campaign=campaign))
-                second_answers = Answer.objects.raw(sql_frozen_answers(
-                    [second_sample.pk], campaign=campaign))
-                first_answers_count = len(first_answers)
-                second_answers_count = len(second_answers)
-                if first_answers_count != second_answers_count:
-                    LOGGER.debug("We have %d answers in sample %s"\
-                        " and %d answers in sample %s",
-                        first_answers_count, first_sample,
-                        second_answers_count, second_sample)
-                    try:
-                        first_sample = next(samples_iter)
-                    except StopIteration:
-                        first_sample = None
-                    try:
-                        second_sample = next(samples_iter)
-                    except StopIteration:
-                        second_sample = None
-                    continue
-
-                identical = True
-                for first_answer, second_answer in zip(first_answers,
-                                                       second_answers):
-                    if (exclude_units and
-                        first_answer.question_id == second_answer.question_id
-                        and first_answer.unit_id == second_answer.unit_id):
-                        if first_answer.unit_id in exclude_units:
-                            continue
-                    if (first_answer.question_id != second_answer.question_id or
-                        first_answer.unit_id != second_answer.unit_id or
-                        first_answer.measured != second_answer.measured):
-                        assert first_answer.question_id is not None
-                        assert first_answer.unit_id is not None
-                        assert first_answer.measured is not None
-                        assert second_answer.question_id is not None
-                        assert second_answer.unit_id is not None
-                        assert second_answer.measured is not None
-                        LOGGER.debug("Answer (%d, %d, %d) in sample %s"\
-                            " and answer (%d, %d, %d) in sample %s differ.",
-                            first_answer.question_id, first_answer.unit_id,
-                            first_answer.measured, first_sample,
-                            second_answer.question_id, second_answer.unit_id,
-                            second_answer.measured, second_sample)
-                        identical = False
-                        break
-                if identical:
-                    if show:
-                        self.stdout.write(
-                            "samples %s and %s for %s have identical answers."
-                            % (first_sample, second_sample, account))
-                    count += 1
-                    try:
-                        second_sample = next(samples_iter)
-                    except StopIteration:
-                        second_sample = None
-                else:
-                    try:
-                        first_sample = next(samples_iter)
-                    except StopIteration:
-                        first_sample = None
-                    try:
-                        second_sample = next(samples_iter)
-                    except StopIteration:
-                        second_sample = None
-        self.stderr.write("%d pair of samples with duplicate answers"\
-            " for campaign '%s'" % (count, campaign))
+        counts_by_campaigns = OrderedDict({
+            campaign.slug: 0 for campaign in (
+                [campaign] if campaign else Campaign.objects.order_by('slug'))})
+        with connection.cursor() as cursor:
+            cursor.execute(duplicates_query, params=None)
+            for row in cursor.fetchall():
+                campaign_slug, first_sample, second_sample, account_slug = row
+                if show:
+                    self.stdout.write(
+                        "samples %s and %s for %s have identical answers."
+                        % (first_sample, second_sample, account_slug))
+                counts_by_campaigns.update({
+                    campaign_slug: counts_by_campaigns.get(
+                        campaign_slug, 0) + 1})
+                count += 1
+        for campaign_slug, campaign_count in six.iteritems(counts_by_campaigns):
+            self.stderr.write("%d pair of samples with duplicate answers"\
+                " for campaign '%s'" % (campaign_count, campaign_slug))
+        return count
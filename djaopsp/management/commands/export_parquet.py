@@ -0,0 +1,102 @@
+# Copyright (c) 2026, DjaoDjin inc.
+# see LICENSE.
+
+"""
+Command to export answers, scorecards and engagement for a grantee
+as Parquet files.
+"""
+import datetime, logging, os
+
+from dateutil.relativedelta import relativedelta
+from django.core.management.base import BaseCommand, CommandError
+from survey.helpers import datetime_or_now
+from survey.models import Campaign, PortfolioDoubleOptIn, Sample
+from survey.utils import get_account_model
+
+from ...downloads.columnar import (ANSWERS_COLUMNS, DEFAULT_BATCH_SIZE,
+    ENGAGEMENT_COLUMNS, SCORECARDS_COLUMNS, get_answers_batches,
+    get_engagement_batches, get_scorecards_batches, is_parquet_available,
+    write_parquet)
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Export answers, scorecards and engagement as Parquet files"
+
+    account_model = get_account_model()
+    tables = ('answers', 'scorecards', 'engagement')
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--campaign', action='store',
+            help='Slug of the campaign')
+        parser.add_argument('--grantee', action='store',
+            help='Slug of grantee')
+        parser.add_argument('--table', action='append',
+            dest='tables', choices=self.tables,
+            help='Table to export (default: all)')
+        parser.add_argument('--starts_at', action='store',
+            help='Start date, in YYYY-MM-DD format')
+        parser.add_argument('--ends_at', action='store',
+            help='End date, in YYYY-MM-DD format')
+        parser.add_argument('--batch-size', action='store', type=int,
+            dest='batch_size', default=DEFAULT_BATCH_SIZE,
+            help='Number of rows per row group')
+        parser.add_argument('--output', action='store',
+            dest='output', default='.',
+            help='Directory where the Parquet files are written')
+
+    def handle(self, *args, **options):
+        #pylint:disable=too-many-locals
+        if not is_parquet_available():
+            raise CommandError("exporting Parquet files requires pyarrow.")
+        if not options['campaign'] or not options['grantee']:
+            raise CommandError("--campaign and --grantee are required.")
+
+        campaign = Campaign.objects.get(slug=options['campaign'])
+        grantee = self.account_model.objects.get(slug=options['grantee'])
+        ends_at = datetime_or_now(options['ends_at'])
+        starts_at = (datetime_or_now(options['starts_at'])
+            if options['starts_at'] else None)
+        batch_size = options['batch_size']
+        tables = options['tables'] if options['tables'] else self.tables
+
+        requested_accounts = list(PortfolioDoubleOptIn.objects.filter(
+            grantee=grantee, campaign=campaign).values_list(
+            'account_id', flat=True).distinct())
+        if requested_accounts:
+            latest_samples = Sample.objects.get_latest_frozen_by_accounts(
+                campaign=campaign, start_at=starts_at, ends_at=ends_at,
+                accounts=requested_accounts, grantees=[grantee], tags=[])
+        else:
+            latest_samples = Sample.objects.none()
+
+        for table in tables:
+            start_time = datetime.datetime.utcnow()
+            if table == 'scorecards':
+                columns = SCORECARDS_COLUMNS
+                batches = get_scorecards_batches(latest_samples,
+                    batch_size=batch_size)
+            elif table == 'engagement':
+                columns = ENGAGEMENT_COLUMNS
+                batches = get_engagement_batches(campaign,
+                    requested_accounts, [grantee],
+                    start_at=starts_at, ends_at=ends_at,
+                    batch_size=batch_size)
+            else:
+                columns = ANSWERS_COLUMNS
+                batches = get_answers_batches(latest_samples,
+                    batch_size=batch_size)
+            filename = os.path.join(options['output'], '%s-%s-%s.parquet' % (
+                grantee.slug, campaign.slug, table))
+            with open(filename, 'wb') as sink:
+                nb_rows = write_parquet(sink, columns, batches)
+            delta = relativedelta(datetime.datetime.utcnow(), start_time)
+            LOGGER.info("wrote %d rows (%d bytes) in %s in %d minutes,"\
+                " %d.%d seconds", nb_rows, os.path.getsize(filename),
+                filename, delta.minutes, delta.seconds, delta.microseconds)
+            self.stderr.write("wrote %d rows (%d bytes) in %s in %d minutes,"\
+                " %d.%d seconds\n" % (nb_rows, os.path.getsize(filename),
+                filename, delta.minutes, delta.seconds, delta.microseconds))
@@ -0,0 +1,67 @@
+# Copyright (c) 2026, DjaoDjin inc.
+# see LICENSE.
+
+"""
+Command to (re-)index URLs of supporting documents found in freetext answers.
+"""
+import datetime, logging
+
+from dateutil.relativedelta import relativedelta
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from survey.models import Answer, Choice, Unit
+
+from ...utils import index_supporting_documents
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Index URLs of supporting documents found in freetext answers"
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--campaign', action='append',
+            dest='campaigns',
+            help='Slug of the campaign (default: all campaigns)')
+        parser.add_argument('--batch-size', action='store', type=int,
+            dest='batch_size', default=1000,
+            help='Number of choices indexed in a single transaction')
+
+    def handle(self, *args, **options):
+        start_time = datetime.datetime.utcnow()
+        batch_size = options['batch_size']
+        # Choices with no URL and no documents indexed yet would not
+        # add anything to the index.
+        queryset = Choice.objects.filter(
+            Q(unit__system=Unit.SYSTEM_FREETEXT) &
+            (Q(text__contains='http') |
+             Q(supporting_documents__isnull=False))).distinct()
+        if options['campaigns']:
+            queryset = queryset.filter(pk__in=Answer.objects.filter(
+                unit__system=Unit.SYSTEM_FREETEXT,
+                sample__campaign__slug__in=options['campaigns']).values(
+                'measured'))
+
+        nb_choices = 0
+        nb_indexed = 0
+        choices = []
+        for choice in queryset.order_by('pk').iterator(chunk_size=batch_size):
+            choices += [choice]
+            if len(choices) >= batch_size:
+                nb_indexed += index_supporting_documents(choices)
+                nb_choices += len(choices)
+                choices = []
+        if choices:
+            nb_indexed += index_supporting_documents(choices)
+            nb_choices += len(choices)
+        LOGGER.info("indexed %d out of %d freetext choices",
+            nb_indexed, nb_choices)
+        self.stdout.write("indexed %d out of %d freetext choices\n" % (
+            nb_indexed, nb_choices))
+
+        end_time = datetime.datetime.utcnow()
+        delta = relativedelta(end_time, start_time)
+        self.stderr.write("completed in %d hours, %d minutes, %d.%d seconds\n"
+            % (delta.hours, delta.minutes, delta.seconds, delta.microseconds))
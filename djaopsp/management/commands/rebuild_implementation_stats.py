@@ -0,0 +1,48 @@
+# Copyright (c) 2026, DjaoDjin inc.
+# see LICENSE.
+
+"""
+Command to recompute implementation rate statistics from the latest
+frozen samples.
+"""
+import datetime, logging
+
+from dateutil.relativedelta import relativedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from survey.models import Campaign
+
+from ...sustainability.scores import rebuild_implementation_stats
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Recompute implementation rate statistics used for opportunities"
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--campaign', action='append',
+            dest='campaigns',
+            help='Slug of the campaign (default: all campaigns)')
+
+    def handle(self, *args, **options):
+        start_time = datetime.datetime.utcnow()
+        if options['campaigns']:
+            campaigns = Campaign.objects.filter(slug__in=options['campaigns'])
+        else:
+            campaigns = Campaign.objects.all()
+
+        for campaign in campaigns:
+            with transaction.atomic():
+                nb_questions = rebuild_implementation_stats(campaign)
+            LOGGER.info("rebuilt implementation stats for %d questions"\
+                " in campaign %s", nb_questions, campaign)
+            self.stdout.write("%s: %d questions\n" % (
+                campaign, nb_questions))
+
+        end_time = datetime.datetime.utcnow()
+        delta = relativedelta(end_time, start_time)
+        self.stderr.write("completed in %d hours, %d minutes, %d.%d seconds\n"
+            % (delta.hours, delta.minutes, delta.seconds, delta.microseconds))
@@ -0,0 +1,45 @@
+# Copyright (c) 2026, DjaoDjin inc.
+# see LICENSE.
+
+"""
+Command to (re-)build the index of segments candidates per campaign.
+"""
+import datetime, logging
+
+from dateutil.relativedelta import relativedelta
+from django.core.management.base import BaseCommand
+from survey.models import Campaign
+
+from ...utils import rebuild_segments_index
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Rebuild the index of segments candidates for campaigns"
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--campaign', action='append',
+            dest='campaigns',
+            help='Slug of the campaign (default: all campaigns)')
+
+    def handle(self, *args, **options):
+        start_time = datetime.datetime.utcnow()
+        if options['campaigns']:
+            campaigns = Campaign.objects.filter(slug__in=options['campaigns'])
+        else:
+            campaigns = Campaign.objects.all()
+
+        for campaign in campaigns:
+            segments_candidates = rebuild_segments_index(campaign)
+            LOGGER.info("rebuilt segments index with %d segments"\
+                " for campaign %s", len(segments_candidates), campaign)
+            self.stdout.write("%s: %d segments\n" % (
+                campaign, len(segments_candidates)))
+
+        end_time = datetime.datetime.utcnow()
+        delta = relativedelta(end_time, start_time)
+        self.stderr.write("completed in %d hours, %d minutes, %d.%d seconds\n"
+            % (delta.hours, delta.minutes, delta.seconds, delta.microseconds))
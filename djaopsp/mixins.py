@@ -24,6 +24,7 @@ from survey.utils import get_question_model, get_engaged_accounts
 from .compat import get_storage_class, gettext_lazy as _, reverse
 from .models import VerifiedSample, SurveyEvent
 from .utils import (get_account_model, get_campaign_candidates,
+    get_segments_answered, get_segments_answered_prefixes,
     get_segments_available, get_segments_candidates, get_unlocked)
 
 
@@ -331,10 +332,22 @@ class ReportMixin(SampleMixin, AccountMixin, TrailMixin):
                 Q(sample=self.sample) | Q(verifier_notes=self.sample)).first()
         return self._verification
 
+    @property
+    def segments_answered(self):
+        """
+        Prefixes of segments (including the mandatory segment) under which
+        there is at least one answer in the sample.
+        """
+        if not hasattr(self, '_segments_answered'):
+            self._segments_answered = get_segments_answered(self.sample,
+                get_segments_answered_prefixes(self.sample))
+        return self._segments_answered
+
     @property
     def segments_available(self):
         if not hasattr(self, '_segments_available'):
-            self._segments_available = get_segments_available(self.sample)
+            self._segments_available = get_segments_available(self.sample,
+                segments_answered=self.segments_answered)
         return self._segments_available
 
     @property
@@ -554,7 +567,8 @@ class SectionReportMixin(ReportMixin):
                         self.db_path.startswith(path)):
                         self._segments_available += [seg]
             else:
-                self._segments_available = get_segments_available(self.sample)
+                self._segments_available = get_segments_available(self.sample,
+                    segments_answered=self.segments_answered)
         return self._segments_available
 
 
@@ -8,7 +8,8 @@ from django.template.defaultfilters import slugify
 from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 from pages.models import PageElement
-from survey.models import Sample, get_extra_field_class, Campaign
+from survey.models import Campaign, Choice, Sample, get_extra_field_class
+from survey.settings import QUESTION_MODEL
 
 from .compat import gettext_lazy as _, python_2_unicode_compatible
 
@@ -103,6 +104,149 @@ class ScorecardCache(models.Model):
         unique_together = ('sample', 'path')
 
 
+@python_2_unicode_compatible
+class HighlightCache(models.Model):
+    """
+    Cache whether a frozen sample reports on each highlight defined
+    in its campaign, such that scorecards and dashboards do not have
+    to recompute highlights from answers.
+    """
+    sample = models.ForeignKey(Sample, on_delete=models.CASCADE,
+        related_name='highlight_cache')
+    slug = models.SlugField(
+        help_text=_("Unique identifier of the highlight in the campaign"))
+    reporting = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('sample', 'slug')
+
+    def __str__(self):
+        return "%s-%s" % (self.sample_id, self.slug)
+
+
+class SegmentAnsweredCache(models.Model):
+    """
+    Cache whether a frozen sample has at least one answer under each
+    segment prefix of its campaign, such that scorecards do not have
+    to join answers against segments on each render.
+    """
+    sample = models.ForeignKey(Sample, on_delete=models.CASCADE,
+        related_name='segment_answered_cache')
+    path = models.CharField(max_length=1024,
+        help_text=_("Prefix of questions in the segment"))
+    answered = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('sample', 'path')
+
+    def __str__(self):
+        return "%s-%s" % (self.sample_id, self.path)
+
+
+@python_2_unicode_compatible
+class SummaryPerformance(models.Model):
+    """
+    Number of planned improvements per category in an improvement plan,
+    such that the scorecard does not have to count them on each render.
+
+    The snapshot is stale when the sample was updated, or answers were
+    removed, since it was computed.
+    """
+    sample = models.OneToOneField(Sample, on_delete=models.CASCADE,
+        related_name='summary_performance')
+    updated_at = models.DateTimeField(
+        help_text=_("Date/time the sample was last updated when"\
+        " the snapshot was computed"))
+    nb_answers = models.IntegerField(default=0,
+        help_text=_("Number of answers in the sample when"\
+        " the snapshot was computed"))
+    energy_ghg_emissions = models.IntegerField(default=0)
+    water = models.IntegerField(default=0)
+    waste = models.IntegerField(default=0)
+
+    def __str__(self):
+        return "%s-summary-performance" % str(self.sample_id)
+
+
+@python_2_unicode_compatible
+class SupportingDocument(models.Model):
+    """
+    URL of a supporting document found in the text of a freetext
+    `Choice`, such that documents referenced in answers can be listed
+    without scanning every comment.
+
+    Answers, including their frozen copies, reference the freetext
+    choice through `Answer.measured`.
+    """
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE,
+        related_name='supporting_documents')
+    url = models.TextField(
+        help_text=_("URL of the supporting document"))
+    content_hash = models.CharField(max_length=64,
+        help_text=_("SHA-256 digest of the choice text the URL was"\
+        " extracted from"))
+
+    class Meta:
+        unique_together = ('choice', 'url')
+
+    def __str__(self):
+        return "%s-%s" % (self.choice_id, self.url)
+
+
+@python_2_unicode_compatible
+class ImplementationStats(models.Model):
+    """
+    Number of answers for each assessment choice to a question
+    in the latest frozen samples of a campaign, used to compute
+    implementation rates and peers-based opportunities.
+    """
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE,
+        related_name='implementation_stats')
+    question = models.ForeignKey(QUESTION_MODEL, on_delete=models.CASCADE,
+        related_name='implementation_stats')
+    nb_yes = models.IntegerField(default=0)
+    nb_mostly_yes = models.IntegerField(default=0)
+    nb_mostly_no = models.IntegerField(default=0)
+    nb_no = models.IntegerField(default=0)
+    nb_not_applicable = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('campaign', 'question')
+
+    def __str__(self):
+        return "%s-%s" % (self.campaign_id, self.question_id)
+
+
+@python_2_unicode_compatible
+class CampaignSegment(models.Model):
+    """
+    Segment that can be answered in a campaign, in the order returned
+    by `get_segments_candidates`, such that segments do not have to be
+    derived from questions paths and the content tree on each request.
+
+    A campaign without segments is indexed as a single row with
+    no `element`.
+    """
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE,
+        related_name='segments')
+    element = models.ForeignKey(PageElement, on_delete=models.CASCADE,
+        null=True, related_name='campaign_segments')
+    path = models.CharField(max_length=1024,
+        help_text=_("Path to the segment in the content tree"))
+    rank = models.IntegerField(default=0,
+        help_text=_("Position of the segment in the list of candidates"))
+    indent = models.IntegerField(default=0,
+        help_text=_("Depth of the segment in the content tree"))
+    mandatory = models.BooleanField(default=False,
+        help_text=_("Segment must be answered in a response"))
+
+    class Meta:
+        unique_together = ('campaign', 'path')
+
+    def __str__(self):
+        return "%s-%s" % (self.campaign_id, self.path)
+
+
 @python_2_unicode_compatible
 class VerifiedSample(models.Model):
     """
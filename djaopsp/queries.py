@@ -5,9 +5,11 @@ This file contains SQL statements as building blocks for benchmarking
 results in APIs, downloads, etc.
 """
 from django.db import connection
-from django.db.models.query import QuerySet, RawQuerySet
+from django.db.models import BooleanField, Case, Q, Value, When
+from django.db.models.query import (QuerySet, RawQuerySet,
+    prefetch_related_objects)
 from survey.models import Campaign, PortfolioDoubleOptIn, Sample
-from survey.queries import (as_sql_date_trunc, is_sqlite3,
+from survey.queries import (as_sql_date_trunc, as_sql_datetime, is_sqlite3,
     sql_latest_frozen_by_accounts, sql_latest_frozen_by_accounts_by_period)
 from survey.settings import DB_PATH_SEP
 from survey.utils import get_account_model
@@ -165,6 +167,330 @@ def get_latest_frozen_by_portfolio_by_period(campaign, grantees,
         tags=tags))
 
 
+def sql_answers_by_accounts(latest_samples_sql, prefix=None,
+                            verified=False, order_by_accounts=False):
+    """
+    Returns the SQL query for answers, as (path, account_id, measured,
+    unit_id, default_unit_id, unit title, choice text) tuples, to questions
+    prefixed by `prefix` in `latest_samples_sql`.
+
+    The results are ordered by path, then account_id, unless
+    `order_by_accounts` is `True`, in which case they are ordered
+    by account_id, then path.
+
+    When `verified` is `True`, the answers are the ones of the verifier notes
+    associated to `latest_samples_sql`, attributed to the verified account.
+    """
+    question_clause = ""
+    if prefix:
+        question_clause = ("WHERE survey_question.path LIKE '%s%%'"
+            % prefix)
+    if verified:
+        # When we are downloading the answers for a verification
+        # campaign, we add an indirection through `djaopsp_verifiedsample`
+        # to find the account the verification answers apply to (otherwise
+        # we would set the verifier account as a column label).
+        samples_sql = """latest_samples AS (
+    %(latest_assessments)s
+),
+samples AS (
+SELECT survey_sample.id,
+ survey_sample.slug,
+ survey_sample.created_at,
+ survey_sample.campaign_id,
+ latest_samples.account_id AS account_id,
+ survey_sample.is_frozen,
+ survey_sample.extra,
+ survey_sample.updated_at
+FROM survey_sample
+INNER JOIN djaopsp_verifiedsample
+ON djaopsp_verifiedsample.verifier_notes_id = survey_sample.id
+INNER JOIN latest_samples
+ON djaopsp_verifiedsample.sample_id = latest_samples.id
+WHERE djaopsp_verifiedsample.verified_status >= 2
+)""" % {'latest_assessments': latest_samples_sql}
+    else:
+        samples_sql = """samples AS (
+    %(latest_assessments)s
+)""" % {'latest_assessments': latest_samples_sql}
+
+    return """
+WITH %(samples_sql)s,
+answers AS (
+SELECT
+    survey_question.path,
+    samples.account_id,
+    survey_answer.measured,
+    survey_answer.unit_id,
+    survey_question.default_unit_id,
+    survey_unit.title
+FROM survey_answer
+INNER JOIN survey_question
+  ON survey_answer.question_id = survey_question.id
+INNER JOIN samples
+  ON survey_answer.sample_id = samples.id
+INNER JOIN survey_unit
+  ON survey_answer.unit_id = survey_unit.id
+%(question_clause)s
+)
+SELECT
+  answers.path,
+  answers.account_id,
+  answers.measured,
+  answers.unit_id,
+  answers.default_unit_id,
+  answers.title,
+  survey_choice.text
+FROM answers
+LEFT OUTER JOIN survey_choice
+  ON survey_choice.unit_id = answers.unit_id AND
+     survey_choice.id = answers.measured
+ORDER BY %(order_by)s
+""" % {
+        'samples_sql': samples_sql,
+        'question_clause': question_clause,
+        'order_by': ("answers.account_id, answers.path" if order_by_accounts
+            else "answers.path, answers.account_id")
+    }
+
+
+def get_cohorts_members(cohorts, accounts):
+    """
+    Returns the set of (account_id, cohort_id) pairs such that the account
+    is in `accounts` and matches the predicates of `EditableFilter` cohort.
+
+    All cohorts predicates are compiled into a single query, one boolean
+    column per cohort, instead of filtering `accounts` once per cohort.
+    """
+    if not cohorts:
+        return []
+    prefetch_related_objects(cohorts, 'predicates')
+    annotations = {}
+    for cohort in cohorts:
+        includes = {}
+        excludes = {}
+        for predicate in sorted(cohort.predicates.all(),
+                                key=lambda predicate: predicate.rank):
+            if predicate.selector == 'keepmatching':
+                includes.update(predicate.as_kwargs())
+            elif predicate.selector == 'removematching':
+                excludes.update(predicate.as_kwargs())
+        condition = None
+        if includes:
+            condition = Q(**includes)
+        if excludes:
+            # `~Q(**excludes)` would be tested against each joined row
+            # when a predicate spans a multi-valued relation, so we rely
+            # on `exclude()` to keep the same semantics as filtering
+            # the cohort accounts directly.
+            not_excluded = Q(pk__in=accounts.model.objects.exclude(
+                **excludes).values('pk'))
+            condition = (condition & not_excluded) if condition else (
+                not_excluded)
+        annotations['cohort_%d' % cohort.pk] = (Case(
+            When(condition, then=Value(True)),
+            default=Value(False), output_field=BooleanField())
+            if condition else Value(True, output_field=BooleanField()))
+
+    # Predicates spanning multi-valued relations might return an account
+    # more than once, hence the set.
+    members = set([])
+    fields = list(annotations.keys())
+    for row in accounts.annotate(**annotations).values_list('pk', *fields):
+        account_id = row[0]
+        for cohort, is_member in zip(cohorts, row[1:]):
+            if is_member:
+                members.add((account_id, cohort.pk))
+    return members
+
+
+def _sql_latest_frozen_by_account_campaign(filters_clause, grantees_join=""):
+    """
+    Returns the most recent frozen sample for each (account, campaign) pair
+    matching `filters_clause`.
+
+    PostgreSQL resolves the latest sample with a `DISTINCT ON` while SQLite3
+    falls back to a `ROW_NUMBER()` window.
+    """
+    if is_sqlite3():
+        return """SELECT
+  ranked_samples.id,
+  ranked_samples.slug,
+  ranked_samples.created_at,
+  ranked_samples.updated_at,
+  ranked_samples.campaign_id,
+  ranked_samples.account_id,
+  ranked_samples.is_frozen,
+  ranked_samples.time_spent,
+  ranked_samples.extra
+FROM (
+  SELECT
+    survey_sample.*,
+    ROW_NUMBER() OVER (
+      PARTITION BY survey_sample.account_id, survey_sample.campaign_id
+      ORDER BY survey_sample.created_at DESC) AS row_num
+  FROM survey_sample
+  %(grantees_join)s
+  WHERE survey_sample.is_frozen
+    %(filters_clause)s
+) AS ranked_samples
+WHERE ranked_samples.row_num = 1""" % {
+        'grantees_join': grantees_join,
+        'filters_clause': filters_clause
+    }
+    return """SELECT DISTINCT ON (
+    survey_sample.account_id, survey_sample.campaign_id)
+  survey_sample.*
+FROM survey_sample
+%(grantees_join)s
+WHERE survey_sample.is_frozen
+  %(filters_clause)s
+ORDER BY survey_sample.account_id, survey_sample.campaign_id,
+  survey_sample.created_at DESC""" % {
+        'grantees_join': grantees_join,
+        'filters_clause': filters_clause
+    }
+
+
+def sql_latest_frozen_by_portfolio_by_campaign(campaigns, grantees,
+                                               accounts=None,
+                                               start_at=None, ends_at=None):
+    """
+    Returns the latest frozen sample for each (account, campaign) pair
+    with `campaign` in `campaigns` and `account` in `accounts`, decorated
+    with a `state` that reflects if the sample was shared with `grantees`
+    and verified.
+
+    This is the same as calling `Sample.objects.get_latest_frozen_by_portfolios`
+    for each campaign, merging the results, and decorating them with
+    verification status, except it is done in a single query.
+    """
+    #pylint:disable=too-many-arguments
+    assert bool(grantees)
+    campaign_ids = ','.join([str(campaign.pk) for campaign in campaigns])
+    grantee_ids = []
+    for grantee in grantees:
+        try:
+            grantee_ids += [str(grantee.pk)]
+        except AttributeError:
+            grantee_ids += [str(grantee)]
+    grantee_ids = ','.join(grantee_ids)
+
+    filters_clause = (
+        " AND survey_sample.extra IS NULL"\
+        " AND survey_sample.campaign_id IN (%(campaign_ids)s)" % {
+            'campaign_ids': campaign_ids})
+    if start_at:
+        filters_clause += (
+            " AND survey_sample.created_at >= '%(start_at)s'" % {
+                'start_at': as_sql_datetime(start_at)})
+    if ends_at:
+        filters_clause += (
+            " AND survey_sample.created_at < '%(ends_at)s'" % {
+            'ends_at': as_sql_datetime(ends_at)})
+    if accounts:
+        account_ids = []
+        for account in accounts:
+            try:
+                account_ids += [str(account.pk)]
+            except AttributeError:
+                account_ids += [str(account)]
+        filters_clause += (
+            " AND survey_sample.account_id IN (%(account_ids)s)" % {
+            'account_ids': ','.join(account_ids)})
+
+    accessible_samples_sql_query = _sql_latest_frozen_by_account_campaign(
+        filters_clause + """
+    AND survey_sample.created_at < survey_portfolio.ends_at
+    AND survey_portfolio.grantee_id IN (%(grantee_ids)s)
+    AND (survey_portfolio.campaign_id = survey_sample.campaign_id OR
+         survey_portfolio.campaign_id IS NULL)""" % {
+             'grantee_ids': grantee_ids},
+        grantees_join="""INNER JOIN survey_portfolio
+  ON survey_portfolio.account_id = survey_sample.account_id""")
+    samples_sql_query = _sql_latest_frozen_by_account_campaign(filters_clause)
+                    # No grantees because we want the latest frozen
+                    # sample regardless if it was shared or not when
+                    # computing `last_completed_by_accounts`.
+
+    sql_query = """
+WITH accessible_samples AS (
+%(accessible_samples_sql_query)s
+),
+last_completed_by_accounts AS (
+%(samples_sql_query)s
+),
+completed_by_accounts AS (
+SELECT DISTINCT
+  COALESCE(accessible_samples.id, last_completed_by_accounts.id) AS id,
+  COALESCE(accessible_samples.slug, null) AS slug,
+  COALESCE(accessible_samples.created_at,
+    last_completed_by_accounts.created_at) AS created_at,
+  COALESCE(accessible_samples.campaign_id,
+    last_completed_by_accounts.campaign_id) AS campaign_id,
+  COALESCE(accessible_samples.account_id,
+    last_completed_by_accounts.account_id) AS account_id,
+  COALESCE(accessible_samples.is_frozen,
+    last_completed_by_accounts.is_frozen) AS is_frozen,
+  COALESCE(accessible_samples.time_spent, null) AS time_spent,
+  COALESCE(accessible_samples.extra, null) AS extra,
+  COALESCE(accessible_samples.updated_at,
+    last_completed_by_accounts.updated_at) AS updated_at,
+  CASE WHEN (accessible_samples.created_at IS NULL OR
+    accessible_samples.created_at < last_completed_by_accounts.created_at)
+    THEN %(REPORTING_COMPLETED_NOTSHARED)s
+    ELSE %(REPORTING_COMPLETED)s END AS reporting_status
+FROM last_completed_by_accounts
+LEFT OUTER JOIN accessible_samples
+  ON last_completed_by_accounts.account_id = accessible_samples.account_id
+  AND last_completed_by_accounts.campaign_id = accessible_samples.campaign_id
+INNER JOIN survey_portfolio
+  ON last_completed_by_accounts.account_id = survey_portfolio.account_id
+WHERE (survey_portfolio.campaign_id IS NULL OR
+  survey_portfolio.campaign_id = last_completed_by_accounts.campaign_id)
+  AND survey_portfolio.grantee_id IN (%(grantee_ids)s)
+)
+SELECT
+  completed_by_accounts.*,
+  CASE WHEN (djaopsp_verifiedsample.id IS NOT NULL AND
+    completed_by_accounts.reporting_status = %(REPORTING_COMPLETED)s)
+    THEN %(REPORTING_VERIFIED)s
+    ELSE completed_by_accounts.reporting_status
+    END AS state
+FROM completed_by_accounts
+LEFT OUTER JOIN djaopsp_verifiedsample
+  ON completed_by_accounts.id = djaopsp_verifiedsample.sample_id
+ORDER BY
+  completed_by_accounts.campaign_id,
+  completed_by_accounts.account_id,
+  completed_by_accounts.created_at
+""" % {
+    'accessible_samples_sql_query': accessible_samples_sql_query,
+    'samples_sql_query': samples_sql_query,
+    'grantee_ids': grantee_ids,
+    'REPORTING_COMPLETED': humanize.REPORTING_COMPLETED,
+    'REPORTING_COMPLETED_NOTSHARED': humanize.REPORTING_RESPONDED,
+    'REPORTING_VERIFIED': humanize.REPORTING_VERIFIED
+}
+    return sql_query
+
+
+def get_latest_frozen_by_portfolio_by_campaign(campaigns, grantees,
+                                               accounts=None,
+                                               start_at=None, ends_at=None):
+    """
+    Returns the latest frozen sample for each (account, campaign) pair
+    accessible to `grantees`.
+    """
+    #pylint:disable=too-many-arguments
+    campaigns = list(campaigns)
+    if not campaigns:
+        return Sample.objects.none()
+    return Sample.objects.raw(sql_latest_frozen_by_portfolio_by_campaign(
+        campaigns, grantees, accounts=accounts,
+        start_at=start_at, ends_at=ends_at))
+
+
 def _get_engagement_sql(campaign=None,
                         start_at=None, ends_at=None,
                         segment_prefix=None, segment_title="",
@@ -545,8 +871,17 @@ def get_requested_by_accounts_by_period(campaign, accounts, grantee,
     """
     Returns the most recent double-optin for each year between
     starts_at and ends_at for each account in accounts.
+
+    `campaign` can also be a list of campaigns, in which case the most
+    recent double-optin for each (account, campaign) pair is returned.
     """
     #pylint:disable=too-many-arguments
+    if isinstance(campaign, Campaign):
+        campaign_ids = str(campaign.pk)
+    else:
+        campaign_ids = ','.join([str(val.pk) for val in campaign])
+        if not campaign_ids:
+            return PortfolioDoubleOptIn.objects.none()
     date_range_clause = ""
     if start_at:
         date_range_clause = (
@@ -590,6 +925,7 @@ WITH accounts AS (
 SELECT
     accounts.slug AS account_slug,
     survey_portfoliodoubleoptin.account_id AS account_id,
+    survey_portfoliodoubleoptin.campaign_id AS campaign_id,
     survey_portfoliodoubleoptin.id AS id,
 --    survey_portfoliodoubleoptin.created_at AS created_at,
     last_updates.period AS created_at
@@ -597,22 +933,24 @@ FROM survey_portfoliodoubleoptin
 INNER JOIN (
     SELECT
         account_id,
+        campaign_id,
         %(as_period)s AS period,
         MAX(survey_portfoliodoubleoptin.created_at) AS last_updated_at
     FROM survey_portfoliodoubleoptin
     INNER JOIN accounts ON
         survey_portfoliodoubleoptin.account_id = accounts.id
-    WHERE survey_portfoliodoubleoptin.campaign_id = %(campaign_id)d AND
+    WHERE survey_portfoliodoubleoptin.campaign_id IN (%(campaign_ids)s) AND
           survey_portfoliodoubleoptin.state IN (%(optin_request_states)s) AND
           survey_portfoliodoubleoptin.grantee_id IN (%(grantees)s)
           %(date_range_clause)s
-    GROUP BY account_id, period) AS last_updates ON
+    GROUP BY account_id, campaign_id, period) AS last_updates ON
    survey_portfoliodoubleoptin.account_id = last_updates.account_id AND
+   survey_portfoliodoubleoptin.campaign_id = last_updates.campaign_id AND
    survey_portfoliodoubleoptin.created_at = last_updates.last_updated_at
 INNER JOIN accounts ON
    survey_portfoliodoubleoptin.account_id = accounts.id
 ORDER BY account_id, created_at
-""" % {'campaign_id': campaign.pk,
+""" % {'campaign_ids': campaign_ids,
        'accounts_query': accounts_query,
        'grantees': ",".join([str(grantee.pk)]),
        'as_period': as_sql_date_trunc(
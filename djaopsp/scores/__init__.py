@@ -1,5 +1,6 @@
 from .base import (ScoreCalculator, freeze_scores, get_score_calculator,
-    get_top_normalized_score, populate_rollup, populate_scorecard_cache)
+    get_top_normalized_score, populate_rollup, populate_scorecard_cache,
+    update_population_stats)
 
 __all__ = [
     'ScoreCalculator',
@@ -7,5 +8,6 @@ __all__ = [
     'get_score_calculator',
     'get_top_normalized_score',
     'populate_rollup',
-    'populate_scorecard_cache'
+    'populate_scorecard_cache',
+    'update_population_stats'
 ]
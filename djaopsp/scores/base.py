@@ -1,22 +1,34 @@
 # Copyright (c) 2024, DjaoDjin inc.
 # see LICENSE.
 
-import datetime, logging
+import datetime, logging, time, uuid
 
 from django.conf import settings
-from django.db.models import F, Max
+from django.core.cache import cache
+from django.core.signals import request_started
+from django.db import connection, transaction
+from django.db.models import DateTimeField, F, IntegerField, Max, Value
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+from pages.models import PageElement, RelationShip
 from survey.helpers import datetime_or_now
-from survey.models import Answer, Choice, Sample, Unit
+from survey.models import Answer, Campaign, Choice, Sample, Unit
+from survey.queries import is_sqlite3
 
 from ..compat import import_string, six
 from ..models import ScorecardCache
-from ..utils import get_score_weight, get_segments_candidates
+from ..utils import get_campaign_extra, get_segments_candidates
 
 
 LOGGER = logging.getLogger(__name__)
 
 SCORE_UNIT = 'points'
 
+# Key in the shared cache framework whose value changes each time
+# a campaign or its content is updated in any process.
+CAMPAIGN_STATES_VERSION_KEY = 'score_calculators_campaign_states_version'
+
 
 class ScoreCalculator(object):
     """
@@ -30,6 +42,29 @@ class ScoreCalculator(object):
         self.yes_no_unit_id = Unit.objects.get(slug='yes-no').pk
         self.yes = Choice.objects.get(
             unit_id=self.yes_no_unit_id, text='Yes').pk
+        self.campaign_states = {}
+
+    def get_campaign_state(self, campaign):
+        """
+        Returns a dictionnary in which a calculator can keep state derived
+        from *campaign* and its content (ex: score trees) across calls.
+
+        Calculators are instantiated once per process, so the state is kept
+        warm until the campaign or its content are updated in any process
+        (see `ScoreCalculatorRegistry.refresh_campaign_states`), and at most
+        `settings.SCORE_CALCULATORS_STATE_TIMEOUT` seconds.
+        """
+        campaign_key = campaign.pk if campaign else None
+        timeout = getattr(settings, 'SCORE_CALCULATORS_STATE_TIMEOUT', 0)
+        now = time.monotonic()
+        expires_at, state = self.campaign_states.get(campaign_key, (0, None))
+        if state is None or expires_at <= now:
+            state = {}
+            self.campaign_states[campaign_key] = (now + timeout, state)
+        return state
+
+    def reset_campaign_states(self):
+        self.campaign_states = {}
 
     def get_opportunity(self, campaign,
                         includes=None, excludes=None, prefix=None,
@@ -50,6 +85,23 @@ class ScoreCalculator(object):
         return []
 
 
+    def update_population_stats(self, sample, prefix=None):
+        """
+        Updates statistics on the population of peers with the answers
+        to questions under *prefix* frozen into *sample*, such that
+        peers-based opportunities do not have to be computed from all
+        answers each time.
+
+        `freeze_scores` calls this method for a segment before it derives
+        scores, then it is called with no *prefix* once all segments
+        of *sample* were frozen, to update statistics for all remaining
+        questions. These calls happen within the `transaction.atomic`
+        block that freezes *sample*.
+        """
+        #pylint:disable=unused-argument
+        return
+
+
     def get_scored_answers(self, campaign,
                            includes=None, excludes=None, prefix=None):
         """
@@ -63,9 +115,10 @@ class ScoreCalculator(object):
             question__path__startswith=prefix,
             measured=self.yes
         ).distinct().select_related('question')
+        campaign_extra = get_campaign_extra(campaign)
         for answer in queryset:
-            answer.measured = get_score_weight(
-                campaign, answer.question.path, default_value=0)
+            answer.measured = campaign_extra.get_score_weight(
+                answer.question.path, default_value=0)
 
             answer.numerator = answer.measured  # XXX for freeze_scores
             answer.unit_id = self.points_unit_id
@@ -77,6 +130,18 @@ class ScoreCalculator(object):
         return results
 
 
+    def get_scored_answers_sql(self, campaign,
+                               includes=None, excludes=None, prefix=None):
+        """
+        Returns a SQL query that computes the same scores as
+        `get_scored_answers`, such that scores can be frozen without
+        loading answers in Python, or `None` when scores can only be
+        computed in Python.
+        """
+        #pylint:disable=unused-argument
+        return None
+
+
     def get_scorecards(self, campaign, prefix, title=None, includes=None,
                        bypass_cache=False):
         """
@@ -150,6 +215,76 @@ class ScoreCalculator(object):
         return scorecard_caches
 
 
+def _copy_answers(answers, score_sample, created_at):
+    """
+    Copies *answers* into *score_sample* with a single
+    INSERT ... SELECT statement. Returns the number of answers copied.
+    """
+    select_sql, select_params = answers.annotate(
+        frozen_at=Value(created_at, output_field=DateTimeField()),
+        frozen_sample_id=Value(score_sample.pk, output_field=IntegerField())
+    ).order_by('pk').values_list('question_id', 'unit_id', 'measured',
+        'denominator', 'collected_by_id', 'frozen_at',
+        'frozen_sample_id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("""INSERT INTO %(answer_table)s
+  (question_id, unit_id, measured, denominator, collected_by_id,
+   created_at, sample_id)
+%(select_sql)s""" % {
+            'answer_table': Answer._meta.db_table,
+            'select_sql': select_sql
+        }, select_params)
+        return cursor.rowcount
+
+
+def _insert_scored_answers(scored_answers_sql, sample, score_sample,
+                           created_at, points_unit_id, collected_by=None):
+    """
+    Inserts the scores computed by *scored_answers_sql* for answers
+    in *sample* into *score_sample*, in a single INSERT ... SELECT
+    statement. Returns the number of scored answers inserted.
+
+    *scored_answers_sql* must return rows with `id` (question), `answer_id`,
+    `is_planned`, `numerator` and `denominator` columns.
+    """
+    #pylint:disable=too-many-arguments
+    params = [created_at, points_unit_id,
+        collected_by.pk if collected_by else None, score_sample.pk]
+    if sample.extra is None:
+        is_planned_clause = "scored_answers.is_planned IS NULL"
+    else:
+        is_planned_clause = "scored_answers.is_planned = %s"
+        params += [sample.extra]
+    # Python's `int()` truncates the fractional part of a score while
+    # PostgreSQL rounds when a float is cast to an integer.
+    if is_sqlite3():
+        as_integer = "CAST(%s AS INTEGER)"
+    else:
+        as_integer = "CAST(TRUNC(%s) AS INTEGER)"
+    with connection.cursor() as cursor:
+        cursor.execute("""INSERT INTO %(answer_table)s
+  (created_at, unit_id, collected_by_id, sample_id,
+   question_id, measured, denominator)
+SELECT
+  %%s, %%s, %%s, %%s,
+  scored_answers.id,
+  %(numerator)s,
+  %(denominator)s
+FROM (%(scored_answers)s) AS scored_answers
+WHERE scored_answers.answer_id IS NOT NULL
+  AND %(is_planned_clause)s
+  AND (COALESCE(scored_answers.numerator, 0) <> 0
+    OR COALESCE(scored_answers.denominator, 0) <> 0)""" % {
+            'answer_table': Answer._meta.db_table,
+            'numerator': as_integer % "scored_answers.numerator",
+            'denominator': as_integer % "scored_answers.denominator",
+            # The query is used as a format string by the database driver.
+            'scored_answers': scored_answers_sql.replace('%', '%%'),
+            'is_planned_clause': is_planned_clause
+        }, params)
+        return cursor.rowcount
+
+
 def freeze_scores(sample, excludes=None, collected_by=None, created_at=None,
                   segment_path=None, score_sample=None):
     """
@@ -182,54 +317,60 @@ def freeze_scores(sample, excludes=None, collected_by=None, created_at=None,
         sample.extra, score_sample)
     # Copy the actual answers inputted by users
     points_unit_id = Unit.objects.get(slug=SCORE_UNIT).pk
-    user_answers = []
-    for answer in Answer.objects.filter(
-            sample=sample,
-            question__enumeratedquestions__campaign=sample.campaign,
-            question__path__startswith=segment_path).exclude(
-                unit_id=points_unit_id):
-        answer.pk = None
-        answer.created_at = created_at
-        answer.sample = score_sample
-        user_answers += [answer]
-        LOGGER.debug("save(created_at=%s, question_id=%s, unit_id=%s,"\
-            " measured=%s, denominator=%s, collected_by=%s,"\
-            " sample=%s)",
-            answer.created_at, answer.question_id, answer.unit_id,
-            answer.measured, answer.denominator, answer.collected_by,
-            answer.sample)
-    Answer.objects.bulk_create(user_answers)
+    user_answers = Answer.objects.filter(
+        sample=sample,
+        question__enumeratedquestions__campaign=sample.campaign,
+        question__path__startswith=segment_path).exclude(
+            unit_id=points_unit_id)
+    nb_user_answers = _copy_answers(user_answers, score_sample, created_at)
+    LOGGER.info("copied %d answers from %s to %s for segment '%s'",
+        nb_user_answers, sample, score_sample, segment_path)
 
     # Create frozen scores for answers we can derive a score from
     # (i.e. assessment).
     calculator = get_score_calculator(segment_path)
     if calculator:
-        score_answers = []
-        calculator_answers = calculator.get_scored_answers(
+        # The answers just copied are part of the population of peers
+        # used to derive the scores below.
+        calculator.update_population_stats(score_sample, prefix=segment_path)
+        scored_answers_sql = None
+        if sample.extra is None or isinstance(sample.extra, six.string_types):
+            scored_answers_sql = calculator.get_scored_answers_sql(
                 sample.campaign, includes=[sample], prefix=segment_path,
                 excludes=excludes)
-        for decorated_answer in calculator_answers:
-            if (decorated_answer.answer_id and
-                decorated_answer.is_planned == sample.extra):
-                numerator = decorated_answer.numerator
-                denominator = decorated_answer.denominator
-                if numerator or denominator:
-                    LOGGER.debug("create(created_at=%s, question_id=%s,"\
-                        " unit_id=%s, measured=%s, denominator=%s,"\
-                        " collected_by=%s, sample=%s)",
-                        created_at, decorated_answer.id, points_unit_id,
-                        numerator, denominator, collected_by, score_sample)
-                    score_answers += [Answer(
-                        created_at=created_at,
-                        question_id=decorated_answer.id,
-                        unit_id=points_unit_id,
-                        measured=numerator,
-                        denominator=denominator,
-                        collected_by=collected_by,
-                        sample=score_sample)]
+        if scored_answers_sql:
+            nb_score_answers = _insert_scored_answers(scored_answers_sql,
+                sample, score_sample, created_at, points_unit_id,
+                collected_by=collected_by)
+        else:
+            score_answers = []
+            calculator_answers = calculator.get_scored_answers(
+                    sample.campaign, includes=[sample], prefix=segment_path,
+                    excludes=excludes)
+            for decorated_answer in calculator_answers:
+                if (decorated_answer.answer_id and
+                    decorated_answer.is_planned == sample.extra):
+                    numerator = decorated_answer.numerator
+                    denominator = decorated_answer.denominator
+                    if numerator or denominator:
+                        LOGGER.debug("create(created_at=%s, question_id=%s,"\
+                            " unit_id=%s, measured=%s, denominator=%s,"\
+                            " collected_by=%s, sample=%s)",
+                            created_at, decorated_answer.id, points_unit_id,
+                            numerator, denominator, collected_by,
+                            score_sample)
+                        score_answers += [Answer(
+                            created_at=created_at,
+                            question_id=decorated_answer.id,
+                            unit_id=points_unit_id,
+                            measured=numerator,
+                            denominator=denominator,
+                            collected_by=collected_by,
+                            sample=score_sample)]
+            Answer.objects.bulk_create(score_answers)
+            nb_score_answers = len(score_answers)
         LOGGER.info("write %d scored answers in %s for segment '%s'",
-            len(score_answers), score_sample, segment_path)
-        Answer.objects.bulk_create(score_answers)
+            nb_score_answers, score_sample, segment_path)
 
     # Update date of active sample to be later than all frozen ones.
     # the newsfeed (`NewsfeedAPIView`) relies on `updated_at > created_at`
@@ -242,16 +383,120 @@ def freeze_scores(sample, excludes=None, collected_by=None, created_at=None,
     return score_sample
 
 
+class ScoreCalculatorRegistry(object):
+    """
+    Calculators defined in `settings.SCORE_CALCULATORS`, imported
+    and instantiated once per process.
+    """
+
+    def __init__(self):
+        self._calculators = None
+        self.campaign_states_version = None
+
+    @property
+    def calculators(self):
+        """
+        (root_path, calculator) pairs, sorted by longest root path first
+        such that the first matching root path is the longest prefix.
+        """
+        if self._calculators is None:
+            calculators = []
+            for root_path, calculator_class in six.iteritems(
+                    settings.SCORE_CALCULATORS):
+                calculators += [
+                    (root_path, import_string(calculator_class)())]
+            self._calculators = sorted(calculators,
+                key=lambda calculator: len(calculator[0]), reverse=True)
+        return self._calculators
+
+    def get_calculator(self, segment_path):
+        for root_path, calculator in self.calculators:
+            if segment_path.startswith(root_path):
+                return calculator
+        return None
+
+    def reset(self):
+        self._calculators = None
+
+    def reset_campaign_states(self):
+        if self._calculators:
+            for _, calculator in self._calculators:
+                calculator.reset_campaign_states()
+
+    def refresh_campaign_states(self):
+        """
+        Resets the campaign states of all calculators when a campaign
+        or its content were updated in another process since the last
+        refresh (see `CAMPAIGN_STATES_VERSION_KEY`).
+        """
+        if not self._calculators:
+            # No state to reset.
+            return
+        version = cache.get(CAMPAIGN_STATES_VERSION_KEY)
+        if version != self.campaign_states_version:
+            self.campaign_states_version = version
+            self.reset_campaign_states()
+
+
+SCORE_CALCULATORS_REGISTRY = ScoreCalculatorRegistry()
+
+
 def get_score_calculator(segment_path):
     """
     Returns a specific calculator for scores if one exists for
-    the `segment_path`, otherwise return a default calculator.
+    the `segment_path`, otherwise returns `None`.
     """
-    for root_path, calculator_class in six.iteritems(
-            settings.SCORE_CALCULATORS):
-        if segment_path.startswith(root_path):
-            return import_string(calculator_class)()
-    return None
+    return SCORE_CALCULATORS_REGISTRY.get_calculator(segment_path)
+
+
+@receiver(setting_changed, dispatch_uid="score_calculators_setting_changed")
+def reload_score_calculators(sender, setting, **kwargs):
+    #pylint:disable=unused-argument
+    if setting == 'SCORE_CALCULATORS':
+        SCORE_CALCULATORS_REGISTRY.reset()
+
+
+@receiver(post_save, sender=Campaign,
+    dispatch_uid="score_calculators_campaign_saved")
+@receiver(post_delete, sender=Campaign,
+    dispatch_uid="score_calculators_campaign_deleted")
+@receiver(post_save, sender=PageElement,
+    dispatch_uid="score_calculators_element_saved")
+@receiver(post_delete, sender=PageElement,
+    dispatch_uid="score_calculators_element_deleted")
+@receiver(post_save, sender=RelationShip,
+    dispatch_uid="score_calculators_relationship_saved")
+@receiver(post_delete, sender=RelationShip,
+    dispatch_uid="score_calculators_relationship_deleted")
+def reset_score_calculators_states(sender, **kwargs):
+    """
+    Resets the campaign states of calculators, then notifies other
+    processes once the current transaction is committed.
+    Changes to the text of an element do not affect the states.
+    """
+    #pylint:disable=unused-argument
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and not set(update_fields) - {'text'}:
+        return
+    SCORE_CALCULATORS_REGISTRY.reset_campaign_states()
+    # Content is updated through many saves (ex: an import) in the same
+    # transaction, so we only schedule one notification.
+    if not any(entry[1] is _bump_campaign_states_version
+               for entry in transaction.get_connection().run_on_commit):
+        transaction.on_commit(_bump_campaign_states_version)
+
+
+def _bump_campaign_states_version():
+    version = uuid.uuid4().hex
+    cache.set(CAMPAIGN_STATES_VERSION_KEY, version, None)
+    # States were already reset in this process.
+    SCORE_CALCULATORS_REGISTRY.campaign_states_version = version
+
+
+@receiver(request_started, dispatch_uid="score_calculators_request_started")
+def refresh_score_calculators_states(sender, **kwargs):
+    #pylint:disable=unused-argument
+    SCORE_CALCULATORS_REGISTRY.refresh_campaign_states()
 
 
 def get_top_normalized_score(sample, segments_candidates=None):
@@ -498,6 +743,24 @@ def populate_rollup(rollup_tree, normalize_to_one, force_score=False):
             scores, normalize_to_one=normalize_to_one, force_score=force_score)
 
 
+def update_population_stats(sample, segment_paths):
+    """
+    Updates statistics on the population of peers for the answers
+    frozen into *sample* that were not already counted while their
+    segment was scored (see `ScoreCalculator.update_population_stats`),
+    once all *segment_paths* were frozen.
+
+    This function must be executed in a `transaction.atomic` block.
+    """
+    calculators = []
+    for segment_path in segment_paths:
+        calculator = get_score_calculator(segment_path)
+        if calculator and calculator not in calculators:
+            calculators += [calculator]
+    for calculator in calculators:
+        calculator.update_population_stats(sample)
+
+
 def populate_scorecard_cache(sample, calculator, segment_path, segment_title):
     LOGGER.info("populate %s scorecard cache for %s based of sample %s",
         sample.account, segment_path, str(sample))
@@ -41,6 +41,24 @@ DEFAULT_FILE_STORAGE = "django.core.files.storage.FileSystemStorage"
 
 DEFAULT_FORCE_FREEZE = False
 
+# Number of seconds a dashboard payload is reused across requests
+# for the same view, account and filters. `0` disables the cache.
+DASHBOARD_CACHE_TIMEOUT = 0
+
+# Maximum number of seconds a process keeps scores trees and other
+# state derived from a campaign content. Updates to the content in
+# a process are also picked up through the cache framework by other
+# processes sharing that cache. `0` disables the state.
+SCORE_CALCULATORS_STATE_TIMEOUT = 60
+
+# Maximum number of seconds a process keeps units and their choices
+# before reloading them from the database.
+UNITS_CACHE_TIMEOUT = 300
+
+# Number of bytes a download (.pptx, .xlsx) is kept in memory before
+# it is written to a temporary file on disk.
+DOWNLOAD_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
 update_settings(sys.modules[__name__],
     load_config(APP_NAME, 'credentials', 'site.conf', verbose=True))
 
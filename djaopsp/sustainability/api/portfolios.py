@@ -1,14 +1,19 @@
 # Copyright (c) 2024, DjaoDjin inc.
 # see LICENSE.
 
+import functools, operator
+
 from dateutil.relativedelta import relativedelta
 from django.db import connection
 from django.db.models import Count, Q
 from rest_framework import generics
 from rest_framework.response import Response
 from survey.helpers import datetime_or_now, construct_yearly_periods
+from survey.queries import as_sql_datetime, is_sqlite3
+from survey.utils import get_question_model
 
 from djaopsp.api.portfolios import DashboardAggregateMixin
+from djaopsp.compat import six
 from djaopsp.helpers import as_percentage
 
 
@@ -105,7 +110,7 @@ class GoalsAPIView(GoalsMixin, generics.RetrieveAPIView):
     schema = None # XXX temporarily disabled API docs
 
     def retrieve(self, request, *args, **kwargs):
-        return Response(self.get_response_data(request, *args, **kwargs))
+        return Response(self.response_data)
 
 
 class BySegmentsMixin(DashboardAggregateMixin):
@@ -192,7 +197,7 @@ class BySegmentsAPIView(BySegmentsMixin, generics.RetrieveAPIView):
     schema = None
 
     def retrieve(self, request, *args, **kwargs):
-        return Response(self.get_response_data(request, *args, **kwargs))
+        return Response(self.response_data)
 
 
 
@@ -261,7 +266,7 @@ class GHGEmissionsRateAPIView(GHGEmissionsRateMixin, generics.RetrieveAPIView):
     schema = None # XXX temporarily disabled API docs
 
     def retrieve(self, request, *args, **kwargs):
-        return Response(self.get_response_data(request, *args, **kwargs))
+        return Response(self.response_data)
 
 
 class GHGEmissionsAmountMixin(DashboardAggregateMixin):
@@ -280,80 +285,126 @@ class GHGEmissionsAmountMixin(DashboardAggregateMixin):
                 # to column labels.
 
 
-    @staticmethod
-    def get_scope_query(path, accounts, ends_at):
+    # Only scope 1 and scope 2 emissions are added up in the chart.
+    scopes_paths = (
+        'ghg-emissions-total-scope-1-emissions',
+        'ghg-emissions-total-scope-2-emissions',
+    )
+    unit_slug = 't-year'
+
+    @property
+    def scopes_question_ids(self):
+        """
+        Ids of questions whose path ends with one of `scopes_paths`, keyed
+        by scope index in `scopes_paths`.
+
+        The ids are resolved once such that the aggregate query can use
+        an index on `survey_answer.question_id` instead of matching paths
+        with a suffix LIKE.
+        """
+        #pylint:disable=attribute-defined-outside-init
+        if not hasattr(self, '_scopes_question_ids'):
+            self._scopes_question_ids = {}
+            for question_id, path in get_question_model().objects.filter(
+                    functools.reduce(operator.or_, [
+                        Q(path__endswith=scope_path)
+                        for scope_path in self.scopes_paths])).values_list(
+                    'pk', 'path'):
+                for scope, scope_path in enumerate(self.scopes_paths):
+                    if path.endswith(scope_path):
+                        self._scopes_question_ids.setdefault(
+                            scope, []).append(question_id)
+        return self._scopes_question_ids
+
+    def get_scopes_query(self, accounts, labels):
+        """
+        Returns the SQL query for the total emissions, per label and scope,
+        of the latest frozen answers of `accounts` created before each label.
+
+        The query returns (label index, scope index, total) rows.
+
+        To keep this query fast on large datasets, we recommend a composite
+        index on `survey_answer` (question_id, unit_id, created_at).
+        """
+        if is_sqlite3():
+            periods = ["(%d, '%s')" % (idx, as_sql_datetime(label))
+                for idx, label in enumerate(labels)]
+        else:
+            periods = ["(%d, '%s'::timestamptz)" % (
+                idx, as_sql_datetime(label))
+                for idx, label in enumerate(labels)]
+        scope_cases = ["WHEN survey_answer.question_id IN (%s) THEN %d" % (
+            ','.join([str(question_id) for question_id in question_ids]),
+            scope)
+            for scope, question_ids in six.iteritems(
+                self.scopes_question_ids)]
         return """
-WITH lastest_scope_emissions AS (
+WITH periods (label_idx, ends_at) AS (
+VALUES %(periods)s
+),
+scope_emissions AS (
 SELECT
   survey_sample.account_id,
-  MAX(survey_answer.created_at) AS created_at
+  CASE %(scope_cases)s END AS scope,
+  survey_answer.created_at,
+  survey_answer.measured
 FROM survey_answer
-INNER JOIN survey_question
-  ON survey_answer.question_id = survey_question.id
 INNER JOIN survey_sample
   ON survey_answer.sample_id = survey_sample.id
-WHERE survey_question.path LIKE '%%%(path)s'
+WHERE survey_answer.question_id IN (%(question_ids)s)
   AND survey_sample.account_id IN (%(account_ids)s)
   AND survey_sample.is_frozen
   AND survey_sample.extra IS NULL
-  AND survey_answer.unit_id = (SELECT id FROM survey_unit WHERE slug='t-year')
-  AND survey_answer.created_at < '%(ends_at)s'
-GROUP BY survey_sample.account_id)
-SELECT survey_sample.account_id AS account_id,
-       survey_answer.created_at AS created_at,
-       measured
-FROM survey_answer
-INNER JOIN survey_question
-  ON survey_answer.question_id = survey_question.id
-INNER JOIN survey_sample
-  ON survey_answer.sample_id = survey_sample.id
-INNER JOIN lastest_scope_emissions
-  ON survey_answer.created_at = lastest_scope_emissions.created_at
-WHERE survey_question.path LIKE '%%%(path)s'
-  AND survey_sample.account_id IN (%(account_ids)s)
-  AND survey_sample.is_frozen
-  AND survey_sample.extra IS NULL
-  AND survey_answer.unit_id = (SELECT id FROM survey_unit WHERE slug='t-year')
-""" % {'path': path,
+  AND survey_answer.unit_id = (
+    SELECT id FROM survey_unit WHERE slug='%(unit_slug)s')
+),
+latest_scope_emissions AS (
+SELECT
+  periods.label_idx,
+  scope_emissions.scope,
+  scope_emissions.account_id,
+  MAX(scope_emissions.created_at) AS created_at
+FROM periods
+INNER JOIN scope_emissions
+  ON scope_emissions.created_at < periods.ends_at
+GROUP BY periods.label_idx, scope_emissions.scope, scope_emissions.account_id
+)
+SELECT
+  latest_scope_emissions.label_idx,
+  latest_scope_emissions.scope,
+  SUM(scope_emissions.measured)
+FROM latest_scope_emissions
+INNER JOIN scope_emissions
+  ON scope_emissions.account_id = latest_scope_emissions.account_id
+  AND scope_emissions.scope = latest_scope_emissions.scope
+  AND scope_emissions.created_at = latest_scope_emissions.created_at
+GROUP BY latest_scope_emissions.label_idx, latest_scope_emissions.scope
+""" % {'periods': ','.join(periods),
+       'scope_cases': ' '.join(scope_cases),
+       'question_ids': ','.join([str(question_id)
+            for question_ids in six.itervalues(self.scopes_question_ids)
+            for question_id in question_ids]),
        'account_ids': ','.join([str(account.pk) for account in accounts]),
-       'ends_at': ends_at}
+       'unit_slug': self.unit_slug}
 
     def get_aggregate(self, account=None, labels=None, aggregate_set=False):
         if not labels:
             raise ValueError("labels cannot be `None`")
-        values = []
+        totals = [0 for _ in labels]
         reporting_accounts = self.get_engaged_accounts(
             account, aggregate_set=aggregate_set)
-        for label in labels:
-            scope1_total = 0
-            scope2_total = 0
-            if reporting_accounts:
-                scope1_emissions = self.get_scope_query(
-                    'ghg-emissions-total-scope-1-emissions',
-                    reporting_accounts,
-                    label)
-                scope2_emissions = self.get_scope_query(
-                    'ghg-emissions-total-scope-2-emissions',
-                    reporting_accounts,
-                    label)
-                with connection.cursor() as cursor:
-                    cursor.execute(scope1_emissions, params=None)
-                    for emissions in cursor.fetchall():
-                        # for reference:
-                        #   account_id = emissions[0]
-                        #   created_at = emissions[1]
-                        measured = emissions[2]
-                        scope1_total += measured
-                with connection.cursor() as cursor:
-                    cursor.execute(scope2_emissions, params=None)
-                    for emissions in cursor.fetchall():
-                        # for reference:
-                        #   account_id = emissions[0]
-                        #   created_at = emissions[1]
-                        measured = emissions[2]
-                        scope2_total += measured
-            values += [[label, scope1_total + scope2_total]]
-        return values
+        if reporting_accounts and self.scopes_question_ids:
+            # All scopes for all labels are computed in a single query.
+            with connection.cursor() as cursor:
+                cursor.execute(self.get_scopes_query(
+                    reporting_accounts, labels), params=None)
+                for emissions in cursor.fetchall():
+                    # for reference:
+                    #   scope = emissions[1]
+                    label_idx = emissions[0]
+                    measured = emissions[2]
+                    totals[label_idx] += measured
+        return [[label, total] for label, total in zip(labels, totals)]
 
 
 class GHGEmissionsAmountAPIView(GHGEmissionsAmountMixin,
@@ -396,4 +447,4 @@ class GHGEmissionsAmountAPIView(GHGEmissionsAmountMixin,
     schema = None # XXX temporarily disabled API docs
 
     def retrieve(self, request, *args, **kwargs):
-        return Response(self.get_response_data(request, *args, **kwargs))
+        return Response(self.response_data)
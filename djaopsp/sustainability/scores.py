@@ -3,18 +3,20 @@
 
 from __future__ import unicode_literals
 
-import logging
+import copy, logging
 from collections import namedtuple
 
 from django.db import connection
+from django.db.models import Count, F, Max
 from pages.models import PageElement, flatten_content_tree
-from survey.models import Unit
+from survey.models import Answer, Campaign, Unit
 
 from ..compat import six
-from ..models import Sample, ScorecardCache
+from ..models import ImplementationStats, Sample, ScorecardCache
 from ..scores.base import (ScoreCalculator as ScoreCalculatorBase,
     populate_rollup)
-from ..utils import (get_highlights, get_scores_tree, get_leafs)
+from ..utils import (get_highlights_by_samples, get_scores_tree,
+    get_leafs)
 
 
 LOGGER = logging.getLogger(__name__)
@@ -38,6 +40,14 @@ ASSESSMENT_ANSWERS = {
 
 ASSESSMENT_UNIT = 'assessment'
 
+IMPLEMENTATION_STATS_FIELDS = {
+    YES: 'nb_yes',
+    NEEDS_MODERATE_IMPROVEMENT: 'nb_mostly_yes',
+    NEEDS_SIGNIFICANT_IMPROVEMENT: 'nb_mostly_no',
+    NO: 'nb_no',
+    NOT_APPLICABLE: 'nb_not_applicable'
+}
+
 
 class ScoreCalculator(ScoreCalculatorBase):
     """
@@ -66,9 +76,7 @@ class ScoreCalculator(ScoreCalculatorBase):
         # and filtering them out through the `survey_enumeratedquestions`
         # table in `get_expected_opportunities`.
         if not last_frozen_assessments:
-            last_frozen_assessments = \
-                Sample.objects.get_latest_frozen_by_accounts(
-                    campaign=campaign, tags=[])
+            last_frozen_assessments = _get_latest_frozen_population(campaign)
         results = []
         scored_answers = _get_scored_answers(
             last_frozen_assessments, self.assessment_unit_id,
@@ -114,14 +122,19 @@ class ScoreCalculator(ScoreCalculatorBase):
         return results
 
 
+    def get_scored_answers_sql(self, campaign,
+                               includes=None, excludes=None, prefix=None):
+        #pylint:disable=unused-argument
+        return _get_scored_answers(_get_latest_frozen_population(campaign),
+            self.assessment_unit_id, includes=includes, prefix=prefix)
+
+
     def get_scored_answers(self, campaign,
                            includes=None, excludes=None, prefix=None):
         #pylint:disable=too-many-arguments
         with connection.cursor() as cursor:
-            scored_answers = _get_scored_answers(
-                Sample.objects.get_latest_frozen_by_accounts(
-                    campaign=campaign, tags=[]),
-                self.assessment_unit_id, includes=includes, prefix=prefix)
+            scored_answers = self.get_scored_answers_sql(campaign,
+                includes=includes, excludes=excludes, prefix=prefix)
             cursor.execute(scored_answers, params=None)
             col_headers = cursor.description
             decorated_answer_tuple = namedtuple(
@@ -131,6 +144,33 @@ class ScoreCalculator(ScoreCalculatorBase):
         return results
 
 
+    def get_scores_tree(self, campaign, prefix):
+        """
+        Returns a copy of the scores tree rooted at *prefix*. The tree
+        itself is built once and kept in the campaign state.
+        """
+        scores_trees = self.get_campaign_state(campaign).setdefault(
+            'scores_trees', {})
+        if prefix not in scores_trees:
+            parts = prefix.split('/')
+            slug = parts[-1]
+            slug_prefix = '/'.join(parts[:-1])
+            scores_trees[prefix] = get_scores_tree(
+                roots=[PageElement.objects.get(slug=slug)],
+                prefix=slug_prefix)
+        # The tree is decorated with scores by the caller.
+        return copy.deepcopy(scores_trees[prefix])
+
+
+    def update_population_stats(self, sample, prefix=None):
+        """
+        Updates `ImplementationStats` with the answers to questions
+        under *prefix* frozen into *sample*.
+        """
+        update_implementation_stats(sample, self.assessment_unit_id,
+            prefix=prefix)
+
+
     def get_scorecards(self, campaign, prefix, title=None, includes=None,
                        bypass_cache=False):
         """
@@ -159,15 +199,10 @@ class ScoreCalculator(ScoreCalculatorBase):
                 if sample.extra and 'is_planned' in sample.extra:
                     is_planned = True
                     break
-            parts = prefix.split('/')
-            slug = parts[-1]
-            slug_prefix = '/'.join(parts[:-1])
-            scores_tree = get_scores_tree(
-                roots=[PageElement.objects.get(slug=slug)],
-                prefix=slug_prefix)
+            scores_tree = self.get_scores_tree(campaign, prefix)
             if scores_tree:
                 rollup_tree = scores_tree.get(prefix)
-                leafs = get_leafs(rollup_tree, campaign)
+                leafs_index = _index_leafs(get_leafs(rollup_tree, campaign))
                 for scored_answer in self.get_scored_answers(
                         campaign, includes=active_samples, prefix=prefix):
 
@@ -177,29 +212,28 @@ class ScoreCalculator(ScoreCalculatorBase):
                         # we would use a xor.
                         continue
                     account_id = scored_answer.account_id
-                    for leaf_prefix, leaf_values in six.iteritems(leafs):
-                        if scored_answer.path.startswith(leaf_prefix):
-                            accounts = leaf_values[0].get('accounts', {})
-                            scores = accounts.get(account_id, {})
-                            numerator = (scores.get('numerator', 0) +
-                                scored_answer.numerator)
-                            denominator = (scores.get('denominator', 0) +
-                                scored_answer.denominator)
-                            nb_answers = (scores.get('nb_answers', 0) +
-                                1)
-                            nb_questions = (scores.get('nb_questions', 0) +
-                                1)
-                            scores.update({
-                                'numerator': numerator,
-                                'denominator': denominator,
-                                'nb_answers': nb_answers,
-                                'nb_questions': nb_questions
-                            })
-                            if account_id not in accounts:
-                                accounts.update({account_id: scores})
-                            if 'accounts' not in leaf_values[0]:
-                                leaf_values[0].update({'accounts': accounts})
-                            break
+                    leaf_values = _find_leaf(leafs_index, scored_answer.path)
+                    if leaf_values:
+                        accounts = leaf_values[0].get('accounts', {})
+                        scores = accounts.get(account_id, {})
+                        numerator = (scores.get('numerator', 0) +
+                            scored_answer.numerator)
+                        denominator = (scores.get('denominator', 0) +
+                            scored_answer.denominator)
+                        nb_answers = (scores.get('nb_answers', 0) +
+                            1)
+                        nb_questions = (scores.get('nb_questions', 0) +
+                            1)
+                        scores.update({
+                            'numerator': numerator,
+                            'denominator': denominator,
+                            'nb_answers': nb_answers,
+                            'nb_questions': nb_questions
+                        })
+                        if account_id not in accounts:
+                            accounts.update({account_id: scores})
+                        if 'accounts' not in leaf_values[0]:
+                            leaf_values[0].update({'accounts': accounts})
                 populate_rollup(rollup_tree, True, force_score=True)
                 for node in flatten_content_tree(scores_tree):
                     path = node.get('path')
@@ -214,8 +248,9 @@ class ScoreCalculator(ScoreCalculatorBase):
                 scorecard_caches += [ScorecardCache(
                         path=prefix, sample=active_samples[0])]
 
+            highlights_by_samples = get_highlights_by_samples(active_samples)
             for sample in active_samples:
-                highlights = get_highlights(sample)
+                highlights = highlights_by_samples.get(sample.pk, [])
                 for scorecard in scorecard_caches:
                     if scorecard.sample_id == sample.id:
                         for highlight in highlights:
@@ -227,6 +262,187 @@ class ScoreCalculator(ScoreCalculatorBase):
         return scorecard_caches
 
 
+def _index_leafs(leafs):
+    """
+    Indexes *leafs*, as returned by `get_leafs`, by path such that the leaf
+    an answer belongs to can be found with one lookup per distinct leaf path
+    length instead of comparing the answer path against every leaf.
+
+    Returns a (lengths, leafs_by_path) tuple where *leafs_by_path* maps
+    a leaf path to its rank in *leafs* and its values.
+    """
+    leafs_by_path = {}
+    for rank, (leaf_path, leaf_values) in enumerate(six.iteritems(leafs)):
+        leafs_by_path[leaf_path] = (rank, leaf_values)
+    lengths = sorted(set([len(leaf_path) for leaf_path in leafs_by_path]))
+    return lengths, leafs_by_path
+
+
+def _find_leaf(leafs_index, path):
+    """
+    Returns the values of the first leaf, in `get_leafs` order, whose path
+    is a prefix of *path*, or `None` if there are no such leaf.
+    """
+    lengths, leafs_by_path = leafs_index
+    found = None
+    for length in lengths:
+        if length > len(path):
+            break
+        candidate = leafs_by_path.get(path[:length])
+        if candidate and (found is None or candidate[0] < found[0]):
+            found = candidate
+    return found[1] if found else None
+
+
+def _add_implementation_counts(counts, rows, sign=1):
+    """
+    Adds (question_id, measured, nb_answers) *rows* to *counts*,
+    a dictionnary of `ImplementationStats` fields values keyed by question.
+    """
+    for question_id, measured, nb_answers in rows:
+        field_name = IMPLEMENTATION_STATS_FIELDS.get(measured)
+        if field_name:
+            question_counts = counts.setdefault(question_id, {})
+            question_counts[field_name] = (
+                question_counts.get(field_name, 0) + sign * nb_answers)
+    return counts
+
+
+def _count_answers(answers):
+    return answers.values('question_id', 'measured').annotate(
+        nb_answers=Count('id')).values_list(
+        'question_id', 'measured', 'nb_answers')
+
+
+def _get_latest_frozen_population(campaign):
+    """
+    Returns the population of latest frozen samples for *campaign*.
+
+    When implementation rates for that population are maintained
+    in `ImplementationStats`, *campaign* itself is returned such that
+    rates are read from the statistics instead of counted from answers.
+    """
+    if campaign and ImplementationStats.objects.filter(
+            campaign=campaign).exists():
+        return campaign
+    return Sample.objects.get_latest_frozen_by_accounts(
+        campaign=campaign, tags=[])
+
+
+def update_implementation_stats(sample, unit_id, prefix=None):
+    """
+    Updates `ImplementationStats` for the campaign of *sample* with
+    the answers to questions under *prefix* frozen into *sample*,
+    or the answers to all questions not updated yet when *prefix*
+    is `None`.
+
+    Since *sample* is now the latest frozen sample for the account,
+    the answers of the previous latest frozen sample for the account
+    are removed from the statistics and the answers of *sample* added,
+    for the same set of questions.
+
+    Statistics are only updated once `rebuild_implementation_stats`
+    was run for the campaign.
+
+    This function must be executed in a `transaction.atomic` block.
+    """
+    if not sample.is_frozen or sample.extra is not None:
+        # Peers are the latest frozen samples with no tags.
+        return
+    if not hasattr(sample, 'implementation_stats_prefixes'):
+        sample.implementation_stats_prefixes = []
+    counted_prefixes = sample.implementation_stats_prefixes
+    if None in counted_prefixes:
+        # All answers were already counted.
+        return
+    if prefix and any([prefix.startswith(counted_prefix)
+            for counted_prefix in counted_prefixes]):
+        return
+    peer_samples = Sample.objects.filter(
+        account_id=sample.account_id, campaign_id=sample.campaign_id,
+        is_frozen=True, extra__isnull=True).exclude(pk=sample.pk)
+    if peer_samples.filter(created_at__gt=sample.created_at).exists():
+        # *sample* is not the latest frozen sample for the account.
+        return
+    if not ImplementationStats.objects.filter(
+            campaign_id=sample.campaign_id).exists():
+        # Statistics were not built for the campaign yet. Opportunities
+        # are computed from answers until they are.
+        return
+    answers = Answer.objects.filter(unit_id=unit_id)
+    if prefix:
+        answers = answers.filter(question__path__startswith=prefix)
+    for counted_prefix in counted_prefixes:
+        answers = answers.exclude(question__path__startswith=counted_prefix)
+    counted_prefixes += [prefix]
+
+    counts = {}
+    last_created_at = peer_samples.filter(
+        created_at__lt=sample.created_at).aggregate(
+        Max('created_at')).get('created_at__max')
+    if last_created_at:
+        _add_implementation_counts(counts, _count_answers(
+            answers.filter(sample__in=peer_samples.filter(
+                created_at=last_created_at))), sign=-1)
+    _add_implementation_counts(counts, _count_answers(
+        answers.filter(sample=sample)))
+
+    existing_question_ids = set(ImplementationStats.objects.filter(
+        campaign_id=sample.campaign_id,
+        question_id__in=counts.keys()).select_for_update().values_list(
+        'question_id', flat=True))
+    created = []
+    for question_id, question_counts in six.iteritems(counts):
+        if question_id in existing_question_ids:
+            ImplementationStats.objects.filter(
+                campaign_id=sample.campaign_id,
+                question_id=question_id).update(**{
+                field_name: F(field_name) + val
+                for field_name, val in six.iteritems(question_counts)})
+        else:
+            created += [ImplementationStats(campaign_id=sample.campaign_id,
+                question_id=question_id, **question_counts)]
+    if created:
+        ImplementationStats.objects.bulk_create(created)
+
+
+def rebuild_implementation_stats(campaign, unit_id=None):
+    """
+    Recomputes `ImplementationStats` for *campaign* from the latest
+    frozen samples. Returns the number of questions with statistics.
+
+    This function must be executed in a `transaction.atomic` block.
+    """
+    if not unit_id:
+        unit_id = Unit.objects.get(slug=ASSESSMENT_UNIT).pk
+    ImplementationStats.objects.filter(campaign=campaign).delete()
+    rebuild_sql = """INSERT INTO %(stats_table)s
+  (campaign_id, question_id, %(fields)s)
+SELECT
+  %(campaign_id)d,
+  survey_answer.question_id,
+%(nb_choices)s
+FROM survey_answer
+WHERE survey_answer.unit_id = %(unit_id)d
+  AND survey_answer.sample_id IN (
+    SELECT id FROM (%(latest_samples)s) AS latest_samples)
+GROUP BY survey_answer.question_id
+""" % {
+        'stats_table': ImplementationStats._meta.db_table,
+        'fields': ', '.join(six.itervalues(IMPLEMENTATION_STATS_FIELDS)),
+        'campaign_id': campaign.pk,
+        'nb_choices': ',\n'.join([
+  "  SUM(CASE WHEN survey_answer.measured = %d THEN 1 ELSE 0 END)" % measured
+            for measured in IMPLEMENTATION_STATS_FIELDS]),
+        'unit_id': unit_id,
+        'latest_samples': Sample.objects.get_latest_frozen_by_accounts(
+            campaign=campaign, tags=[]).query.sql
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(rebuild_sql, params=None)
+        return cursor.rowcount
+
+
 def _get_scored_answers(population, unit_id,
                        includes=None, questions=None, prefix=None):
     """
@@ -259,7 +475,9 @@ def _get_scored_answers(population, unit_id,
     (or a subset when *includes* is not `None`).
 
     *population* is a set of accounts used to compute the expected
-    oportunities.
+    oportunities. When *population* is a `Campaign`, the implementation
+    rates of the latest frozen samples for that campaign are read
+    from `ImplementationStats`.
     """
     #pylint:disable=protected-access
     scored_answers = """SELECT
@@ -390,6 +608,61 @@ ON questions_with_opportunity.id = samples.question_id
 
 
 def _get_opportunities_sql(population, unit_id, prefix=None):
+    if isinstance(population, Campaign):
+        implementation_rate_view = _get_implementation_stats_sql(
+            population, prefix=prefix)
+    else:
+        implementation_rate_view = _get_implementation_rate_sql(
+            population, unit_id, prefix=prefix)
+
+    # The opportunity for all questions with a "Yes" answer.
+    yes_opportunity_view = """%(implementation_rate)s,
+opportunity_view AS (
+  SELECT
+    nb_valid_by_questions.question_id AS question_id,
+    (nb_valid_by_questions.avg_value * (1.0 +
+      CAST(nb_positive_by_questions.nb_yes AS FLOAT)
+        / nb_valid_by_questions.nb_yes_no)) as opportunity,
+    (CAST(nb_positive_by_questions.nb_yes AS FLOAT) * 100
+        / nb_valid_by_questions.nb_yes_no) as rate,
+    nb_valid_by_questions.nb_yes_no as nb_respondents
+  FROM nb_valid_by_questions
+  LEFT OUTER JOIN nb_positive_by_questions
+  ON nb_positive_by_questions.question_id = nb_valid_by_questions.question_id)
+""" % {'implementation_rate': implementation_rate_view}
+
+    # All expected questions for each sample decorated with
+    # an ``opportunity``.
+    # This set of opportunities only has to be computed once.
+    # It is shared across all samples.
+    # COALESCE now supported on sqlite3.
+    questions_with_opportunity = """%(yes_opportunity_view)s
+SELECT
+  survey_question.id AS id,
+  COALESCE(opportunity_view.opportunity, survey_question.avg_value, 0)
+    AS opportunity,
+  COALESCE(opportunity_view.rate, 0) AS rate,
+  COALESCE(opportunity_view.nb_respondents, 0) AS nb_respondents,
+  survey_question.environmental_value AS environmental_value,
+  survey_question.business_value AS business_value,
+  survey_question.implementation_ease AS implementation_ease,
+  survey_question.profitability AS profitability,
+  survey_question.avg_value AS avg_value,
+  survey_question.default_unit_id AS default_unit_id,
+  survey_question.path AS path,
+  survey_question.ui_hint AS ui_hint
+FROM survey_question
+LEFT OUTER JOIN opportunity_view
+  ON survey_question.id = opportunity_view.question_id
+%(filter_questions)s
+""" % {
+    'yes_opportunity_view': yes_opportunity_view,
+    'filter_questions': _additional_filters_sql(prefix=prefix),
+}
+    return questions_with_opportunity
+
+
+def _get_implementation_rate_sql(population, unit_id, prefix=None):
     if isinstance(population, six.string_types):
         # We assume `population` is a SQL query.
         sample_population = ("SELECT id FROM (%s) AS sample_population" %
@@ -434,52 +707,49 @@ nb_valid_by_questions AS (
     'positive_answers': _present_as_sql(),
     'valid_answers': _relevent_as_sql(),
 }
+    return implementation_rate_view
 
-    # The opportunity for all questions with a "Yes" answer.
-    yes_opportunity_view = """%(implementation_rate)s,
-opportunity_view AS (
+
+def _get_implementation_stats_sql(campaign, prefix=None):
+    """
+    Same as `_get_implementation_rate_sql` for the latest frozen samples
+    of *campaign*, except the number of answers to each question is read
+    from `ImplementationStats` instead of counted in `survey_answer`.
+    """
+    #pylint:disable=protected-access
+    stats_table = ImplementationStats._meta.db_table
+    implementation_rate_view = """WITH
+nb_positive_by_questions AS (
   SELECT
-    nb_valid_by_questions.question_id AS question_id,
-    (nb_valid_by_questions.avg_value * (1.0 +
-      CAST(nb_positive_by_questions.nb_yes AS FLOAT)
-        / nb_valid_by_questions.nb_yes_no)) as opportunity,
-    (CAST(nb_positive_by_questions.nb_yes AS FLOAT) * 100
-        / nb_valid_by_questions.nb_yes_no) as rate,
-    nb_valid_by_questions.nb_yes_no as nb_respondents
-  FROM nb_valid_by_questions
-  LEFT OUTER JOIN nb_positive_by_questions
-  ON nb_positive_by_questions.question_id = nb_valid_by_questions.question_id)
-""" % {'implementation_rate': implementation_rate_view}
+    %(stats_table)s.question_id AS question_id,
+    (%(positive_answers)s) AS nb_yes
+  FROM %(stats_table)s
+  WHERE %(stats_table)s.campaign_id = %(campaign_id)d
+    AND (%(positive_answers)s) > 0),
 
-    # All expected questions for each sample decorated with
-    # an ``opportunity``.
-    # This set of opportunities only has to be computed once.
-    # It is shared across all samples.
-    # COALESCE now supported on sqlite3.
-    questions_with_opportunity = """%(yes_opportunity_view)s
-SELECT
-  survey_question.id AS id,
-  COALESCE(opportunity_view.opportunity, survey_question.avg_value, 0)
-    AS opportunity,
-  COALESCE(opportunity_view.rate, 0) AS rate,
-  COALESCE(opportunity_view.nb_respondents, 0) AS nb_respondents,
-  survey_question.environmental_value AS environmental_value,
-  survey_question.business_value AS business_value,
-  survey_question.implementation_ease AS implementation_ease,
-  survey_question.profitability AS profitability,
-  survey_question.avg_value AS avg_value,
-  survey_question.default_unit_id AS default_unit_id,
-  survey_question.path AS path,
-  survey_question.ui_hint AS ui_hint
-FROM survey_question
-LEFT OUTER JOIN opportunity_view
-  ON survey_question.id = opportunity_view.question_id
-%(filter_questions)s
+nb_valid_by_questions AS (
+  SELECT
+    survey_question.id AS question_id,
+    (%(valid_answers)s) AS nb_yes_no,
+    survey_question.avg_value AS avg_value
+  FROM survey_question
+  INNER JOIN %(stats_table)s
+    ON survey_question.id = %(stats_table)s.question_id
+  WHERE %(stats_table)s.campaign_id = %(campaign_id)d
+    AND (%(valid_answers)s) > 0
+    %(filter_questions)s)
 """ % {
-    'yes_opportunity_view': yes_opportunity_view,
-    'filter_questions': _additional_filters_sql(prefix=prefix),
+    'stats_table': stats_table,
+    'campaign_id': campaign.pk,
+    'filter_questions': _additional_filters_sql(
+        prefix=prefix, intro_keyword="AND"),
+    'positive_answers': ' + '.join(["%s.%s" % (
+        stats_table, IMPLEMENTATION_STATS_FIELDS[val]) for val in PRESENT]),
+    'valid_answers': ' + '.join(["%s.%s" % (
+        stats_table, IMPLEMENTATION_STATS_FIELDS[val])
+        for val in PRESENT + ABSENT]),
 }
-    return questions_with_opportunity
+    return implementation_rate_view
 
 
 def _get_answer_with_account_sql(unit_id, includes=None):
@@ -18,6 +18,8 @@ from ...downloads.reporting import (
     EngagementStatsPPTXView, FullReportPPTXView,
     PortfolioAccessiblesXLSXView, PortfolioAccessiblesLongCSVView,
     PortfolioEngagementXLSXView)
+from ...downloads.columnar import (AccessiblesAnswersParquetView,
+    EngagedAnswersParquetView)
 from ...views.insights import (AnalyzeInsightsView, CompareInsightsView,
     InsightsView)
 
@@ -69,6 +71,9 @@ urlpatterns = [
         EngagedAnswersXLSXView.as_view(),
         name='download_matrix_compare_path'),
 
+    path('reporting/<slug:campaign>/engage/download/raw/parquet/',
+        EngagedAnswersParquetView.as_view(),
+        name='download_engage_raw_parquet'),
     path('reporting/<slug:campaign>/engage/download/raw/long/',
         EngagedAnswersPivotableCSVView.as_view(),
         name='download_engage_raw_long'),
@@ -79,6 +84,9 @@ urlpatterns = [
         PortfolioEngagementXLSXView.as_view(),
         name='reporting_profile_engage_download'),
 
+    path('reporting/<slug:campaign>/accessibles/download/raw/parquet/',
+        AccessiblesAnswersParquetView.as_view(),
+        name='download_accessibles_raw_parquet'),
     path('reporting/<slug:campaign>/accessibles/download/raw/long/',
         AccessiblesAnswersPivotableCSVView.as_view(),
         name='download_accessibles_raw_long'),
@@ -7,7 +7,7 @@ Furthermore this functions rely on the models to be loaded. For pure
 helper functions that do not rely on the order Django loads the modules,
 see the file helpers.py in the same directory.
 """
-import json, logging, re, smtplib
+import copy, hashlib, json, logging, re, smtplib, time
 from collections import OrderedDict
 from importlib import import_module
 
@@ -17,19 +17,29 @@ from deployutils.apps.django_deployutils.mixins.base import (
 from django.apps import apps as django_apps
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
 from django.db.models import Q, F
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+    pre_save)
+from django.dispatch import receiver
 from django.utils import translation
 from extended_templates.backends import get_email_backend
 from pages.helpers import ContentCut
-from pages.models import PageElement, build_content_tree, flatten_content_tree
-from survey.models import Answer, Campaign, Choice, Sample, Unit
+from pages.models import (PageElement, RelationShip, build_content_tree,
+    flatten_content_tree)
+from survey.models import (Answer, Campaign, Choice, EnumeratedQuestions,
+    Sample, Unit)
 from survey.helpers import get_extra
 from survey.queries import get_question_model
 
 from .compat import import_string, six, gettext_lazy as _
+from .models import (CampaignSegment, HighlightCache, SegmentAnsweredCache,
+    SummaryPerformance, SupportingDocument)
 
 DB_PATH_SEP = '/'
+DOCUMENT_URL_RE = r'(https?://\S+)'
+# Guards against cycles in the content graph.
+MAX_CONTENT_DEPTH = 32
 LOGGER = logging.getLogger(__name__)
 SEND_EMAIL = True
 
@@ -250,38 +260,121 @@ def get_unlocked(request, account, candidates):
     return (is_broker or not candidates or accessible_plans & candidates)
 
 
-def get_highlights(sample):
-    highlights = get_extra(sample.campaign, 'highlights', [])
+def _get_highlights_reporting(campaign, samples):
+    """
+    Returns the set of (sample_id, highlight index) for highlights
+    defined in *campaign* that *samples* report on.
+
+    All highlights are compiled into a single conditional-aggregation
+    query over the answers in *samples*.
+    """
+    highlights = get_campaign_extra(campaign).extra.get('highlights', [])
+    filter_q = None
     for highlight in highlights:
-        reporting = False
-        filter_q = None
-        for include in highlight.get('includes'):
-            if filter_q:
-                filter_q |= models.Q(
-                    path__endswith=DB_PATH_SEP + include)
-            else:
-                filter_q = models.Q(
-                    path__endswith=DB_PATH_SEP + include)
-        includes = get_question_model().objects.filter(
-            filter_q).select_related('default_unit')
-        if includes:
-            default_unit = includes[0].default_unit
-            if default_unit.system == Unit.SYSTEM_ENUMERATED:
-                positive = Choice.objects.filter(unit=default_unit).order_by(
-                        'rank').first()
-                reporting = Answer.objects.filter(
-                    question__in=includes,
-                    sample=sample, unit__system=Unit.SYSTEM_ENUMERATED,
-                    measured=positive.pk).exists()
-            elif default_unit.system == Unit.SYSTEM_DATETIME:
-                reporting = Choice.objects.filter(pk__in=Answer.objects.filter(
-                    question__in=includes, sample=sample,
-                    unit=default_unit).values_list('measured',
-                    flat=True)).exclude(text='no-target').exists()#XXX
-            else:
-                reporting = Answer.objects.filter(
-                    question__in=includes, sample=sample).exists()
-        highlight.update({'reporting': reporting})
+        for include in highlight.get('includes', []):
+            include_q = models.Q(path__endswith=DB_PATH_SEP + include)
+            filter_q = (filter_q | include_q) if filter_q else include_q
+    if not filter_q:
+        return set([])
+
+    # Questions are matched to highlights in the order they would have
+    # been returned by a query per highlight.
+    questions = list(get_question_model().objects.filter(
+        filter_q).select_related('default_unit'))
+    questions_by_highlights = []
+    for highlight in highlights:
+        suffixes = tuple([DB_PATH_SEP + include
+            for include in highlight.get('includes', [])])
+        questions_by_highlights += [[question for question in questions
+            if suffixes and question.path.endswith(suffixes)]]
+
+    positive_choices = {}
+    enumerated_unit_ids = {includes[0].default_unit_id
+        for includes in questions_by_highlights if includes and
+        includes[0].default_unit.system == Unit.SYSTEM_ENUMERATED}
+    for choice in Choice.objects.filter(
+            unit_id__in=enumerated_unit_ids).order_by('rank'):
+        positive_choices.setdefault(choice.unit_id, choice.pk)
+
+    aggregates = {}
+    for idx, includes in enumerate(questions_by_highlights):
+        if not includes:
+            continue
+        default_unit = includes[0].default_unit
+        reporting_q = models.Q(question__in=includes)
+        if default_unit.system == Unit.SYSTEM_ENUMERATED:
+            reporting_q &= models.Q(unit__system=Unit.SYSTEM_ENUMERATED,
+                measured=positive_choices.get(default_unit.pk))
+        elif default_unit.system == Unit.SYSTEM_DATETIME:
+            reporting_q &= models.Q(unit=default_unit,
+                measured__in=Choice.objects.exclude(
+                    text='no-target').values('pk')) #XXX
+        aggregates['highlight_%d' % idx] = models.Max(models.Case(
+            models.When(reporting_q, then=models.Value(1)),
+            default=models.Value(0), output_field=models.IntegerField()))
+    if not aggregates:
+        return set([])
+
+    results = set([])
+    for row in Answer.objects.filter(sample__in=samples,
+            question__in=questions).values('sample_id').annotate(
+            **aggregates).order_by():
+        for key, val in six.iteritems(row):
+            if key.startswith('highlight_') and val:
+                results |= {(row['sample_id'], int(key[len('highlight_'):]))}
+    return results
+
+
+def get_highlights_by_samples(samples):
+    """
+    Returns the highlights defined in the campaign of each sample
+    in *samples*, decorated with a `reporting` status, indexed by sample id.
+    """
+    results = {}
+    samples_by_campaigns = OrderedDict()
+    for sample in samples:
+        samples_by_campaigns.setdefault(sample.campaign_id, []).append(sample)
+    for campaign_samples in six.itervalues(samples_by_campaigns):
+        campaign = campaign_samples[0].campaign
+        reporting = _get_highlights_reporting(campaign, campaign_samples)
+        highlights = get_campaign_extra(campaign).extra.get('highlights', [])
+        for sample in campaign_samples:
+            results[sample.pk] = [dict(highlight, reporting=bool(
+                (sample.pk, idx) in reporting))
+                for idx, highlight in enumerate(highlights)]
+    return results
+
+
+def get_highlights(sample):
+    """
+    Returns the highlights defined in the campaign of *sample*, decorated
+    with a `reporting` status.
+
+    For frozen samples, the status is read from `HighlightCache`
+    when it was populated.
+    """
+    if sample.is_frozen:
+        highlights = get_campaign_extra(sample.campaign).extra.get(
+            'highlights', [])
+        cached = dict(HighlightCache.objects.filter(
+            sample=sample).values_list('slug', 'reporting'))
+        if highlights and all([highlight.get('slug') in cached
+                for highlight in highlights]):
+            return [dict(highlight, reporting=cached[highlight.get('slug')])
+                for highlight in highlights]
+    return get_highlights_by_samples([sample]).get(sample.pk, [])
+
+
+def populate_highlights_cache(sample):
+    """
+    Computes the highlights of a frozen *sample* and stores them
+    in `HighlightCache`.
+    """
+    highlights = get_highlights_by_samples([sample]).get(sample.pk, [])
+    HighlightCache.objects.filter(sample=sample).delete()
+    HighlightCache.objects.bulk_create([HighlightCache(sample=sample,
+        slug=highlight.get('slug'), reporting=highlight.get('reporting'))
+        for highlight in highlights if highlight.get('slug')])
     return highlights
 
 
@@ -320,14 +413,163 @@ def get_latest_completed_assessment(account, campaign=None):
     return queryset.first()
 
 
+class CampaignExtra(object):
+    """
+    Typed view of the `extra` field of a campaign, decoded once.
+
+    Score weights are either stored in a `points` dictionnary indexed
+    by path or, for older campaigns, directly at the top level of `extra`.
+    """
+    def __init__(self, extra):
+        if isinstance(extra, six.string_types):
+            try:
+                extra = json.loads(extra)
+            except (TypeError, ValueError):
+                extra = None
+        if not isinstance(extra, dict):
+            extra = {}
+        self.extra = extra
+        points = extra.get('points')
+        self.weights = points if points else extra
+        self.tags = extra.get('tags', [])
+        self.is_planned = extra.get('is_planned', False)
+        self.is_searchable = bool(extra.get('searchable', False))
+
+    def get_score_weight(self, path, default_value=1.0):
+        return self.weights.get(path, default_value)
+
+
+# Campaign `extra` decoded, indexed by campaign pk. Each entry also records
+# the raw `extra` it was decoded from such that an entry is never used
+# when the campaign was updated, including by another process.
+_CAMPAIGN_EXTRAS = {}
+
+
+def get_campaign_extra(campaign):
+    """
+    Returns the `CampaignExtra` for *campaign*, decoding the campaign
+    `extra` field only when it was not seen before.
+    """
+    extra = getattr(campaign, 'extra', None)
+    if not getattr(campaign, 'pk', None):
+        return CampaignExtra(extra)
+    cached = _CAMPAIGN_EXTRAS.get(campaign.pk)
+    if cached is not None:
+        raw_extra, campaign_extra = cached
+        if raw_extra is extra or raw_extra == extra:
+            return campaign_extra
+    campaign_extra = CampaignExtra(extra)
+    _CAMPAIGN_EXTRAS[campaign.pk] = (extra, campaign_extra)
+    return campaign_extra
+
+
+@receiver(post_save, sender=Campaign,
+    dispatch_uid="campaign_extras_post_save")
+@receiver(post_delete, sender=Campaign,
+    dispatch_uid="campaign_extras_post_delete")
+def clear_campaign_extra(sender, instance, **kwargs):
+    #pylint:disable=unused-argument
+    _CAMPAIGN_EXTRAS.pop(instance.pk, None)
+
+
 def get_score_weight(campaign, path, default_value=1.0):
-    points = get_extra(campaign, 'points')
-    if points:
-        return points.get(path, default_value)
-    return get_extra(campaign, path, default_value)
+    return get_campaign_extra(campaign).get_score_weight(
+        path, default_value=default_value)
+
+
+# Reference data loaded once per process, and kept at most
+# `settings.UNITS_CACHE_TIMEOUT` seconds such that updates made in other
+# processes are eventually picked up. Units are indexed by slug as
+# (expires at, unit). Choices are indexed by unit slug as (expires at,
+# unit pk, choices ordered by rank) such that they can be invalidated
+# when a `Choice` of the unit changes.
+_UNITS = {}
+_CHOICES_BY_UNITS = {}
+
+
+def _get_units_cache_expires_at():
+    return time.monotonic() + getattr(settings, 'UNITS_CACHE_TIMEOUT', 0)
+
+
+def get_unit(slug):
+    """
+    Returns the `Unit` for *slug*.
+
+    The returned object is a copy that callers are free to modify.
+    """
+    expires_at, unit = _UNITS.get(slug, (0, None))
+    if unit is None or expires_at <= time.monotonic():
+        unit = Unit.objects.get(slug=slug)
+        _UNITS[slug] = (_get_units_cache_expires_at(), unit)
+    return copy.copy(unit)
 
 
-def get_leafs(rollup_tree, campaign, path=None):
+def get_unit_choices(slug):
+    """
+    Returns the list of `Choice` for the unit *slug*, ordered by rank.
+
+    The returned objects are copies that callers are free to modify.
+    """
+    expires_at, unit_id, choices = _CHOICES_BY_UNITS.get(slug, (0, None, None))
+    if choices is None or expires_at <= time.monotonic():
+        choices = list(Choice.objects.filter(
+            unit__slug=slug).order_by('rank'))
+        if choices:
+            unit_id = choices[0].unit_id
+        else:
+            unit_id = Unit.objects.filter(slug=slug).values_list(
+                'pk', flat=True).first()
+        _CHOICES_BY_UNITS[slug] = (
+            _get_units_cache_expires_at(), unit_id, choices)
+    return [copy.copy(choice) for choice in choices]
+
+
+@receiver(post_save, sender=Unit, dispatch_uid="units_cache_post_save")
+@receiver(post_delete, sender=Unit, dispatch_uid="units_cache_post_delete")
+def clear_units_cache(sender, instance, **kwargs):
+    #pylint:disable=unused-argument
+    _UNITS.clear()
+    _CHOICES_BY_UNITS.clear()
+
+
+@receiver(post_save, sender=Choice, dispatch_uid="choices_cache_post_save")
+@receiver(post_delete, sender=Choice, dispatch_uid="choices_cache_post_delete")
+def clear_choices_cache(sender, instance, **kwargs):
+    #pylint:disable=unused-argument
+    # Freetext choices are created with every comment, so we only
+    # invalidate the choices of the unit that changed.
+    for slug, cached in list(six.iteritems(_CHOICES_BY_UNITS)):
+        if cached[1] == instance.unit_id:
+            _CHOICES_BY_UNITS.pop(slug, None)
+
+
+def get_content_texts(slugs):
+    """
+    Returns the text of the `PageElement` for each slug in *slugs*,
+    loaded in a single query, as a dictionnary indexed by slug.
+    """
+    if not slugs:
+        return {}
+    return dict(PageElement.objects.filter(
+        slug__in=slugs).values_list('slug', 'text'))
+
+
+def _get_missing_texts(rollup_tree, slugs=None):
+    """
+    Returns the slugs of inner nodes in *rollup_tree* that were not
+    decorated with a text.
+    """
+    if slugs is None:
+        slugs = set([])
+    if rollup_tree[1].keys():
+        if 'text' not in rollup_tree[0]:
+            slugs |= set([rollup_tree[0]['slug']])
+        for level_detail in six.itervalues(rollup_tree[1]):
+            _get_missing_texts(level_detail, slugs=slugs)
+    return slugs
+
+
+def get_leafs(rollup_tree, campaign, path=None, texts=None):
     """
     Returns all leafs from a rollup tree.
 
@@ -335,6 +577,9 @@ def get_leafs(rollup_tree, campaign, path=None):
     that values are aliases into the rollup tree (not copies). It is
     thus possible to update leafs in the roll up tree by updating values
     in the dictionnary returned by this function.
+
+    *texts* is the text of inner nodes indexed by slug. When it is not
+    specified, the texts missing from the tree are loaded in one query.
     """
     if path is None:
         path = ''
@@ -344,10 +589,13 @@ def get_leafs(rollup_tree, campaign, path=None):
     if not rollup_tree[1].keys():
         return {path: rollup_tree}
 
+    if texts is None:
+        texts = get_content_texts(_get_missing_texts(rollup_tree))
+
     # Recursively go through the children of the current node
     leafs = OrderedDict({})
     for key, level_detail in six.iteritems(rollup_tree[1]):
-        leafs.update(get_leafs(level_detail, campaign, path=key))
+        leafs.update(get_leafs(level_detail, campaign, path=key, texts=texts))
 
     # The node is traversed only once and we get a chance
     # to decorate it here with information that wasn't loaded
@@ -355,16 +603,16 @@ def get_leafs(rollup_tree, campaign, path=None):
     # We do this after all children have been traversed so we
     # get a chance to compute a total score_weight.
     if 'text' not in rollup_tree[0]:
-        element = PageElement.objects.filter(
-            slug=rollup_tree[0]['slug']).values('text').first()
-        if element and element['text']:
-            rollup_tree[0].update(element)
+        text = texts.get(rollup_tree[0]['slug'])
+        if text:
+            rollup_tree[0].update({'text': text})
 
-    score_weight = get_score_weight(campaign, path)
+    campaign_extra = get_campaign_extra(campaign)
+    score_weight = campaign_extra.get_score_weight(path)
     rollup_tree[0].update({'score_weight': score_weight})
     total_score_weight = 0
     for key, level_detail in six.iteritems(rollup_tree[1]):
-        total_score_weight += get_score_weight(campaign, key)
+        total_score_weight += campaign_extra.get_score_weight(key)
     normalize_children = (
         (1.0 - 0.01) < total_score_weight < (1.0 + 0.01))
     if normalize_children:
@@ -405,6 +653,123 @@ def _cut_tree(roots, cut=None):
     return roots
 
 
+def _get_content_edges(root_ids):
+    """
+    Returns all edges in the content graph reachable from *root_ids*,
+    decorated with the destination element, in a single recursive query.
+
+    Edges are ordered by depth, then `rank` and pk, the order in which
+    `build_content_tree` would have loaded them level by level.
+    """
+    if not root_ids:
+        return []
+    sql_query = """
+WITH RECURSIVE content_edges(orig_element_id, dest_element_id, rank,
+  relationship_id, depth) AS (
+  SELECT orig_element_id, dest_element_id, rank, id, 1
+  FROM %(relationship_table)s
+  WHERE orig_element_id IN (%(root_ids)s)
+  UNION ALL
+  SELECT %(relationship_table)s.orig_element_id,
+    %(relationship_table)s.dest_element_id,
+    %(relationship_table)s.rank,
+    %(relationship_table)s.id,
+    content_edges.depth + 1
+  FROM %(relationship_table)s
+  INNER JOIN content_edges
+    ON %(relationship_table)s.orig_element_id = content_edges.dest_element_id
+  WHERE content_edges.depth < %(max_depth)d
+)
+SELECT DISTINCT
+  content_edges.depth,
+  content_edges.rank,
+  content_edges.relationship_id,
+  content_edges.orig_element_id,
+  content_edges.dest_element_id,
+  %(element_table)s.slug,
+  %(element_table)s.title,
+  %(element_table)s.picture,
+  %(element_table)s.extra
+FROM content_edges
+INNER JOIN %(element_table)s
+  ON %(element_table)s.id = content_edges.dest_element_id
+ORDER BY content_edges.depth, content_edges.rank, content_edges.relationship_id
+""" % {
+        'relationship_table': RelationShip._meta.db_table,
+        'element_table': PageElement._meta.db_table,
+        'root_ids': ",".join([str(root_id) for root_id in root_ids]),
+        'max_depth': MAX_CONTENT_DEPTH
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(sql_query, params=None)
+        return cursor.fetchall()
+
+
+def _as_content_node(slug, title, picture, extra, text=None):
+    try:
+        extra = json.loads(extra)
+    except (TypeError, ValueError):
+        pass
+    result_node = {'slug': slug, 'title': title}
+    if picture:
+        result_node.update({'picture': picture})
+    if extra:
+        result_node.update({'extra': extra})
+    if text:
+        result_node.update({'text': text})
+    return (result_node, OrderedDict())
+
+
+def load_content_tree(roots=None, prefix=""):
+    """
+    Returns the same tree as `build_content_tree(roots, prefix=prefix)`
+    (no cut, visibility or accounts filters) but loads the whole subgraph
+    in one query instead of one query per level in the tree.
+
+    As in `build_content_tree`, only roots have a text. The text of inner
+    nodes is loaded in bulk by `get_leafs` when it is needed.
+    """
+    if roots is None:
+        roots = PageElement.objects.get_roots().order_by(
+            '-account_id', 'title')
+        if not prefix or prefix == DB_PATH_SEP:
+            prefix = ''
+    if not prefix.startswith(DB_PATH_SEP):
+        prefix = '%s%s' % (DB_PATH_SEP, prefix)
+    prefix = prefix.rstrip(DB_PATH_SEP)
+
+    results = OrderedDict()
+    pks_to_leafs = {}
+    for root in roots:
+        leaf_slug = '%s%s' % (DB_PATH_SEP, root.slug)
+        if prefix.endswith(leaf_slug):
+            # Workaround because we sometimes pass a prefix and sometimes
+            # a path `from_root`.
+            base = prefix
+        else:
+            base = prefix + leaf_slug
+        node = _as_content_node(
+            root.slug, root.title, root.picture, root.extra, root.text)
+        pks_to_leafs[root.pk] = (base, node)
+        results.update({base: node})
+
+    depth = 1
+    next_pks_to_leafs = {}
+    for edge in _get_content_edges(list(pks_to_leafs.keys())):
+        edge_depth, unused_rank, unused_relationship_id, orig_element_id, \
+            dest_element_id, slug, title, picture, extra = edge
+        if edge_depth != depth:
+            pks_to_leafs = next_pks_to_leafs
+            next_pks_to_leafs = {}
+            depth = edge_depth
+        parent = pks_to_leafs[orig_element_id]
+        base = parent[0] + DB_PATH_SEP + slug
+        node = _as_content_node(slug, title, picture, extra)
+        parent[1][1].update({base: node})
+        next_pks_to_leafs[dest_element_id] = (base, node)
+    return results
+
+
 def get_scores_tree(roots=None, prefix=""):
     """
     Returns a tree specialized to compute rollup scores.
@@ -412,7 +777,7 @@ def get_scores_tree(roots=None, prefix=""):
     Typically `get_leafs` and a function to populate a leaf will be called
     before an rollup is done.
     """
-    content_tree = build_content_tree(roots, prefix=prefix)
+    content_tree = load_content_tree(roots, prefix=prefix)
     scores_tree = _cut_tree(content_tree, cut=TransparentCut())
 
     # Moves up all industry segments which are under a category
@@ -463,10 +828,93 @@ def get_campaign_candidates(accounts=None, tags=None, campaign_slug=None):
     return candidates
 
 
+def get_segments_with_answers(sample, prefixes):
+    """
+    Returns the subset of *prefixes* under which there is at least
+    one answer in *sample*, in a single query.
+    """
+    if not prefixes:
+        return set([])
+    sql_query = """
+WITH segments(path) AS (
+  VALUES %(segments_values)s
+)
+SELECT DISTINCT segments.path
+FROM segments
+INNER JOIN %(question_table)s
+  ON SUBSTR(%(question_table)s.path, 1, LENGTH(segments.path)) = segments.path
+INNER JOIN %(answer_table)s
+  ON %(answer_table)s.question_id = %(question_table)s.id
+WHERE %(answer_table)s.sample_id = %(sample_id)d
+""" % {
+        'segments_values': ", ".join(["(%s)"] * len(prefixes)),
+        'question_table': get_question_model()._meta.db_table,
+        'answer_table': Answer._meta.db_table,
+        'sample_id': sample.pk
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(sql_query, params=list(prefixes))
+        return {row[0] for row in cursor.fetchall()}
+
+
+def get_segments_answered(sample, prefixes):
+    """
+    Returns the subset of *prefixes* under which there is at least
+    one answer in *sample*.
+
+    For frozen samples, the result is read from `SegmentAnsweredCache`
+    when all *prefixes* were cached. Otherwise it is computed in a single
+    query, and cached when the sample is frozen.
+    """
+    prefixes = set(prefixes)
+    if not prefixes:
+        return set([])
+    if sample.is_frozen:
+        cached = dict(SegmentAnsweredCache.objects.filter(
+            sample=sample, path__in=prefixes).values_list('path', 'answered'))
+        if all([prefix in cached for prefix in prefixes]):
+            return {prefix for prefix in prefixes if cached[prefix]}
+    with_answers = get_segments_with_answers(sample, list(prefixes))
+    if sample.is_frozen:
+        # Answers of a frozen sample do not change, so entries
+        # are never invalidated.
+        SegmentAnsweredCache.objects.bulk_create([SegmentAnsweredCache(
+            sample=sample, path=prefix, answered=(prefix in with_answers))
+            for prefix in prefixes], ignore_conflicts=True)
+    return with_answers
+
+
+def get_segments_answered_prefixes(sample, segments_candidates=None):
+    """
+    Returns the prefixes of segments in the campaign of *sample*
+    for which we want to know if they have answers, i.e. segments
+    with a pagebreak and the mandatory segment.
+    """
+    if segments_candidates is None:
+        segments_candidates = get_segments_candidates(sample.campaign)
+    campaign_prefix = "%s%s%s" % (
+        DB_PATH_SEP, sample.campaign.slug, DB_PATH_SEP)
+    return {seg['path'] for seg in segments_candidates
+        if seg.get('extra', {}).get('pagebreak', False)} | {campaign_prefix}
+
+
+def populate_segments_answered_cache(sample):
+    """
+    Computes the segments with answers of a frozen *sample* and stores
+    them in `SegmentAnsweredCache`.
+    """
+    prefixes = get_segments_answered_prefixes(sample)
+    SegmentAnsweredCache.objects.filter(sample=sample).delete()
+    return get_segments_answered(sample, prefixes)
+
+
 def get_segments_available(sample, visibility=None, owners=None,
-                           segments_candidates=None):
+                           segments_candidates=None, segments_answered=None):
     """
     All segments that have at least one answer
+
+    *segments_answered* is the set of segment prefixes with answers
+    in *sample* when it was already computed.
     """
     if not segments_candidates:
         segments_candidates = get_segments_candidates(
@@ -475,11 +923,15 @@ def get_segments_available(sample, visibility=None, owners=None,
         if seg.get('extra', {}).get('pagebreak', False)]
     campaign_slug = sample.campaign.slug
     campaign_prefix = "%s%s%s" % (DB_PATH_SEP, campaign_slug, DB_PATH_SEP)
+    if segments_answered is not None:
+        with_answers = segments_answered
+    else:
+        with_answers = get_segments_answered(sample,
+            {seg['path'] for seg in candidates})
     results = []
     for seg in candidates:
         prefix = seg['path']
-        is_active = get_question_model().objects.filter(
-            path__startswith=prefix, answer__sample=sample).exists()
+        is_active = prefix in with_answers
         if (not is_active and not sample.is_frozen and
             campaign_prefix == prefix + DB_PATH_SEP):
             # When the response is a work-in-progress, we always return
@@ -491,10 +943,7 @@ def get_segments_available(sample, visibility=None, owners=None,
     return results
 
 
-def get_segments_candidates(campaign, visibility=None, owners=None):
-    """
-    All segments that are candidates based on a campaign.
-    """
+def _build_segments_candidates(campaign, visibility=None, owners=None):
     candidates = set([])
     if campaign:
         questions_queryset = get_question_model().objects.filter(
@@ -523,37 +972,260 @@ def get_segments_candidates(campaign, visibility=None, owners=None):
     return []
 
 
+def rebuild_segments_index(campaign):
+    """
+    Recomputes the segments candidates of *campaign* and stores them
+    in the `CampaignSegment` index.
+
+    Returns the segments candidates.
+    """
+    segments_candidates = _build_segments_candidates(campaign)
+    elements = dict(PageElement.objects.filter(slug__in={
+        seg['slug'] for seg in segments_candidates}).values_list('slug', 'pk'))
+    segments = [CampaignSegment(
+        campaign=campaign, element_id=elements[seg['slug']],
+        path=seg['path'], rank=rank, indent=seg['indent'],
+        mandatory=seg.get('mandatory', False))
+        for rank, seg in enumerate(segments_candidates)]
+    if not segments:
+        # Such that we know the index was built.
+        segments = [CampaignSegment(campaign=campaign, path="")]
+    try:
+        with transaction.atomic():
+            CampaignSegment.objects.filter(campaign=campaign).delete()
+            CampaignSegment.objects.bulk_create(segments)
+    except IntegrityError:
+        # Another process rebuilt the index concurrently.
+        LOGGER.warning("segments index for campaign %s was rebuilt"\
+            " concurrently", campaign)
+    return segments_candidates
+
+
+def clear_segments_index(campaigns):
+    """
+    Removes the `CampaignSegment` index for *campaigns* (a list of
+    `Campaign` primary keys). The index is rebuilt once the current
+    transaction is committed.
+    """
+    nb_deleted, _ = CampaignSegment.objects.filter(
+        campaign_id__in=campaigns).delete()
+    if nb_deleted:
+        # Content is updated through many saves (ex: an import) in the same
+        # transaction. The index is gone after the first save, so we only
+        # schedule one rebuild.
+        transaction.on_commit(lambda: [rebuild_segments_index(campaign)
+            for campaign in Campaign.objects.filter(pk__in=campaigns)])
+
+
+def get_segments_candidates(campaign, visibility=None, owners=None):
+    """
+    All segments that are candidates based on a campaign.
+
+    Without *visibility* and *owners* filters, segments are read from
+    the `CampaignSegment` index when it was built
+    (see `rebuild_segments_index`).
+    """
+    if not campaign or visibility or owners:
+        return _build_segments_candidates(campaign,
+            visibility=visibility, owners=owners)
+
+    segments = list(CampaignSegment.objects.filter(
+        campaign=campaign).select_related('element').order_by('rank'))
+    if not segments:
+        # The index was not built yet.
+        return _build_segments_candidates(campaign)
+    segments_candidates = []
+    for segment in segments:
+        element = segment.element
+        if not element:
+            continue
+        candidate = _as_content_node(element.slug, element.title,
+            element.picture, element.extra,
+            # Only roots are loaded with their text in the content tree.
+            element.text if segment.indent == 0 else None)[0]
+        candidate.update({'path': segment.path, 'indent': segment.indent})
+        if segment.mandatory:
+            candidate.update({'mandatory': True})
+        segments_candidates += [candidate]
+    return segments_candidates
+
+
+def _get_indexed_campaigns(elements):
+    return list(CampaignSegment.objects.filter(
+        element_id__in=elements).values_list(
+        'campaign_id', flat=True).distinct())
+
+
+@receiver(pre_save, sender=PageElement,
+    dispatch_uid="segments_index_element_pre_save")
+def record_segments_index_element_changed(sender, instance, **kwargs):
+    """
+    Records the indexed campaigns affected by a change of slug, title
+    (roots are ordered by title) or extra (pagebreaks) of *instance*.
+    Changes to the text of *instance* do not require to rebuild the index.
+    """
+    #pylint:disable=unused-argument,protected-access
+    instance._segments_index_campaigns = []
+    update_fields = kwargs.get('update_fields')
+    if not instance.pk or (update_fields is not None and
+        not set(update_fields) & {'slug', 'title', 'extra'}):
+        return
+    campaigns = _get_indexed_campaigns([instance.pk])
+    if campaigns:
+        prev = PageElement.objects.filter(pk=instance.pk).values_list(
+            'slug', 'title', 'extra').first()
+        if prev != (instance.slug, instance.title, instance.extra):
+            instance._segments_index_campaigns = campaigns
+
+
+@receiver(post_save, sender=PageElement,
+    dispatch_uid="segments_index_element_saved")
+def clear_segments_index_on_element_saved(sender, instance, **kwargs):
+    #pylint:disable=unused-argument
+    campaigns = getattr(instance, '_segments_index_campaigns', None)
+    if campaigns:
+        clear_segments_index(campaigns)
+
+
+@receiver(pre_delete, sender=PageElement,
+    dispatch_uid="segments_index_element_deleted")
+def clear_segments_index_on_element_deleted(sender, instance, **kwargs):
+    #pylint:disable=unused-argument
+    clear_segments_index(_get_indexed_campaigns([instance.pk]))
+
+
+@receiver(post_save, sender=RelationShip,
+    dispatch_uid="segments_index_relationship_saved")
+@receiver(post_delete, sender=RelationShip,
+    dispatch_uid="segments_index_relationship_deleted")
+def clear_segments_index_on_relationship_changed(sender, instance, **kwargs):
+    #pylint:disable=unused-argument
+    clear_segments_index(_get_indexed_campaigns(
+        [instance.orig_element_id, instance.dest_element_id]))
+
+
+@receiver(post_save, sender=EnumeratedQuestions,
+    dispatch_uid="segments_index_questions_saved")
+@receiver(post_delete, sender=EnumeratedQuestions,
+    dispatch_uid="segments_index_questions_deleted")
+def clear_segments_index_on_questions_changed(sender, instance, **kwargs):
+    #pylint:disable=unused-argument
+    clear_segments_index([instance.campaign_id])
+
+
+def populate_summary_performance(improvement_sample, nb_answers=None):
+    """
+    Counts the planned improvements per category in *improvement_sample*
+    and stores them in a `SummaryPerformance` snapshot.
+    """
+    if nb_answers is None:
+        nb_answers = improvement_sample.answers.count()
+    # natural answers
+    improvements = Answer.objects.filter(
+        Q(unit_id=F('question__default_unit_id')) |
+    Q(unit_id=F('question__default_unit__source_equivalences__target_id')),
+        sample=improvement_sample
+    ).select_related('question__content')
+    energy_ghg_emissions = 0
+    water = 0
+    waste = 0
+    for answer in improvements:
+        extra = answer.question.content.extra
+        if not extra:
+            continue
+        if 'Energy & GHG Emissions' in extra:
+            energy_ghg_emissions += 1
+        if 'Water' in extra:
+            water += 1
+        if 'Waste' in extra:
+            waste += 1
+    defaults = {
+        'updated_at': improvement_sample.updated_at,
+        'nb_answers': nb_answers,
+        'energy_ghg_emissions': energy_ghg_emissions,
+        'water': water,
+        'waste': waste
+    }
+    try:
+        with transaction.atomic():
+            snapshot, _ = SummaryPerformance.objects.update_or_create(
+                sample=improvement_sample, defaults=defaults)
+    except IntegrityError:
+        # Another request created the snapshot concurrently.
+        snapshot = SummaryPerformance(sample=improvement_sample, **defaults)
+    return snapshot
+
+
 def get_summary_performance(improvement_sample):
     if (improvement_sample and
         improvement_sample.campaign.slug == 'sustainability'):
-        # natural answers
-        improvements = Answer.objects.filter(
-            Q(unit_id=F('question__default_unit_id')) |
-        Q(unit_id=F('question__default_unit__source_equivalences__target_id')),
-            sample=improvement_sample
-        ).select_related('question__content')
-        energy_ghg_emissions = 0
-        water = 0
-        waste = 0
-        for answer in improvements:
-            extra = answer.question.content.extra
-            if not extra:
-                continue
-            if 'Energy & GHG Emissions' in extra:
-                energy_ghg_emissions += 1
-            if 'Water' in extra:
-                water += 1
-            if 'Waste' in extra:
-                waste += 1
-        if energy_ghg_emissions or water or waste:
+        nb_answers = improvement_sample.answers.count()
+        snapshot = SummaryPerformance.objects.filter(
+            sample=improvement_sample).first()
+        if (not snapshot or
+            snapshot.updated_at != improvement_sample.updated_at or
+            snapshot.nb_answers != nb_answers):
+            snapshot = populate_summary_performance(
+                improvement_sample, nb_answers=nb_answers)
+        if snapshot.energy_ghg_emissions or snapshot.water or snapshot.waste:
             return {
-                'Energy & GHG Emissions': energy_ghg_emissions,
-                'Water': water,
-                'Waste': waste
+                'Energy & GHG Emissions': snapshot.energy_ghg_emissions,
+                'Water': snapshot.water,
+                'Waste': snapshot.waste
             }
     return {}
 
 
+def extract_document_urls(text):
+    """
+    Returns the URLs found in *text*, in order of appearance.
+    """
+    return re.findall(DOCUMENT_URL_RE, text) if text else []
+
+
+def index_supporting_documents(choices):
+    """
+    Indexes the URLs found in the text of *choices* into
+    `SupportingDocument`. Choices whose text did not change since they
+    were last indexed are skipped.
+
+    Returns the number of choices (re-)indexed.
+    """
+    indexed_hashes = {}
+    for choice_id, content_hash in SupportingDocument.objects.filter(
+            choice__in=choices).values_list('choice_id', 'content_hash'):
+        indexed_hashes[choice_id] = content_hash
+    nb_indexed = 0
+    reindexed = []
+    documents = []
+    for choice in choices:
+        text = choice.text if choice.text else ""
+        content_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        if indexed_hashes.get(choice.pk) == content_hash:
+            continue
+        nb_indexed += 1
+        if choice.pk in indexed_hashes:
+            reindexed += [choice.pk]
+        for url in OrderedDict.fromkeys(extract_document_urls(text)):
+            documents += [SupportingDocument(choice=choice, url=url,
+                content_hash=content_hash)]
+    with transaction.atomic():
+        if reindexed:
+            SupportingDocument.objects.filter(choice__in=reindexed).delete()
+        SupportingDocument.objects.bulk_create(documents)
+    return nb_indexed
+
+
+@receiver(post_save, sender=Choice,
+    dispatch_uid="supporting_documents_choice_saved")
+def index_supporting_documents_on_choice_saved(sender, instance,
+                                               created, **kwargs):
+    #pylint:disable=unused-argument
+    # Only freetext choices have URLs, we avoid querying the unit here.
+    if not created or (instance.text and 'http' in instance.text):
+        index_supporting_documents([instance])
+
+
 def get_supporting_documents(samples, internal_host=None, prefix=None):
     """
     Returns a pair of sets for supporting documents from a list of samples.
@@ -564,17 +1236,11 @@ def get_supporting_documents(samples, internal_host=None, prefix=None):
     kwargs = {}
     if prefix:
         kwargs.update({'question__path__startswith': prefix})
-    freetexts = Choice.objects.filter(pk__in=Answer.objects.filter(
+    documents = set(SupportingDocument.objects.filter(
+        choice__in=Answer.objects.filter(
         sample__in=samples,
         unit__system=Unit.SYSTEM_FREETEXT,
-        **kwargs).values('measured')).values_list('text', flat=True)
-    documents = set([])
-    for text in freetexts:
-        look = re.search(r'(https?://\S+)', text)
-        while look:
-            documents.add(look.group(1))
-            start_pos = look.end(1)
-            look = re.search(r'(https?://\S+)', text[start_pos:])
+        **kwargs).values('measured')).values_list('url', flat=True))
     publics = []
     privates = []
     for doc in documents:
@@ -3,14 +3,13 @@
 from __future__ import unicode_literals
 
 import datetime, json, logging
-from io import BytesIO
 
 from deployutils.apps.django_deployutils.templatetags.deployutils_prefixtags import (
     site_url)
 from deployutils.helpers import update_context_urls
 from django import forms
 from django.db import models, transaction
-from django.http import Http404, HttpResponse, HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect
 from django.views.generic.base import TemplateView
 from django.views.generic.edit import FormMixin
 from django.template.defaultfilters import slugify
@@ -20,13 +19,15 @@ from pptx.util import Inches, Pt
 
 from survey.api.base import QuestionListAPIView
 from survey.helpers import datetime_or_now, get_extra
-from survey.models import Campaign, Choice, EditableFilter, Sample
+from survey.models import Campaign, EditableFilter, Sample
 from survey.settings import DB_PATH_SEP, URL_PATH_SEP
 from survey.utils import get_account_model, get_question_model
 
 from ..api.samples import AssessmentContentMixin
 from ..compat import reverse, gettext_lazy as _
+from ..downloads.base import as_attachment_response, get_spooled_file
 from ..mixins import AccountMixin, SectionReportMixin
+from ..utils import get_unit_choices
 
 LOGGER = logging.getLogger(__name__)
 
@@ -63,8 +64,7 @@ class AssessPracticesView(SectionReportMixin, TemplateView):
         for unit_slug in ('verifiability', 'supporting-document',
                           'completeness'):
             context['units'].update({
-                unit_slug.replace('-', '_'): Choice.objects.filter(
-                    unit__slug=unit_slug).order_by('rank')})
+                unit_slug.replace('-', '_'): get_unit_choices(unit_slug)})
         if not self.sample.is_frozen:
             context.update({
                 'nb_required_answers': self.nb_required_answers,
@@ -588,15 +588,10 @@ class AssessPracticesPPTXView(AssessmentContentMixin, QuestionListAPIView):
                 self.title_hierarchy[1] = title
                 for higher_level in range(2, 6):
                     self.title_hierarchy[higher_level] = None
-        ppt_io = BytesIO()
-        self.prs.save(ppt_io)
-        ppt_io.seek(0)
-        filename = self.get_filename()
-        response = HttpResponse(
-            ppt_io,
-            content_type=self.content_type)
-        response['Content-Disposition'] = f'attachment; filename={filename}'
-        return response
+        content = get_spooled_file()
+        self.prs.save(content)
+        return as_attachment_response(content, self.get_filename(),
+            self.content_type)
 
     def get_filename(self):
         return datetime_or_now().strftime("%s-%s-%%Y%%m%%d.pptx" % (
@@ -3,10 +3,10 @@
 from __future__ import unicode_literals
 
 from extended_templates.backends.pdf import PdfTemplateResponse
-from pages.models import PageElement
 from survey.api.base import QuestionListAPIView
 
 from ..api.samples import AssessmentContentMixin
+from ..utils import get_content_texts
 
 class ImproveContentBaseView(QuestionListAPIView):
 
@@ -39,12 +39,13 @@ class ImproveContentPDFView(AssessmentContentMixin, ImproveContentBaseView):
                             answer.get('measured') in ['Yes', 'Mostly Yes']):
                             found = True
             if found:
-                element_text_qs = PageElement.objects.filter(
-                    slug=item['slug']).values_list('text', flat=True)
-                element_text = element_text_qs[0] if element_text_qs else ""
-                item.update({'text': element_text})
                 self.object_list += [item]
                 self.table_of_content += [item]
+        # Loads the text of all selected practices in a single query.
+        texts = get_content_texts([item['slug'] for item in self.object_list])
+        for item in self.object_list:
+            text = texts.get(item['slug'])
+            item.update({'text': text if text else ""})
         context = self.get_context_data(**kwargs)
         context.update({
             'table_of_content': self.table_of_content,
@@ -1,13 +1,13 @@
 # Copyright (c) 2026, DjaoDjin inc.
 # see LICENSE.
 
-import io, json, logging, re
+import json, logging, re
 
 from deployutils.apps.django_deployutils.templatetags.deployutils_prefixtags import (
     site_url)
 from deployutils.helpers import update_context_urls
 from django.db.models import Q
-from django.http import HttpResponse, Http404
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.views.generic.base import (ContextMixin, RedirectView,
     TemplateResponseMixin, TemplateView)
@@ -22,6 +22,7 @@ from survey.views.matrix import MatrixDetailView
 from ..api.portfolios import CompletedAssessmentsMixin
 from ..api.rollups import GraphMixin
 from ..compat import reverse
+from ..downloads.base import as_attachment_response, get_spooled_file
 from ..helpers import as_valid_sheet_title
 from ..mixins import (AccountsAggregatedQuerysetMixin,
     DashboardsAvailableQuerysetMixin)
@@ -273,14 +274,11 @@ class CompletedAssessmentsRawXLSXView(CompletedAssessmentsMixin, TemplateView):
                 priority, verified_status[1], verified_by_full_name])
 
         # Prepares the result file
-        content = io.BytesIO()
+        content = get_spooled_file()
         wbook.save(content)
-        content.seek(0)
 
-        resp = HttpResponse(content, content_type=self.content_type)
-        resp['Content-Disposition'] = 'attachment; filename="{}"'.format(
-            self.get_filename())
-        return resp
+        return as_attachment_response(content, self.get_filename(),
+            self.content_type)
 
     def get_filename(self):
         return "%s-%s.xlsx" % (self.basename,
@@ -8,19 +8,18 @@ from deployutils.apps.django_deployutils.templatetags.deployutils_prefixtags \
 from deployutils.helpers import update_context_urls
 from django import forms
 from django.db import transaction
-from django.db.models import Q
 from django.http import Http404, HttpResponseRedirect
 from django.views.generic.base import (RedirectView, TemplateResponseMixin,
     TemplateView)
 from django.views.generic.edit import FormMixin
-from survey.models import Answer, Campaign, Choice, Sample
+from survey.models import Campaign, Sample
 from survey.utils import get_account_model
 
 from ..compat import reverse
 from ..mixins import AccountMixin, ReportMixin
 from ..scores import get_score_calculator
 from ..utils import (get_highlights, get_summary_performance,
-    get_latest_active_assessments)
+    get_latest_active_assessments, get_unit_choices)
 
 LOGGER = logging.getLogger(__name__)
 
@@ -121,17 +120,9 @@ class ScorecardIndexView(ReportMixin, TemplateView):
     def is_mandatory_segment_present(self):
         #pylint:disable=attribute-defined-outside-init
         if not hasattr(self, '_is_mandatory_segment_present'):
-            filter_args = None
-            for seg_path in self.campaign_mandatory_segments:
-                if filter_args:
-                    filter_args |= Q(question__path__startswith=seg_path)
-                else:
-                    filter_args = Q(question__path__startswith=seg_path)
-            self._is_mandatory_segment_present = False
-            if filter_args:
-                queryset = Answer.objects.filter(
-                    filter_args, sample=self.sample)
-                self._is_mandatory_segment_present = queryset.exists()
+            self._is_mandatory_segment_present = any([
+                seg_path in self.segments_answered
+                for seg_path in self.campaign_mandatory_segments])
         return self._is_mandatory_segment_present
 
     def get_template_names(self):
@@ -161,8 +152,7 @@ class ScorecardIndexView(ReportMixin, TemplateView):
         for unit_slug in ('verifiability', 'supporting-document',
                           'completeness'):
             context['units'].update({
-                unit_slug.replace('-', '_'): Choice.objects.filter(
-                    unit__slug=unit_slug).order_by('rank')})
+                unit_slug.replace('-', '_'): get_unit_choices(unit_slug)})
 
         if not self.segments_available:
             update_context_urls(context, {